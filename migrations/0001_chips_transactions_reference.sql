@@ -0,0 +1,4 @@
+-- مفتاح عدم التكرار لتسوية الرقائق: فهرس فريد على reference
+-- يسرّع فحص المفاتيح في كل دفعة ويمنع صرف نفس المعاملة مرتين على مستوى قاعدة البيانات
+-- (الصفوف التي لا مرجع لها مسموحة لأن NULL لا يتكرر في الفهارس الفريدة)
+CREATE UNIQUE INDEX IF NOT EXISTS idx_user_chips_transactions_reference ON user_chips_transactions(reference);
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+صاروخ مصر - إعادة التشغيل دون انقطاع
+=================================
+هذا الملف يوفر أدوات إعادة التشغيل المتدرج للخادم:
+
+- مقبس استماع مع SO_REUSEPORT حتى تتشارك العملية القديمة والجديدة نفس المنفذ
+- وحدة تصريف (drain) توقف قبول الاتصالات الجديدة، وتطلب من العملاء إعادة الاتصال
+  بعد تأخير عشوائي، وتحفظ اللقطات المعلقة قبل خروج العملية القديمة
+- طلب التصريف من العملية القديمة عبر HTTP لتسليم الحالة للعملية الجديدة
+"""
+
+import os
+import json
+import time
+import random
+import signal
+import socket
+import asyncio
+import logging
+import urllib.request
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Any
+
+logger = logging.getLogger("graceful_restart")
+
+# رمز إغلاق WebSocket الخاص بإعادة تشغيل الخدمة
+SERVICE_RESTART_CLOSE_CODE = 1012
+
+
+def create_reuseport_socket(
+    host: str, port: int, backlog: int = 2048, reuse_port: bool = True, listen: bool = True
+) -> socket.socket:
+    """إنشاء مقبس استماع يسمح لعدة عمليات بمشاركة المنفذ
+
+    مع listen=False يُربط المقبس فقط: لا يوزع عليه النظام اتصالات حتى يُستدعى listen()،
+    فتصل طلبات التصريف للعملية القديمة وحدها.
+    """
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if reuse_port and hasattr(socket, "SO_REUSEPORT"):
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    elif reuse_port:
+        logger.warning("نظام التشغيل لا يدعم SO_REUSEPORT، سيتم الربط بالمنفذ بشكل عادي")
+    sock.bind((host, port))
+    if listen:
+        sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+def bind_with_retry(
+    host: str, port: int, backlog: int = 2048, timeout: float = 15.0, reuse_port: bool = True
+) -> socket.socket:
+    """محاولة الربط بالمنفذ حتى تحرره العملية القديمة إن لم تكن تستخدم SO_REUSEPORT"""
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            return create_reuseport_socket(host, port, backlog, reuse_port)
+        except OSError as e:
+            if time.monotonic() >= deadline:
+                raise
+            logger.info(f"المنفذ {port} ما زال محجوزاً ({str(e)})، إعادة المحاولة...")
+            time.sleep(0.2)
+
+
+def request_drain(port: int, host: str = "127.0.0.1", timeout: float = 15.0) -> Optional[Dict[str, Any]]:
+    """طلب تصريف العملية القديمة قبل تشغيل العملية الجديدة"""
+    request = urllib.request.Request(f"http://{host}:{port}/admin/drain", data=b"{}", method="POST")
+    request.add_header("Content-Type", "application/json")
+    if os.environ.get("DRAIN_TOKEN"):
+        request.add_header("X-Drain-Token", os.environ["DRAIN_TOKEN"])
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            result = json.loads(response.read().decode("utf-8"))
+            logger.info(f"تم تصريف العملية القديمة على المنفذ {port}: {result}")
+            return result
+    except Exception as e:
+        logger.warning(f"تعذر تصريف العملية القديمة على المنفذ {port}: {str(e)}")
+        return None
+
+
+class DrainController:
+    """التحكم في تصريف الخادم قبل إيقافه"""
+
+    def __init__(
+        self,
+        reconnect_min_ms: int = 500,
+        reconnect_max_ms: int = 5000,
+        exit_delay: float = 2.0,
+        exit_after_drain: bool = True,
+    ):
+        self.reconnect_min_ms = reconnect_min_ms
+        self.reconnect_max_ms = reconnect_max_ms
+        self.exit_delay = exit_delay
+        self.exit_after_drain = exit_after_drain
+
+        self.draining = False
+        self._result: Optional[Dict[str, Any]] = None
+        self._lock = asyncio.Lock()
+        self._flush_hooks: List[Callable[[], Awaitable[None]]] = []
+
+    @classmethod
+    def from_env(cls) -> "DrainController":
+        """إنشاء وحدة التصريف من متغيرات البيئة"""
+        return cls(
+            reconnect_min_ms=int(os.environ.get("DRAIN_RECONNECT_MIN_MS", 500)),
+            reconnect_max_ms=int(os.environ.get("DRAIN_RECONNECT_MAX_MS", 5000)),
+            exit_delay=float(os.environ.get("DRAIN_EXIT_DELAY", 2.0)),
+            exit_after_drain=os.environ.get("DRAIN_EXIT", "1").lower() in ("true", "1", "t"),
+        )
+
+    def add_flush_hook(self, hook: Callable[[], Awaitable[None]]):
+        """تسجيل دالة تُستدعى لحفظ البيانات المعلقة أثناء التصريف"""
+        self._flush_hooks.append(hook)
+
+    async def _notify_and_close(self, connection: Any):
+        """إبلاغ العميل بإعادة الاتصال بعد تأخير عشوائي ثم إغلاق الاتصال"""
+        delay_ms = random.randint(self.reconnect_min_ms, self.reconnect_max_ms)
+        try:
+            await connection.send_json({
+                "type": "server_restart",
+                "message": "يتم تحديث الخادم، سيتم إعادة الاتصال تلقائياً",
+                "reconnect_after_ms": delay_ms,
+                "timestamp": time.time()
+            })
+            await connection.close(code=SERVICE_RESTART_CLOSE_CODE)
+        except Exception:
+            pass
+
+    async def drain(self, connections: Iterable[Any]) -> Dict[str, Any]:
+        """إيقاف قبول الاتصالات، إبلاغ العملاء، وحفظ البيانات المعلقة"""
+        async with self._lock:
+            if self._result is not None:
+                return self._result
+
+            started = time.perf_counter()
+            self.draining = True
+            logger.info("بدء تصريف الخادم قبل إعادة التشغيل")
+
+            connections = list(connections)
+            await asyncio.gather(*(self._notify_and_close(conn) for conn in connections))
+
+            for hook in self._flush_hooks:
+                try:
+                    await hook()
+                except Exception as e:
+                    logger.error(f"خطأ أثناء حفظ البيانات المعلقة عند التصريف: {str(e)}")
+
+            self._result = {
+                "drained": True,
+                "connections": len(connections),
+                "elapsed_ms": round((time.perf_counter() - started) * 1000, 2),
+                "pid": os.getpid(),
+            }
+            logger.info(f"اكتمل تصريف الخادم: {self._result}")
+
+            if self.exit_after_drain:
+                # إيقاف العملية بالطريقة المعتادة لـ uvicorn بعد مهلة قصيرة
+                asyncio.get_running_loop().call_later(self.exit_delay, os.kill, os.getpid(), signal.SIGTERM)
+
+            return self._result
@@ -0,0 +1,410 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+صاروخ مصر - سجل أحداث الطاولات
+============================
+هذا الملف يحفظ أحداث طاولات البوكر (الانضمام، الإجراءات، المغادرة، الدردشة) في سجل
+ثنائي مضغوط قابل للإلحاق فقط، مع ملفات مقاطع (segments) لكل طاولة وفهرس متناثر
+حسب (رقم اليد، الوقت)، وقارئ لإعادة تشغيل تاريخ الطاولة بسرعة للتدقيق وحل النزاعات
+وتدريب البوتات.
+
+صيغة السجل: رأس ثابت <IHqd (طول البيانات، رمز الحدث، رقم اليد، الطابع الزمني)
+يليه نص JSON مضغوط. صيغة مدخل الفهرس: <qdQ (رقم اليد، الطابع الزمني، موضع السجل).
+"""
+
+import os
+import sys
+import json
+import time
+import struct
+import asyncio
+import logging
+from bisect import bisect_left
+from typing import Dict, List, Optional, Any, Iterator, Tuple
+
+logger = logging.getLogger("hand_history")
+
+# المسار الافتراضي لمجلد السجلات
+DEFAULT_HISTORY_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "hand_history"
+)
+
+RECORD_HEADER = struct.Struct("<IHqd")
+INDEX_ENTRY = struct.Struct("<qdQ")
+
+SEGMENT_SUFFIX = ".seg"
+INDEX_SUFFIX = ".idx"
+
+# رموز أنواع الأحداث (0 لأي نوع آخر ويُحفظ الاسم داخل البيانات)
+EVENT_CODES: Dict[str, int] = {
+    "player_joined": 1,
+    "player_left": 2,
+    "action_result": 3,
+    "chat_message": 4,
+    "game_state": 5,
+    "hand_started": 6,
+}
+EVENT_NAMES: Dict[int, str] = {code: name for name, code in EVENT_CODES.items()}
+
+# الحقول المكررة التي لا داعي لتخزينها في كل سجل
+_REDUNDANT_FIELDS = ("type", "tableId", "timestamp")
+
+
+def table_key(table_id: Any) -> str:
+    """تحويل معرف الطاولة إلى اسم مجلد آمن دون تصادم (ترميز سداسي لمعرف JSON)
+
+    الترميز يحفظ نوع المعرف أيضاً، فالطاولة 1 والطاولة "1" في مجلدين مختلفين.
+    """
+    return json.dumps(table_id, ensure_ascii=False).encode("utf-8").hex()
+
+
+def table_id_from_key(key: str) -> Any:
+    """معرف الطاولة من اسم مجلدها (ValueError إذا لم يكن الاسم بهذا الترميز)"""
+    return json.loads(bytes.fromhex(key).decode("utf-8"))
+
+
+def encode_event(event_type: str, hand_number: int, timestamp: float, message: Dict[str, Any]) -> bytes:
+    """ترميز حدث واحد إلى سجل ثنائي"""
+    code = EVENT_CODES.get(event_type, 0)
+    data = {key: value for key, value in message.items() if key not in _REDUNDANT_FIELDS}
+    if code == 0:
+        data["type"] = event_type
+    payload = json.dumps(data, ensure_ascii=False, separators=(",", ":"), default=str).encode("utf-8")
+    return RECORD_HEADER.pack(len(payload), code, hand_number, timestamp) + payload
+
+
+class _TableWriterState:
+    """حالة الكتابة لطاولة واحدة (تُستخدم من خيط الكتابة فقط)"""
+
+    __slots__ = ("directory", "segment", "size", "since_index", "last_hand")
+
+    def __init__(self, directory: str, segment: int, size: int):
+        self.directory = directory
+        self.segment = segment
+        self.size = size
+        self.since_index: Optional[int] = None
+        self.last_hand: Optional[int] = None
+
+
+class HandHistoryLog:
+    """كاتب سجل الأحداث على دفعات خارج حلقة الأحداث"""
+
+    def __init__(
+        self,
+        base_dir: str = DEFAULT_HISTORY_DIR,
+        flush_interval: float = 0.25,
+        segment_max_bytes: int = 8 * 1024 * 1024,
+        index_every: int = 64,
+    ):
+        self.base_dir = base_dir
+        self.flush_interval = flush_interval
+        self.segment_max_bytes = segment_max_bytes
+        self.index_every = index_every
+
+        self._pending: List[Tuple[Any, str, int, float, Dict[str, Any]]] = []
+        self._writers: Dict[str, _TableWriterState] = {}
+        self._flush_lock = asyncio.Lock()
+
+    @classmethod
+    def from_env(cls) -> "HandHistoryLog":
+        """إنشاء الكاتب من متغيرات البيئة"""
+        return cls(
+            base_dir=os.environ.get("HAND_HISTORY_DIR", DEFAULT_HISTORY_DIR),
+            flush_interval=float(os.environ.get("HAND_HISTORY_INTERVAL", 0.25)),
+            segment_max_bytes=int(os.environ.get("HAND_HISTORY_SEGMENT_BYTES", 8 * 1024 * 1024)),
+        )
+
+    def record(self, table_id: Any, message: Dict[str, Any], hand_number: int = 0):
+        """إضافة حدث إلى قائمة الانتظار (لا يلمس القرص)
+
+        تُحفظ نسخة من الرسالة لأن المستدعي قد يضيف إليها حقولاً بعد التسجيل (مثل seq).
+        """
+        self._pending.append((table_id, message.get("type", "unknown"), hand_number, time.time(), dict(message)))
+
+    # الكتابة في خيط منفصل
+    def _writer_for(self, table_id: Any) -> _TableWriterState:
+        key = table_key(table_id)
+        state = self._writers.get(key)
+        if state is None:
+            directory = os.path.join(self.base_dir, key)
+            os.makedirs(directory, exist_ok=True)
+            segments = list_segments(directory)
+            if segments:
+                segment = segments[-1]
+                size = repair_segment(directory, segment)
+            else:
+                segment, size = 0, 0
+            state = _TableWriterState(directory, segment, size)
+            self._writers[key] = state
+        return state
+
+    def _write_batch(self, batch: List[Tuple[Any, str, int, float, Dict[str, Any]]]):
+        """كتابة دفعة من الأحداث مجمعة حسب الطاولة"""
+        by_table: Dict[Any, List[Tuple[str, int, float, Dict[str, Any]]]] = {}
+        for table_id, event_type, hand_number, timestamp, message in batch:
+            by_table.setdefault(table_id, []).append((event_type, hand_number, timestamp, message))
+
+        for table_id, events in by_table.items():
+            state = self._writer_for(table_id)
+            records = bytearray()
+            index = bytearray()
+
+            for event_type, hand_number, timestamp, message in events:
+                if state.size + len(records) >= self.segment_max_bytes:
+                    self._append_files(state, records, index)
+                    records, index = bytearray(), bytearray()
+                    state.segment += 1
+                    state.size = 0
+                    state.since_index = None
+
+                # مدخل فهرس عند بداية كل يد وكل عدد ثابت من السجلات
+                if (
+                    state.since_index is None
+                    or state.last_hand != hand_number
+                    or state.since_index >= self.index_every
+                ):
+                    index += INDEX_ENTRY.pack(hand_number, timestamp, state.size + len(records))
+                    state.since_index = 0
+
+                records += encode_event(event_type, hand_number, timestamp, message)
+                state.since_index += 1
+                state.last_hand = hand_number
+
+            self._append_files(state, records, index)
+
+    def _append_files(self, state: _TableWriterState, records: bytearray, index: bytearray):
+        if not records:
+            return
+        with open(segment_path(state.directory, state.segment), "ab") as segment_file:
+            segment_file.write(records)
+        with open(index_path(state.directory, state.segment), "ab") as index_file:
+            index_file.write(index)
+        state.size += len(records)
+
+    async def flush(self):
+        """كتابة الأحداث المعلقة دون حجب حلقة الأحداث"""
+        if not self._pending:
+            return
+        async with self._flush_lock:
+            batch, self._pending = self._pending, []
+            write = asyncio.ensure_future(asyncio.to_thread(self._write_batch, batch))
+            try:
+                await asyncio.shield(write)
+            except asyncio.CancelledError:
+                # الخيط يكمل الكتابة رغم إلغاء المهمة، فلا يُحرر القفل قبل انتهائها
+                await asyncio.wait([write])
+                raise
+
+    def flush_now(self):
+        """كتابة متزامنة للأحداث المعلقة (عند الإغلاق)"""
+        batch, self._pending = self._pending, []
+        if batch:
+            self._write_batch(batch)
+
+    async def flush_final(self):
+        """انتظار انتهاء أي دفعة جارية في خيط الكتابة ثم الكتابة النهائية المتزامنة"""
+        async with self._flush_lock:
+            self.flush_now()
+
+    async def run(self):
+        """حلقة الكتابة الدورية في الخلفية"""
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"خطأ أثناء كتابة سجل أحداث الطاولات: {str(e)}")
+
+
+# وظائف مساعدة للملفات
+def segment_path(directory: str, segment: int) -> str:
+    return os.path.join(directory, f"{segment:08d}{SEGMENT_SUFFIX}")
+
+
+def index_path(directory: str, segment: int) -> str:
+    return os.path.join(directory, f"{segment:08d}{INDEX_SUFFIX}")
+
+
+def list_segments(directory: str) -> List[int]:
+    """قائمة أرقام المقاطع الموجودة في مجلد الطاولة مرتبة"""
+    if not os.path.isdir(directory):
+        return []
+    return sorted(
+        int(name[: -len(SEGMENT_SUFFIX)])
+        for name in os.listdir(directory)
+        if name.endswith(SEGMENT_SUFFIX) and name[: -len(SEGMENT_SUFFIX)].isdigit()
+    )
+
+
+def read_index(directory: str, segment: int) -> List[Tuple[int, float, int]]:
+    """قراءة الفهرس المتناثر لمقطع واحد"""
+    path = index_path(directory, segment)
+    if not os.path.exists(path):
+        return []
+    with open(path, "rb") as index_file:
+        data = index_file.read()
+    usable = len(data) - len(data) % INDEX_ENTRY.size
+    return list(INDEX_ENTRY.iter_unpack(data[:usable]))
+
+
+def repair_segment(directory: str, segment: int) -> int:
+    """قص سجل غير مكتمل في نهاية المقطع (انقطاع أثناء الكتابة) وإرجاع الحجم الصالح
+
+    بدون القص تُلحق السجلات الجديدة بعد السجل الناقص فيفسد ما بعده عند القراءة.
+    يبدأ الفحص من آخر مدخل فهرس حتى لا يُقرأ المقطع كاملاً.
+    """
+    path = segment_path(directory, segment)
+    size = os.path.getsize(path)
+    index = [entry for entry in read_index(directory, segment) if entry[2] < size]
+
+    valid = index[-1][2] if index else 0
+    with open(path, "rb") as segment_file:
+        segment_file.seek(valid)
+        while True:
+            header = segment_file.read(RECORD_HEADER.size)
+            if len(header) < RECORD_HEADER.size:
+                break
+            length = RECORD_HEADER.unpack(header)[0]
+            if valid + RECORD_HEADER.size + length > size:
+                break
+            segment_file.seek(length, os.SEEK_CUR)
+            valid += RECORD_HEADER.size + length
+
+    if valid < size:
+        logger.warning(f"تم قص {size - valid} بايت غير مكتملة من نهاية {path}")
+        with open(path, "r+b") as segment_file:
+            segment_file.truncate(valid)
+
+    # حذف مدخلات الفهرس التي تشير إلى الجزء المقصوص (والمدخل الناقص إن وجد)
+    kept = sum(1 for entry in index if entry[2] < valid) * INDEX_ENTRY.size
+    path = index_path(directory, segment)
+    if os.path.exists(path) and os.path.getsize(path) != kept:
+        with open(path, "r+b") as index_file:
+            index_file.truncate(kept)
+    return valid
+
+
+class HandHistoryReader:
+    """قارئ لإعادة تشغيل تاريخ طاولة باستخدام الفهرس المتناثر"""
+
+    def __init__(self, base_dir: str = DEFAULT_HISTORY_DIR):
+        self.base_dir = base_dir
+
+    def tables(self) -> List[Any]:
+        """قائمة معرفات الطاولات التي لها سجلات"""
+        if not os.path.isdir(self.base_dir):
+            return []
+        tables = []
+        for name in sorted(os.listdir(self.base_dir)):
+            try:
+                tables.append(table_id_from_key(name))
+            except ValueError:
+                continue
+        return tables
+
+    def replay(
+        self,
+        table_id: Any,
+        from_hand: Optional[int] = None,
+        to_hand: Optional[int] = None,
+        since: Optional[float] = None,
+        until: Optional[float] = None,
+    ) -> Iterator[Dict[str, Any]]:
+        """إعادة أحداث الطاولة بالترتيب ضمن نطاق الأيدي والوقت المطلوب"""
+        directory = os.path.join(self.base_dir, table_key(table_id))
+        segments = list_segments(directory)
+
+        for position, segment in enumerate(segments):
+            index = read_index(directory, segment)
+
+            # تخطي المقاطع التي تنتهي قبل بداية النطاق
+            if position + 1 < len(segments):
+                next_index = read_index(directory, segments[position + 1])
+                if next_index:
+                    next_hand, next_time, _ = next_index[0]
+                    if from_hand is not None and next_hand < from_hand:
+                        continue
+                    if since is not None and next_time < since:
+                        continue
+
+            # إيقاف القراءة عند تجاوز نهاية النطاق
+            if index:
+                first_hand, first_time, _ = index[0]
+                if to_hand is not None and first_hand > to_hand:
+                    return
+                if until is not None and first_time > until:
+                    return
+
+            offset = self._start_offset(index, from_hand, since)
+            for event in self._read_segment(segment_path(directory, segment), offset):
+                if to_hand is not None and event["hand"] > to_hand:
+                    return
+                if until is not None and event["timestamp"] > until:
+                    return
+                if from_hand is not None and event["hand"] < from_hand:
+                    continue
+                if since is not None and event["timestamp"] < since:
+                    continue
+                yield event
+
+    @staticmethod
+    def _start_offset(index: List[Tuple[int, float, int]], from_hand: Optional[int], since: Optional[float]) -> int:
+        """أقرب موضع في الفهرس يسبق بداية النطاق"""
+        offset = 0
+        if from_hand is not None and index:
+            position = bisect_left([entry[0] for entry in index], from_hand)
+            if position > 0:
+                offset = max(offset, index[position - 1][2])
+        if since is not None and index:
+            position = bisect_left([entry[1] for entry in index], since)
+            if position > 0:
+                offset = max(offset, index[position - 1][2])
+        return offset
+
+    @staticmethod
+    def _read_segment(path: str, offset: int) -> Iterator[Dict[str, Any]]:
+        with open(path, "rb") as segment_file:
+            segment_file.seek(offset)
+            while True:
+                header = segment_file.read(RECORD_HEADER.size)
+                if len(header) < RECORD_HEADER.size:
+                    return
+                length, code, hand_number, timestamp = RECORD_HEADER.unpack(header)
+                payload = segment_file.read(length)
+                if len(payload) < length:
+                    # سجل غير مكتمل في نهاية المقطع (انقطاع أثناء الكتابة)
+                    return
+                try:
+                    data = json.loads(payload)
+                except ValueError:
+                    # بيانات تالفة: لا يمكن الوثوق بحدود السجلات بعدها
+                    logger.warning(f"سجل تالف في {path} عند الموضع {segment_file.tell() - length}")
+                    return
+                event_type = EVENT_NAMES.get(code) or data.pop("type", "unknown")
+                yield {
+                    "type": event_type,
+                    "hand": hand_number,
+                    "timestamp": timestamp,
+                    "data": data,
+                }
+
+
+def main(argv: List[str]) -> int:
+    """طباعة تاريخ طاولة بصيغة JSON سطرية: hand_history.py TABLE_ID [FROM_HAND [TO_HAND]]"""
+    if not argv:
+        print("الاستخدام: python -m python.hand_history TABLE_ID [FROM_HAND [TO_HAND]]")
+        return 1
+
+    reader = HandHistoryReader(os.environ.get("HAND_HISTORY_DIR", DEFAULT_HISTORY_DIR))
+    # المعرفات الرقمية تُحفظ كأرقام (كما تصل من WebSocket)
+    table_id = int(argv[0]) if argv[0].lstrip("-").isdigit() else argv[0]
+    from_hand = int(argv[1]) if len(argv) > 1 else None
+    to_hand = int(argv[2]) if len(argv) > 2 else None
+    for event in reader.replay(table_id, from_hand=from_hand, to_hand=to_hand):
+        print(json.dumps(event, ensure_ascii=False))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
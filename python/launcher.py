@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+صاروخ مصر - نقطة التشغيل الموحدة
+==============================
+هذا الملف هو نقطة التشغيل الوحيدة لخادم التحديثات الفورية، وتستدعيه جميع سكريبتات التشغيل.
+
+- اختيار حلقة الأحداث (uvloop/asyncio) وبروتوكول HTTP (httptools/h11) ومكتبة WebSocket
+  (websockets/wsproto) مع الرجوع تلقائياً للبديل المتاح
+- حجم طابور الاتصالات (backlog)؛ التوسع لعدة عمليات يكون بعملية لكل منفذ عبر SHARD_WORKERS
+- استيراد المكتبات الثقيلة عند الحاجة فقط لتسريع بدء التشغيل
+- طباعة تفصيل زمني لمراحل بدء التشغيل
+"""
+
+import os
+import sys
+import time
+import socket
+import signal
+import logging
+import argparse
+import importlib.util
+from typing import Dict, List, Optional, Tuple
+
+# إضافة المسار الرئيسي للمشروع حتى يعمل الاستيراد من أي مجلد
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger("launcher")
+
+APP_IMPORT_STRING = "python.realtime_server:app"
+
+# البدائل بترتيب الأفضلية لكل خيار: (قيمة uvicorn، الوحدة المطلوبة)
+IMPLEMENTATIONS: Dict[str, List[Tuple[str, Optional[str]]]] = {
+    "loop": [("uvloop", "uvloop"), ("asyncio", None)],
+    "http": [("httptools", "httptools"), ("h11", "h11")],
+    "ws": [("websockets", "websockets"), ("wsproto", "wsproto")],
+}
+
+
+class StartupTimer:
+    """قياس زمن كل مرحلة من مراحل بدء التشغيل"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self._last = self.started
+        self.stages: List[Tuple[str, float]] = []
+
+    def mark(self, stage: str):
+        now = time.perf_counter()
+        self.stages.append((stage, (now - self._last) * 1000))
+        self._last = now
+
+    def report(self) -> str:
+        lines = ["تفصيل زمن بدء التشغيل:"]
+        for stage, elapsed_ms in self.stages:
+            lines.append(f"  {stage:<24} {elapsed_ms:8.1f} ms")
+        total_ms = (time.perf_counter() - self.started) * 1000
+        lines.append(f"  {'المجموع':<24} {total_ms:8.1f} ms")
+        return "\n".join(lines)
+
+
+def module_available(module_name: Optional[str]) -> bool:
+    """التحقق من توفر وحدة دون استيرادها"""
+    if module_name is None:
+        return True
+    return importlib.util.find_spec(module_name) is not None
+
+
+def resolve_implementation(option: str, requested: str) -> str:
+    """اختيار التنفيذ المطلوب أو أفضل بديل متاح"""
+    candidates = IMPLEMENTATIONS[option]
+    if requested != "auto":
+        for name, module_name in candidates:
+            if name == requested:
+                if module_available(module_name):
+                    return name
+                logger.warning(f"{requested} غير مثبت، سيتم استخدام بديل متاح لخيار {option}")
+                break
+
+    for name, module_name in candidates:
+        if module_available(module_name):
+            return name
+    return candidates[-1][0]
+
+
+def check_port_in_use(port: int) -> bool:
+    """التحقق مما إذا كان المنفذ قيد الاستخدام بالفعل"""
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        return s.connect_ex(('localhost', port)) == 0
+
+
+def find_pids_on_port(port: int) -> List[int]:
+    """إيجاد العمليات التي تستمع على المنفذ عبر /proc دون تشغيل lsof"""
+    inodes = set()
+    for table in ("/proc/net/tcp", "/proc/net/tcp6"):
+        try:
+            with open(table) as f:
+                next(f)
+                for line in f:
+                    fields = line.split()
+                    local_port = int(fields[1].rsplit(":", 1)[1], 16)
+                    # الحالة 0A تعني LISTEN
+                    if local_port == port and fields[3] == "0A":
+                        inodes.add(fields[9])
+        except (OSError, StopIteration):
+            continue
+
+    if not inodes:
+        return []
+
+    targets = {f"socket:[{inode}]" for inode in inodes}
+    pids = []
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit() or int(entry) == os.getpid():
+            continue
+        fd_dir = f"/proc/{entry}/fd"
+        try:
+            for fd in os.listdir(fd_dir):
+                if os.readlink(os.path.join(fd_dir, fd)) in targets:
+                    pids.append(int(entry))
+                    break
+        except OSError:
+            continue
+    return pids
+
+
+def kill_process_on_port(port: int) -> bool:
+    """قتل العملية التي تستخدم المنفذ المحدد"""
+    pids = find_pids_on_port(port)
+    for pid in pids:
+        try:
+            os.kill(pid, signal.SIGTERM)
+            logger.info(f"تم إيقاف العملية {pid} على المنفذ {port}")
+        except ProcessLookupError:
+            continue
+        except Exception as e:
+            logger.error(f"خطأ في إيقاف العملية {pid}: {str(e)}")
+    return bool(pids)
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="تشغيل خادم التحديثات الفورية")
+    parser.add_argument("--host", default=os.environ.get("REALTIME_HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.environ.get("REALTIME_PORT", 3001)))
+    parser.add_argument("--loop", choices=["auto", "uvloop", "asyncio"], default="auto",
+                        help="تنفيذ حلقة الأحداث")
+    parser.add_argument("--http", choices=["auto", "httptools", "h11"], default="auto",
+                        help="تنفيذ بروتوكول HTTP")
+    parser.add_argument("--ws", choices=["auto", "websockets", "wsproto"], default="auto",
+                        help="تنفيذ بروتوكول WebSocket")
+    parser.add_argument("--workers", type=int, default=int(os.environ.get("REALTIME_WORKERS", 1)),
+                        help="عدد عمليات الخادم (1 فقط؛ للتوسع شغّل عملية لكل منفذ مع SHARD_WORKERS و SHARD_SELF)")
+    parser.add_argument("--backlog", type=int, default=2048,
+                        help="الحد الأقصى لطابور الاتصالات المنتظرة")
+    parser.add_argument("--graceful", action="store_true",
+                        help="تصريف العملية القديمة وتسليم حالتها بدلاً من إيقافها بالقوة (عملية واحدة فقط)")
+    parser.add_argument("--log-level", default="info")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """تشغيل خادم التحديثات الفورية"""
+    timer = StartupTimer()
+    args = parse_args(argv)
+    timer.mark("قراءة الخيارات")
+
+    # عمليات uvicorn المتعددة تتشارك منفذاً واحداً فيوزع النظام اتصالات الطاولة الواحدة عليها،
+    # بينما يوجه ShardMap كل طاولة لعملية على منفذ خاص بها
+    if args.workers > 1:
+        logger.error("لا يمكن تشغيل عدة عمليات على منفذ واحد: حالة الطاولات في ذاكرة كل عملية. "
+                     "شغّل عملية لكل منفذ مع SHARD_WORKERS و SHARD_SELF لتوزيع الطاولات")
+        return 1
+
+    loop = resolve_implementation("loop", args.loop)
+    http = resolve_implementation("http", args.http)
+    ws = resolve_implementation("ws", args.ws)
+    timer.mark("اختيار التنفيذات")
+
+    try:
+        import uvicorn
+        from python.graceful_restart import request_drain, bind_with_retry, create_reuseport_socket
+    except ImportError as e:
+        logger.error(f"المكتبات المطلوبة غير متوفرة: {str(e)}")
+        logger.error("يرجى تثبيت: fastapi uvicorn websockets")
+        return 1
+    timer.mark("استيراد uvicorn")
+
+    # التحقق من المنفذ: تصريف العملية القديمة لاحقاً أو إيقافها الآن
+    drain_old = False
+    if check_port_in_use(args.port):
+        if args.graceful:
+            old_pids = find_pids_on_port(args.port)
+            if len(old_pids) > 1:
+                logger.error(f"المنفذ {args.port} تستخدمه عدة عمليات {old_pids}، "
+                             "التصريف المتدرج غير مدعوم. أوقف الخادم القديم أولاً أو شغّل بدون --graceful")
+                return 1
+            drain_old = True
+        else:
+            logger.warning(f"المنفذ {args.port} قيد الاستخدام بالفعل. محاولة إيقاف العملية...")
+            if not kill_process_on_port(args.port):
+                logger.error(f"تعذر إيقاف العملية على المنفذ {args.port}. يرجى إيقافها يدويًا.")
+                return 1
+    timer.mark("تجهيز المنفذ")
+
+    config = uvicorn.Config(
+        APP_IMPORT_STRING,
+        host=args.host,
+        port=args.port,
+        loop=loop,
+        http=http,
+        ws=ws,
+        backlog=args.backlog,
+        log_level=args.log_level,
+    )
+
+    print(f"بدء تشغيل خادم التحديثات الفورية على المنفذ {args.port} "
+          f"(loop={loop}, http={http}, ws={ws}, backlog={args.backlog})...")
+
+    class TimedServer(uvicorn.Server):
+        """خادم يطبع تفصيل زمن التشغيل بعد اكتمال مرحلة البدء"""
+
+        async def startup(self, sockets=None):
+            await super().startup(sockets=sockets)
+            timer.mark("بدء التطبيق (lifespan)")
+            print(timer.report())
+
+    # استيراد التطبيق قبل التصريف حتى لا يطول انقطاع العملاء بزمن الاستيراد
+    config.load()
+    timer.mark("استيراد التطبيق")
+
+    try:
+        sock = None
+        if drain_old:
+            # ربط المقبس الجديد بجانب القديم ثم التصريف ثم الاستماع: الاتصالات الجديدة تنتظر
+            # في طابور المقبس حتى تستعيد العملية الجديدة اللقطة التي حفظتها القديمة عند التصريف
+            try:
+                sock = create_reuseport_socket(args.host, args.port, args.backlog, reuse_port=True, listen=False)
+            except OSError:
+                logger.warning(f"العملية القديمة على المنفذ {args.port} لا تستخدم SO_REUSEPORT، "
+                               "سيُربط المنفذ بعد خروجها وقد ينقطع العملاء لفترة قصيرة")
+            logger.info(f"المنفذ {args.port} قيد الاستخدام، طلب تصريف العملية القديمة...")
+            request_drain(args.port)
+            timer.mark("تصريف العملية القديمة")
+
+        if sock is None:
+            sock = bind_with_retry(args.host, args.port, args.backlog, reuse_port=args.graceful)
+        else:
+            sock.listen(args.backlog)
+    except OSError as e:
+        logger.error(f"تعذر الربط بالمنفذ {args.port}: {str(e)}")
+        return 1
+    timer.mark("ربط المقبس")
+
+    server = TimedServer(config)
+    server.run(sockets=[sock])
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
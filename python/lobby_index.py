@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+صاروخ مصر - فهرس ردهة طاولات البوكر
+================================
+هذا الملف يحتفظ بملخص جاهز لكل طاولة (عدد المقاعد المشغولة، الرهان الأعمى، المرحلة)
+ويحدثه تزايدياً عند كل تغيير في الطاولة، فلا تحتاج شاشة الردهة إلى فحص poker_tables
+أو قواميس الاتصالات في كل طلب.
+
+- لكل تغيير رقم إصدار متزايد، والصفحات المسلسلة تُخزن حتى الإصدار التالي (مع ETag)
+- الإصدار المرسل للعميل يتضمن حقبة العملية ("EPOCH-VERSION") لأن العداد يبدأ من جديد بعد
+  إعادة التشغيل، فلا يطابق إصدار أو ETag من عملية سابقة إصداراً جديداً بالخطأ
+- سجل دائري بآخر التغييرات يسمح للعميل بطلب ما تغير فقط منذ إصدار معين
+  والانتظار (long-poll) حتى يحدث تغيير جديد
+"""
+
+import json
+import asyncio
+import secrets
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+# الحد الأقصى الافتراضي للاعبين في الطاولة
+DEFAULT_MAX_PLAYERS = 9
+
+
+def table_summary(table_id: Any, table: Dict[str, Any]) -> Dict[str, Any]:
+    """ملخص الطاولة المعروض في الردهة"""
+    game_state = table.get("game_state", {})
+    players = table.get("players", {})
+    max_players = game_state.get("max_players", DEFAULT_MAX_PLAYERS)
+    return {
+        "tableId": table_id,
+        "players": len(players),
+        "bots": sum(1 for info in players.values() if info.get("isBot")),
+        "maxPlayers": max_players,
+        "openSeats": max(max_players - len(players), 0),
+        "blindAmount": game_state.get("blind_amount"),
+        "minBet": game_state.get("min_bet"),
+        "phase": game_state.get("phase"),
+    }
+
+
+class LobbyIndex:
+    """فهرس ملخصات الطاولات مع سجل تغييرات للانتظار الطويل"""
+
+    def __init__(self, history_size: int = 1024):
+        self.version = 0
+        # حقبة العملية: تتغير مع كل تشغيل
+        self.epoch = secrets.token_hex(4)
+        self._summaries: Dict[Any, Dict[str, Any]] = {}
+        # سجل دائري: (الإصدار، معرف الطاولة، الملخص أو None عند الحذف)
+        self._changes: Deque[Tuple[int, Any, Optional[Dict[str, Any]]]] = deque(maxlen=history_size)
+        # الصفحات المسلسلة للإصدار الحالي {(offset, limit): body}
+        self._pages: Dict[Tuple[int, int], str] = {}
+        self._changed: Optional[asyncio.Event] = None
+
+    @property
+    def version_token(self) -> str:
+        """الإصدار الحالي كما يُرسل للعميل (مع حقبة العملية)"""
+        return f"{self.epoch}-{self.version}"
+
+    @property
+    def etag(self) -> str:
+        return f'W/"lobby-{self.version_token}"'
+
+    def parse_version(self, token: str) -> Optional[int]:
+        """رقم الإصدار من رمز العميل (None إذا كان من عملية أخرى أو غير صالح)"""
+        epoch, _, version = token.rpartition("-")
+        if epoch != self.epoch:
+            return None
+        try:
+            return int(version)
+        except ValueError:
+            return None
+
+    def _record(self, table_id: Any, summary: Optional[Dict[str, Any]]):
+        self.version += 1
+        self._changes.append((self.version, table_id, summary))
+        self._pages.clear()
+        # إيقاظ جميع المنتظرين ثم تجهيز حدث جديد للانتظار التالي
+        if self._changed is not None:
+            self._changed.set()
+            self._changed = None
+
+    def update(self, table_id: Any, table: Optional[Dict[str, Any]]):
+        """تحديث ملخص طاولة واحدة (أو حذفه إذا لم تعد الطاولة موجودة)"""
+        if table is None:
+            self.remove(table_id)
+            return
+        summary = table_summary(table_id, table)
+        if self._summaries.get(table_id) == summary:
+            return
+        self._summaries[table_id] = summary
+        self._record(table_id, summary)
+
+    def remove(self, table_id: Any):
+        if self._summaries.pop(table_id, None) is not None:
+            self._record(table_id, None)
+
+    def rebuild(self, tables: Dict[Any, Dict[str, Any]]):
+        """بناء الفهرس كاملاً (عند بدء التشغيل بعد استعادة اللقطة)"""
+        for table_id, table in tables.items():
+            self.update(table_id, table)
+
+    def page(self, offset: int = 0, limit: int = 50) -> str:
+        """صفحة من ملخصات الطاولات مسلسلة كـ JSON (مخزنة حتى التغيير التالي)"""
+        key = (offset, limit)
+        body = self._pages.get(key)
+        if body is None:
+            summaries = list(self._summaries.values())
+            body = json.dumps({
+                "version": self.version_token,
+                "total": len(summaries),
+                "offset": offset,
+                "limit": limit,
+                "tables": summaries[offset:offset + limit],
+            }, ensure_ascii=False, default=str)
+            self._pages[key] = body
+        return body
+
+    def changes_since(self, since: Optional[int]) -> Optional[List[Dict[str, Any]]]:
+        """التغييرات بعد إصدار معين (None إذا خرج الإصدار من السجل ويجب إعادة التحميل)"""
+        if since == self.version:
+            return []
+        # إصدار من عملية سابقة (بعد إعادة التشغيل) أو أقدم من السجل
+        if since is None or since > self.version or not self._changes or since < self._changes[0][0] - 1:
+            return None
+
+        # آخر ملخص فقط لكل طاولة
+        latest: Dict[Any, Optional[Dict[str, Any]]] = {}
+        for version, table_id, summary in self._changes:
+            if version > since:
+                latest.pop(table_id, None)
+                latest[table_id] = summary
+        return [
+            {"tableId": table_id, "removed": summary is None, "summary": summary}
+            for table_id, summary in latest.items()
+        ]
+
+    async def wait_for_changes(self, since_token: str, timeout: float) -> Optional[List[Dict[str, Any]]]:
+        """انتظار تغيير بعد الإصدار المحدد (رمز العميل) حتى انتهاء المهلة"""
+        since = self.parse_version(since_token)
+        if since == self.version:
+            if self._changed is None:
+                self._changed = asyncio.Event()
+            changed = self._changed
+            try:
+                await asyncio.wait_for(changed.wait(), timeout)
+            except asyncio.TimeoutError:
+                return []
+        return self.changes_since(since)
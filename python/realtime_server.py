@@ -13,7 +13,9 @@ import os
 import json
 import time
 import asyncio
+import signal
 import logging
+import secrets
 import threading
 from typing import Dict, List, Optional, Set, Union, Any
 from datetime import datetime
@@ -21,9 +23,22 @@ from contextlib import asynccontextmanager
 from pydantic import BaseModel
 
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Depends, HTTPException, Request, status, Body
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
-import uvicorn
+
+from python.state_snapshot import StateSnapshotStore
+from python.hand_history import HandHistoryLog, HandHistoryReader
+from python.graceful_restart import DrainController, SERVICE_RESTART_CLOSE_CODE
+from python.rocket_engine import RocketRoundEngine
+from python.settlement import SettlementQueue, create_store_from_env
+from python.table_views import TableViewCache, public_player_info
+from python.virtual_players import VirtualPlayerManager
+from python.lobby_index import LobbyIndex
+from python.session_resume import SeatSessions, TableEventLog, table_id_from_token
+from python.table_chat import TableChat
+from python.sharding import ShardMap, SHARD_REDIRECT_CLOSE_CODE, proxy_websocket, websocket_url
+from python.traffic_capture import TrafficRecorder
+from python.user_auth import UserTokens
 
 # إعداد التسجيل
 logging.basicConfig(
@@ -41,23 +56,213 @@ user_updates: Dict[int, List[Dict[str, Any]]] = {}
 # التخزين المؤقت للرسائل العامة
 broadcast_messages: List[Dict[str, Any]] = []
 
+# أوراق اللعب (نفس صيغة البطاقات التي يقرؤها اللاعبون الوهميون)
+CARD_RANKS = ("2", "3", "4", "5", "6", "7", "8", "9", "10", "J", "Q", "K", "A")
+CARD_SUITS = ("s", "h", "d", "c")
+card_shuffler = secrets.SystemRandom()
+
 # قواميس البوكر
 poker_tables: Dict[int, Dict[str, Any]] = {}  # قاموس لتخزين طاولات البوكر {table_id: {players: {}, game_state: {}, ...}}
 poker_connections: Dict[int, List[WebSocket]] = {}  # قاموس لتخزين اتصالات غرف البوكر {table_id: [connection1, connection2, ...]}
 player_connection_map: Dict[str, Dict[str, Any]] = {}  # قاموس لربط اللاعبين بالاتصالات {player_id: {connection: WebSocket, table_id: int}}
 
+# الأنظمة الفرعية تُنشأ في build_subsystems عند بدء التشغيل وليس عند استيراد التطبيق
+
+# مخزن لقطات الحالة لإعادة التشغيل السريعة
+snapshot_store: Optional[StateSnapshotStore] = None
+snapshots_enabled = os.environ.get("REALTIME_SNAPSHOT_ENABLED", "1").lower() in ("true", "1", "t")
+
+# سجل أحداث الطاولات الثنائي
+hand_history: Optional[HandHistoryLog] = None
+hand_history_enabled = os.environ.get("HAND_HISTORY_ENABLED", "1").lower() in ("true", "1", "t")
+
+# وحدة تصريف الخادم لإعادة التشغيل دون انقطاع
+drain_controller: Optional[DrainController] = None
+
+# محرك جولات صاروخ مصر
+rocket_engine: Optional[RocketRoundEngine] = None
+rocket_engine_enabled = os.environ.get("ROCKET_ENGINE_ENABLED", "1").lower() in ("true", "1", "t")
+
+# التحقق من هوية أصحاب الاتصالات قبل قبول الرهانات باسمهم
+user_tokens: Optional[UserTokens] = None
+
+# طابور تسوية الرقائق (يُنشأ المخزن عند بدء التشغيل)
+settlement_queue: Optional[SettlementQueue] = None
+settlement_enabled = os.environ.get("SETTLEMENT_ENABLED", "1").lower() in ("true", "1", "t")
+
+# الإطارات العامة المخزنة لحالة كل طاولة
+table_views: Optional[TableViewCache] = None
+
+# فهرس الردهة (ملخصات الطاولات المحدثة تزايدياً)
+lobby_index: Optional[LobbyIndex] = None
+
+# استئناف جلسات المقاعد: أرقام تسلسلية لأحداث الطاولات وحجز المقاعد بعد الانقطاع
+table_events: Optional[TableEventLog] = None
+seat_sessions: Optional[SeatSessions] = None
+
+# دردشة الطاولات (ترشيح، سجل دائري، وتحديد معدل لكل مرسل)
+table_chat: Optional[TableChat] = None
+
+# توزيع الطاولات على عمليات الخادم (معطل ما لم تُحدد SHARD_WORKERS و SHARD_SELF)
+shard_map: Optional[ShardMap] = None
+
+# اللاعبون الوهميون (قراراتهم تُحسب في عمليات منفصلة)
+virtual_players: Optional[VirtualPlayerManager] = None
+virtual_players_enabled = os.environ.get("VIRTUAL_PLAYERS_ENABLED", "1").lower() in ("true", "1", "t")
+
+# تسجيل الإطارات الواردة لإعادة تشغيلها في اختبارات الأداء (معطل ما لم يُحدد TRAFFIC_CAPTURE_PATH)
+traffic_recorder: Optional[TrafficRecorder] = None
+
+
+def build_subsystems():
+    """إنشاء الأنظمة الفرعية من متغيرات البيئة وربطها بدوال الخادم (مرة واحدة لكل عملية)"""
+    global snapshot_store, hand_history, drain_controller, rocket_engine, user_tokens, settlement_queue
+    global table_views, lobby_index, table_events, seat_sessions, table_chat, shard_map
+    global virtual_players, traffic_recorder
+    if drain_controller is not None:
+        return
+    
+    snapshot_store = StateSnapshotStore.from_env()
+    hand_history = HandHistoryLog.from_env()
+    
+    drain_controller = DrainController.from_env()
+    drain_controller.add_flush_hook(_flush_snapshots)
+    drain_controller.add_flush_hook(_close_state_writers)
+    
+    user_tokens = UserTokens.from_env()
+    settlement_queue = SettlementQueue(
+        None,
+        lambda updates: send_to_users(updates),
+        flush_interval=float(os.environ.get("SETTLEMENT_INTERVAL", 0.2))
+    )
+    
+    # سلسلة التجزئة تُحسب عند بدء أول جولة فقط
+    rocket_engine = RocketRoundEngine.from_env()
+    rocket_engine.add_settle_handler(_settle_rocket_round)
+    rocket_engine.set_bet_handler(_debit_rocket_bets)
+    
+    table_views = TableViewCache()
+    lobby_index = LobbyIndex()
+    table_events = TableEventLog(int(os.environ.get("RESUME_BUFFER_SIZE", 256)))
+    seat_sessions = SeatSessions.from_env()
+    table_chat = TableChat.from_env()
+    shard_map = ShardMap.from_env()
+    
+    virtual_players = VirtualPlayerManager.from_env()
+    virtual_players.bind_table_api(seat_player, unseat_player, apply_player_action, poker_tables, poker_connections)
+    
+    traffic_recorder = TrafficRecorder.from_env()
+
+
+# مهام الخلفية التي يشغلها lifespan (يوقفها التصريف قبل خروج العملية القديمة)
+background_tasks: Dict[str, asyncio.Task] = {}
+
 # مدير الدخول/الخروج للتطبيق
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # التنظيف عند بدء التشغيل
     logger.info("بدء تشغيل خادم التحديثات الفورية")
+    
+    build_subsystems()
+    
+    # استعادة الحالة المحفوظة قبل قبول أي اتصال
+    if snapshots_enabled:
+        try:
+            snapshot_store.restore(poker_tables, user_updates)
+            background_tasks["snapshot"] = asyncio.create_task(snapshot_store.run(poker_tables, user_updates))
+        except Exception as e:
+            logger.error(f"فشل في استعادة لقطة حالة الخادم: {str(e)}")
+    
     clear_old_data()
+    lobby_index.rebuild(poker_tables)
+    
+    # حجز مقاعد اللاعبين المستعادة حتى يستأنفوا جلساتهم
+    held = seat_sessions.adopt(poker_tables, _expire_seat)
+    if held:
+        logger.info(f"تم حجز {held} مقعد مستعاد بانتظار استئناف الجلسات")
+    
+    if hand_history_enabled:
+        background_tasks["history"] = asyncio.create_task(hand_history.run())
+    
+    if settlement_enabled:
+        try:
+            settlement_queue.store = create_store_from_env()
+            if settlement_queue.store is None:
+                logger.warning("التسوية معطلة: لم يُحدد DATABASE_URL")
+            else:
+                background_tasks["settlement"] = asyncio.create_task(settlement_queue.run())
+        except Exception as e:
+            logger.error(f"فشل في تهيئة مخزن تسوية الرقائق: {str(e)}")
+    
+    if rocket_engine_enabled:
+        background_tasks["rocket"] = asyncio.create_task(rocket_engine.run())
+    
+    if virtual_players_enabled:
+        virtual_players.adopt(poker_tables)
+        background_tasks["virtual_players"] = asyncio.create_task(virtual_players.run())
+    
+    if traffic_recorder.enabled:
+        logger.info(f"تسجيل حركة الخادم مفعل في {traffic_recorder.path}")
+        background_tasks["capture"] = asyncio.create_task(traffic_recorder.run())
+    
+    # بدء التصريف عند استلام إشارة SIGUSR1
+    try:
+        asyncio.get_running_loop().add_signal_handler(
+            signal.SIGUSR1, lambda: asyncio.create_task(drain_server())
+        )
+    except (NotImplementedError, RuntimeError, ValueError, AttributeError):
+        logger.warning("تعذر تسجيل إشارة SIGUSR1 للتصريف، استخدم /admin/drain بدلاً من ذلك")
     
     # تنفيذ التطبيق
     yield
     
     # التنظيف عند الإغلاق
     logger.info("إيقاف خادم التحديثات الفورية")
+    
+    # بعد التصريف تكون هذه المهام قد توقفت بالفعل وسُلمت الحالة للعملية الجديدة
+    await _stop_state_producers()
+    
+    if virtual_players_enabled:
+        await virtual_players.close()
+    
+    # تسوية ما تبقى في الطابور قبل الإغلاق
+    settlement_task = background_tasks.pop("settlement", None)
+    if settlement_task:
+        await _cancel_task(settlement_task)
+        try:
+            while settlement_queue.pending_count:
+                await settlement_queue.flush()
+        except Exception as e:
+            logger.error(f"تعذرت تسوية {settlement_queue.pending_count} معاملة معلقة عند الإغلاق: {str(e)}")
+        settlement_queue.store.close()
+    
+    # حفظ لقطة نهائية بعد إيقاف مهمة الكتابة الدورية
+    snapshot_task = background_tasks.pop("snapshot", None)
+    if snapshot_task:
+        await _cancel_task(snapshot_task)
+        await snapshot_store.flush_final(poker_tables, user_updates)
+        snapshot_store.close()
+    
+    history_task = background_tasks.pop("history", None)
+    if history_task:
+        await _cancel_task(history_task)
+        await hand_history.flush_final()
+    
+    capture_task = background_tasks.pop("capture", None)
+    if capture_task:
+        await _cancel_task(capture_task)
+        traffic_recorder.flush_now()
+
+
+async def _cancel_task(task: Optional[asyncio.Task]):
+    """إيقاف مهمة خلفية وانتظار انتهائها"""
+    if task is None:
+        return
+    task.cancel()
+    try:
+        await task
+    except asyncio.CancelledError:
+        pass
 
 
 # إنشاء تطبيق FastAPI
@@ -90,6 +295,7 @@ def clear_old_data():
     for user_id in user_updates:
         if len(user_updates[user_id]) > 50:
             user_updates[user_id] = user_updates[user_id][-50:]
+            snapshot_store.mark_user_updates_reset(user_id)
     
     logger.info("تم تنظيف البيانات القديمة")
 
@@ -133,6 +339,7 @@ async def send_to_user(user_id: int, message: Dict[str, Any]):
         if user_id not in user_updates:
             user_updates[user_id] = []
         user_updates[user_id].append(message)
+        snapshot_store.log_user_update(user_id, message)
         return
     
     disconnected_connections = []
@@ -153,21 +360,39 @@ async def send_to_user(user_id: int, message: Dict[str, Any]):
         if user_id not in user_updates:
             user_updates[user_id] = []
         user_updates[user_id].append(message)
+        snapshot_store.log_user_update(user_id, message)
         del active_connections[user_id]
         logger.info(f"تمت إزالة المستخدم {user_id} بسبب انقطاع الاتصال")
 
 
+async def send_to_users(messages: Dict[int, Dict[str, Any]]):
+    """إرسال رسالة مختلفة لكل مستخدم في دفعة واحدة متزامنة"""
+    timestamp = datetime.now().isoformat()
+    for message in messages.values():
+        message["timestamp"] = timestamp
+    
+    await asyncio.gather(*(send_to_user(user_id, message) for user_id, message in messages.items()))
+
+
 async def broadcast_to_table(table_id: int, message: Dict[str, Any]):
     """إرسال رسالة لجميع اللاعبين في طاولة البوكر"""
     disconnected_connections = []
     
+    # تسجيل الحدث في سجل الطاولة
+    if hand_history_enabled:
+        hand_number = poker_tables.get(table_id, {}).get("game_state", {}).get("hand_number", 0)
+        hand_history.record(table_id, message, hand_number)
+    
+    # ترقيم الحدث وتسلسله مرة واحدة (ويُحفظ لإعادة إرساله عند استئناف الجلسة)
+    text = table_events.append(table_id, message)
+    
     if table_id not in poker_connections:
         return
     
     # إرسال لجميع اللاعبين في الطاولة
     for connection in poker_connections[table_id]:
         try:
-            await connection.send_json(message)
+            await connection.send_text(text)
         except Exception as e:
             logger.error(f"خطأ أثناء البث لطاولة البوكر {table_id}: {str(e)}")
             disconnected_connections.append(connection)
@@ -183,6 +408,41 @@ async def broadcast_to_table(table_id: int, message: Dict[str, Any]):
         # هنا يمكن إضافة منطق للاحتفاظ بالبيانات لفترة قبل حذفها
 
 
+def table_changed(table_id: Any):
+    """تسجيل تغير حالة طاولة: حفظها في اللقطة القادمة وإبطال إطارها العام وتحديث الردهة"""
+    snapshot_store.mark_table_dirty(table_id)
+    table_views.invalidate(table_id)
+    lobby_index.update(table_id, poker_tables.get(table_id))
+
+
+async def send_table_state(table_id: Any, websocket: Optional[WebSocket] = None):
+    """إرسال حالة الطاولة: الجزء العام يُسلسل مرة واحدة ويُلحق بكل مقعد جزؤه الخاص
+    
+    إذا حُدد اتصال واحد يُرسل له فقط، وإلا يُرسل لجميع اتصالات الطاولة.
+    """
+    table = poker_tables.get(table_id)
+    if table is None:
+        return
+    
+    # ربط اتصالات اللاعبين الجالسين بمعرفاتهم (المشاهدون يستلمون الإطار العام)
+    seat_by_connection = {}
+    for player_id in table["players"]:
+        connection = player_connection_map.get(player_id, {}).get("connection")
+        if connection is not None:
+            seat_by_connection[id(connection)] = player_id
+    
+    recipients = [websocket] if websocket is not None else list(poker_connections.get(table_id, []))
+    timestamp = datetime.now().isoformat()
+    for connection in recipients:
+        frame = table_views.frame_for(table_id, table, seat_by_connection.get(id(connection)), timestamp)
+        try:
+            await connection.send_text(frame)
+        except Exception as e:
+            logger.error(f"خطأ أثناء إرسال حالة طاولة البوكر {table_id}: {str(e)}")
+            if table_id in poker_connections and connection in poker_connections[table_id]:
+                poker_connections[table_id].remove(connection)
+
+
 async def send_to_player(player_id: str, message: Dict[str, Any]):
     """إرسال رسالة إلى لاعب بوكر محدد"""
     if player_id not in player_connection_map:
@@ -209,6 +469,262 @@ async def send_to_player(player_id: str, message: Dict[str, Any]):
         del player_connection_map[player_id]
 
 
+def _shuffled_deck() -> List[str]:
+    """مجموعة أوراق كاملة مخلوطة بمولد آمن ("As"، "10d"...)"""
+    deck = [f"{rank}{suit}" for rank in CARD_RANKS for suit in CARD_SUITS]
+    card_shuffler.shuffle(deck)
+    return deck
+
+
+def _new_table(blind_amount: int = 10) -> Dict[str, Any]:
+    """إنشاء طاولة بوكر فارغة"""
+    return {
+        "players": {},
+        "game_state": {
+            "phase": "waiting",
+            "pot": 0,
+            "community_cards": [],
+            "current_player": None,
+            "dealer_position": 0,
+            "hand_number": 0,
+            "blind_amount": blind_amount,
+            "min_bet": blind_amount * 2
+        }
+    }
+
+
+async def seat_player(table_id: Any, player_id: str, player_info: Dict[str, Any], websocket: Optional[WebSocket] = None):
+    """إجلاس لاعب على طاولة (مشتركة بين اتصالات WebSocket واللاعبين الوهميين)
+    
+    اللاعب الوهمي ليس له اتصال، فلا يُضاف إلى قواميس الاتصالات.
+    """
+    if websocket is not None:
+        # إضافة الاتصال إلى قواميس البوكر
+        if table_id not in poker_connections:
+            poker_connections[table_id] = []
+        if websocket not in poker_connections[table_id]:
+            poker_connections[table_id].append(websocket)
+        
+        # ربط اللاعب بالاتصال والطاولة
+        player_connection_map[player_id] = {
+            "connection": websocket,
+            "table_id": table_id,
+            "info": player_info
+        }
+    
+    # إضافة اللاعب إلى الطاولة
+    if table_id not in poker_tables:
+        poker_tables[table_id] = _new_table(player_info.get("blindAmount", 10))
+    
+    poker_tables[table_id]["players"][player_id] = player_info
+    table_changed(table_id)
+    
+    # إعلام جميع اللاعبين في الطاولة بالانضمام
+    await broadcast_to_table(table_id, {
+        "type": "player_joined",
+        "data": public_player_info(player_info),
+        "tableId": table_id,
+        "timestamp": datetime.now().isoformat()
+    })
+    
+    # إرسال حالة اللعبة الحالية للاعب المنضم (العام مع الجزء الخاص بمقعده)
+    if websocket is not None:
+        await send_table_state(table_id, websocket)
+        
+        # بدء أدوار اللاعبين الوهميين عند وجود من يتابع الطاولة
+        if virtual_players_enabled and virtual_players.bots_at(table_id):
+            virtual_players.on_action(table_id, None)
+    
+    logger.info(f"انضم اللاعب {player_id} إلى طاولة البوكر {table_id}")
+
+
+async def unseat_player(table_id: Any, player_id: str) -> bool:
+    """إقامة لاعب من طاولة وإعلام بقية اللاعبين"""
+    if table_id not in poker_tables or player_id not in poker_tables[table_id]["players"]:
+        return False
+    
+    del poker_tables[table_id]["players"][player_id]
+    poker_tables[table_id].get("private", {}).pop(player_id, None)
+    table_changed(table_id)
+    
+    # إعلام جميع اللاعبين في الطاولة بالمغادرة
+    await broadcast_to_table(table_id, {
+        "type": "player_left",
+        "playerId": player_id,
+        "tableId": table_id,
+        "timestamp": datetime.now().isoformat()
+    })
+    
+    logger.info(f"غادر اللاعب {player_id} طاولة البوكر {table_id}")
+    return True
+
+
+async def apply_player_action(table_id: Any, player_id: str, action: Optional[str], amount: Any = 0):
+    """تنفيذ إجراء لاعب (مثل المراهنة، الطي، إلخ)"""
+    if table_id not in poker_tables:
+        return
+    
+    # تحديث حالة اللعبة (هنا سيكون المنطق الكامل للعبة البوكر)
+    # لأغراض هذا المثال، نقوم فقط بإعادة توجيه الإجراء إلى جميع اللاعبين
+    
+    # إعلام جميع اللاعبين في الطاولة بالإجراء
+    await broadcast_to_table(table_id, {
+        "type": "action_result",
+        "playerId": player_id,
+        "action": action,
+        "amount": amount,
+        "tableId": table_id,
+        "timestamp": datetime.now().isoformat()
+    })
+    
+    logger.info(f"قام اللاعب {player_id} بإجراء {action} بمبلغ {amount} في طاولة {table_id}")
+    
+    # دور اللاعب الوهمي التالي (إن وجد)
+    if virtual_players_enabled:
+        virtual_players.on_action(table_id, player_id, action, amount)
+
+
+async def start_hand(table_id: Any) -> bool:
+    """بدء يد جديدة في الطاولة: زيادة رقم اليد وإعادة حالة الجولة (يُرجع False إذا لم يكفِ عدد اللاعبين)"""
+    table = poker_tables.get(table_id)
+    if table is None or len(table["players"]) < 2:
+        return False
+    
+    game_state = table["game_state"]
+    game_state["hand_number"] = game_state.get("hand_number", 0) + 1
+    game_state["phase"] = "preflop"
+    game_state["pot"] = 0
+    game_state["community_cards"] = []
+    game_state["current_player"] = None
+    
+    # توزيع ورقتين لكل مقعد في الجزء الخاص (لا يظهر إلا لصاحبه)، وبقية الأوراق في deck
+    deck = _shuffled_deck()
+    table["private"] = {
+        player_id: {"hole_cards": [deck.pop(), deck.pop()]}
+        for player_id in table["players"]
+    }
+    game_state["deck"] = deck
+    table_changed(table_id)
+    
+    await broadcast_to_table(table_id, {
+        "type": "hand_started",
+        "handNumber": game_state["hand_number"],
+        "tableId": table_id,
+        "timestamp": datetime.now().isoformat()
+    })
+    await send_table_state(table_id)
+    
+    # اللاعبون الوهميون يقررون بأوراقهم الموزعة في هذه اليد
+    if virtual_players_enabled and virtual_players.bots_at(table_id):
+        virtual_players.on_action(table_id, None)
+    
+    logger.info(f"بدأت اليد {game_state['hand_number']} في طاولة البوكر {table_id}")
+    return True
+
+async def _expire_seat(table_id: Any, player_id: str):
+    """انتهاء مدة حجز المقعد دون عودة اللاعب: إقامته من الطاولة"""
+    player_data = player_connection_map.get(player_id)
+    if player_data is not None and player_data.get("connection") is not None:
+        return
+    
+    seat_sessions.revoke(table_id, poker_tables.get(table_id), player_id)
+    player_connection_map.pop(player_id, None)
+    await unseat_player(table_id, player_id)
+    logger.info(f"انتهت مدة حجز مقعد اللاعب {player_id} في طاولة البوكر {table_id}")
+
+
+async def send_chat_history(table_id: Any, websocket: WebSocket):
+    """إرسال آخر رسائل الدردشة في الطاولة كإطار واحد"""
+    frame = table_chat.history_frame(table_id)
+    if frame is not None:
+        await websocket.send_text(frame)
+
+
+async def _stop_state_producers():
+    """إيقاف المهام التي تغير الحالة: جولات الصاروخ، اللاعبون الوهميون، ومؤقتات حجز المقاعد"""
+    rocket_task = background_tasks.pop("rocket", None)
+    if rocket_task:
+        await _cancel_task(rocket_task)
+        await _refund_unfinished_rocket_round()
+    await _cancel_task(background_tasks.pop("virtual_players", None))
+    seat_sessions.close()
+
+
+async def _refund_unfinished_rocket_round():
+    """إعادة رهانات جولة صاروخ أُوقفت قبل انفجارها (أو دفع ربح من سحب قبل الإيقاف)"""
+    round_key = rocket_engine.round_key
+    for bet in await rocket_engine.abort_round():
+        settlement_queue.submit(
+            bet["userId"],
+            bet["amount"],
+            key=f"egypt_rocket:{round_key}:{bet['userId']}:refund",
+            transaction_type="egypt_rocket_refund",
+            description="إعادة رهان في جولة صاروخ مصر أُوقفت قبل انتهائها",
+            details={"round": rocket_engine.round_id, **bet},
+        )
+
+
+async def _flush_snapshots():
+    """حفظ التسويات واللقطات وسجل الأحداث المعلقة (يُستدعى أثناء التصريف)"""
+    # لا تتغير الحالة بعد حفظها: العملية الجديدة تستعيد هذه اللقطة
+    await _stop_state_producers()
+    
+    # التسوية أولاً: العملاء منقطعون الآن فتُضاف إشعارات chips_update إلى user_updates،
+    # ويجب أن تدخل في اللقطة التي تستلمها العملية الجديدة
+    if settlement_queue.store is not None:
+        while settlement_queue.pending_count:
+            await settlement_queue.flush()
+    if snapshots_enabled:
+        await snapshot_store.flush(poker_tables, user_updates)
+    if hand_history_enabled:
+        await hand_history.flush()
+
+
+
+async def _close_state_writers():
+    """إيقاف الكتابة الدورية وإغلاق ملف اللقطات بعد التصريف
+
+    تبقى العملية القديمة حية لمدة DRAIN_EXIT_DELAY بعد التصريف، ويجب ألا تكتب خلالها
+    في ملف اللقطات الذي استعادته العملية الجديدة.
+    """
+    settlement_task = background_tasks.pop("settlement", None)
+    if settlement_task:
+        await _cancel_task(settlement_task)
+        settlement_queue.store.close()
+        settlement_queue.store = None
+    snapshot_task = background_tasks.pop("snapshot", None)
+    if snapshot_task:
+        await _cancel_task(snapshot_task)
+        snapshot_store.close()
+    history_task = background_tasks.pop("history", None)
+    if history_task:
+        await _cancel_task(history_task)
+        await hand_history.flush_final()
+
+
+async def drain_server() -> Dict[str, Any]:
+    """تصريف جميع الاتصالات وحفظ الحالة قبل تسليمها لعملية جديدة"""
+    connections = {}
+    for user_connections in active_connections.values():
+        for connection in user_connections:
+            connections[id(connection)] = connection
+    for table_connections in poker_connections.values():
+        for connection in table_connections:
+            connections[id(connection)] = connection
+    for connection in rocket_engine.connections():
+        connections[id(connection)] = connection
+    return await drain_controller.drain(connections.values())
+
+
+def _reject_while_draining():
+    """رفض طلبات الدفع أثناء التصريف حتى يعيد المرسل المحاولة على العملية الجديدة"""
+    if drain_controller.draining:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="الخادم في طور إعادة التشغيل"
+        )
+
+
 # طرق واجهة برمجة التطبيقات
 @app.get("/")
 async def get_status():
@@ -218,7 +734,8 @@ async def get_status():
         "message": "خادم التحديثات الفورية يعمل",
         "timestamp": datetime.now().isoformat(),
         "active_users": len(active_connections),
-        "stored_messages": len(broadcast_messages)
+        "stored_messages": len(broadcast_messages),
+        "draining": drain_controller.draining
     }
 
 
@@ -235,6 +752,9 @@ async def get_active_users():
 @app.post("/broadcast")
 async def send_broadcast_message(message: Dict[str, Any]):
     """إرسال رسالة إلى جميع المستخدمين المتصلين"""
+    _reject_while_draining()
+    traffic_recorder.http("POST", "/broadcast", message)
+    
     # إضافة طابع زمني
     message["timestamp"] = datetime.now().isoformat()
     
@@ -247,6 +767,9 @@ async def send_broadcast_message(message: Dict[str, Any]):
 @app.post("/user/{user_id}/notify")
 async def send_user_message(user_id: int, message: Dict[str, Any]):
     """إرسال رسالة إلى مستخدم محدد"""
+    _reject_while_draining()
+    traffic_recorder.http("POST", f"/user/{user_id}/notify", message)
+    
     # إضافة طابع زمني
     message["timestamp"] = datetime.now().isoformat()
     
@@ -256,10 +779,451 @@ async def send_user_message(user_id: int, message: Dict[str, Any]):
     return {"success": True, "message": f"تم إرسال الرسالة للمستخدم {user_id}"}
 
 
-@app.websocket("/ws/{user_id}")
+@app.post("/settlements")
+async def submit_settlements(request: Request, payload: Dict[str, Any] = Body(...)):
+    """إضافة تغييرات أرصدة إلى طابور التسوية (المفتاح يمنع الصرف المزدوج عند إعادة الإرسال)
+
+    متاح من الجهاز المحلي فقط، أو برمز DRAIN_TOKEN إن وُجد، مثل الطلبات الإدارية.
+    """
+    _require_admin(request)
+    _reject_while_draining()
+    if not settlement_enabled or settlement_queue.store is None:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="التسوية غير مفعلة")
+    traffic_recorder.http("POST", "/settlements", payload)
+    
+    accepted = 0
+    duplicates = 0
+    for entry in payload.get("entries", []):
+        try:
+            submitted = settlement_queue.submit(
+                int(entry["userId"]),
+                int(entry["amount"]),
+                key=str(entry["key"]),
+                transaction_type=entry.get("type", "adjustment"),
+                description=entry.get("description"),
+                game_id=entry.get("gameId"),
+                table_id=entry.get("tableId")
+            )
+        except (KeyError, TypeError, ValueError):
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="بيانات التسوية غير صالحة")
+        if submitted:
+            accepted += 1
+        else:
+            duplicates += 1
+    
+    return {"success": True, "accepted": accepted, "duplicates": duplicates}
+
+
+def _require_admin(request: Request):
+    """السماح بالطلبات الإدارية من الجهاز المحلي فقط، أو برمز DRAIN_TOKEN إن وُجد"""
+    client_host = request.client.host if request.client else None
+    drain_token = os.environ.get("DRAIN_TOKEN")
+    if drain_token:
+        allowed = request.headers.get("X-Drain-Token") == drain_token
+    else:
+        allowed = client_host in ("127.0.0.1", "::1")
+    if not allowed:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="غير مسموح")
+
+
+@app.post("/admin/drain")
+async def admin_drain(request: Request):
+    """تصريف الخادم قبل إعادة التشغيل (متاح من الجهاز المحلي فقط)"""
+    _require_admin(request)
+    return await drain_server()
+
+
+async def _redirect_to_shard(connection: WebSocket, table_id: Any, owner: str):
+    """إبلاغ العميل بالعملية المالكة للطاولة ثم إغلاق الاتصال"""
+    try:
+        await connection.send_json({
+            "type": "shard_redirect",
+            "tableId": table_id,
+            "url": websocket_url(owner),
+            "timestamp": datetime.now().isoformat()
+        })
+        await connection.close(code=SHARD_REDIRECT_CLOSE_CODE)
+    except Exception:
+        pass
+
+
+async def _route_to_shard(websocket: WebSocket, table_id: Any, raw_message: str) -> bool:
+    """توجيه اتصال طاولة غير محلية للعملية المالكة (يُرجع False إذا كانت الطاولة محلية)"""
+    if table_id is None or shard_map.is_local(table_id):
+        return False
+    
+    owner = shard_map.owner(table_id)
+    if shard_map.routing == "proxy":
+        try:
+            if await proxy_websocket(websocket, websocket_url(owner), raw_message):
+                return True
+        except Exception as e:
+            logger.error(f"تعذر تمرير اتصال طاولة البوكر {table_id} إلى {owner}: {str(e)}")
+    
+    await _redirect_to_shard(websocket, table_id, owner)
+    return True
+
+
+async def migrate_table(table_id: Any, owner: str):
+    """نقل طاولة إلى مالكها الجديد مع رموز الاستئناف، ثم توجيه اتصالاتها إليه"""
+    table = poker_tables[table_id]
+    await shard_map.post(owner, "/admin/shards/import", {"tables": [{"tableId": table_id, "table": table}]})
+    
+    # إزالة الطاولة محلياً قبل إغلاق الاتصالات حتى لا تُحجز مقاعدها هنا
+    del poker_tables[table_id]
+    for player_id in list(table.get("sessions", {})):
+        seat_sessions.revoke(table_id, table, player_id)
+    for player_id in table.get("players", {}):
+        player_data = player_connection_map.get(player_id)
+        if player_data is not None and player_data.get("table_id") == table_id:
+            del player_connection_map[player_id]
+    virtual_players.forget(table_id)
+    table_chat.forget(table_id)
+    snapshot_store.mark_table_deleted(table_id)
+    table_views.invalidate(table_id)
+    lobby_index.remove(table_id)
+    
+    # التوجيه في الخلفية حتى لا ينتظر نقل بقية الطاولات إغلاق اتصالات العملاء البطيئة
+    connections = poker_connections.pop(table_id, [])
+    for connection in connections:
+        asyncio.create_task(_redirect_to_shard(connection, table_id, owner))
+    logger.info(f"تم نقل طاولة البوكر {table_id} إلى {owner} ({len(connections)} اتصال)")
+
+
+@app.get("/admin/shards")
+async def get_shards():
+    """خريطة توزيع الطاولات الحالية"""
+    state = shard_map.describe()
+    state["tables"] = len(poker_tables)
+    return state
+
+
+@app.post("/admin/shards")
+async def update_shards(request: Request, payload: Dict[str, Any] = Body(...)):
+    """تغيير قائمة العمليات أثناء التشغيل ونقل الطاولات التي تغير مالكها"""
+    _require_admin(request)
+    workers = payload.get("workers")
+    if not isinstance(workers, list) or not workers:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="قائمة العمليات مطلوبة")
+    
+    shard_map.set_workers([str(worker) for worker in workers])
+    
+    # نشر القائمة الجديدة لبقية العمليات (مرة واحدة فقط)
+    propagated = []
+    if payload.get("propagate", True):
+        for worker in shard_map.workers:
+            if worker == shard_map.self_node:
+                continue
+            try:
+                await shard_map.post(worker, "/admin/shards", {"workers": shard_map.workers, "propagate": False})
+                propagated.append(worker)
+            except Exception as e:
+                logger.error(f"تعذر نشر خريطة التوزيع إلى {worker}: {str(e)}")
+    
+    moved = []
+    failed = []
+    for table_id, owner in shard_map.moved_tables(list(poker_tables)).items():
+        try:
+            await migrate_table(table_id, owner)
+            moved.append(table_id)
+        except Exception as e:
+            logger.error(f"تعذر نقل طاولة البوكر {table_id} إلى {owner}: {str(e)}")
+            failed.append(table_id)
+    
+    return {"success": not failed, "shards": shard_map.describe(), "propagated": propagated,
+            "moved": moved, "failed": failed}
+
+
+@app.post("/admin/shards/import")
+async def import_shard_tables(request: Request, payload: Dict[str, Any] = Body(...)):
+    """استلام طاولات منقولة من عملية أخرى"""
+    _require_admin(request)
+    entries = payload.get("tables", [])
+    
+    # رفض الطلب كاملاً إذا كانت أي طاولة موجودة محلياً بحالة مختلفة حتى لا تُستبدل طاولة حية
+    # (تُقبل الطاولة المطابقة لأنها إعادة محاولة لنقل تم بالفعل)
+    conflicts = [
+        entry["tableId"] for entry in entries
+        if entry["tableId"] in poker_tables and poker_tables[entry["tableId"]] != entry["table"]
+    ]
+    if conflicts:
+        logger.warning(f"رفض استلام طاولات موجودة محلياً: {conflicts}")
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail={"message": "الطاولات موجودة بالفعل في هذه العملية", "conflicts": conflicts},
+        )
+    
+    imported = []
+    for entry in entries:
+        table_id = entry["tableId"]
+        table = entry["table"]
+        if table_id in poker_tables:
+            imported.append(table_id)
+            continue
+        poker_tables[table_id] = table
+        table_changed(table_id)
+        seat_sessions.adopt({table_id: table}, _expire_seat)
+        if virtual_players_enabled:
+            virtual_players.adopt({table_id: table})
+        imported.append(table_id)
+    
+    logger.info(f"تم استلام {len(imported)} طاولة منقولة")
+    return {"success": True, "imported": imported}
+
+
+@app.get("/poker/tables/{table_id}/history")
+async def get_table_history(
+    table_id: str,
+    from_hand: Optional[int] = None,
+    to_hand: Optional[int] = None,
+    since: Optional[float] = None,
+    until: Optional[float] = None
+):
+    """بث تاريخ أحداث طاولة بصيغة JSON سطرية للتدقيق وإعادة التشغيل"""
+    # كتابة الأحداث المعلقة أولاً حتى يشمل الرد أحدث الأحداث
+    await hand_history.flush()
+    
+    reader = HandHistoryReader(hand_history.base_dir)
+    events = reader.replay(_resolve_table_id(table_id), from_hand=from_hand, to_hand=to_hand, since=since, until=until)
+    
+    return StreamingResponse(
+        (json.dumps(event, ensure_ascii=False) + "\n" for event in events),
+        media_type="application/x-ndjson"
+    )
+
+
+@app.get("/lobby/tables")
+async def get_lobby_tables(request: Request, offset: int = 0, limit: int = 50):
+    """ملخصات الطاولات المفتوحة (صفحات مخزنة مع ETag)"""
+    offset = max(offset, 0)
+    limit = min(max(limit, 1), 200)
+    etag = lobby_index.etag
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if request.headers.get("If-None-Match") == etag:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(lobby_index.page(offset, limit), media_type="application/json", headers=headers)
+
+
+@app.get("/lobby/changes")
+async def get_lobby_changes(since: str, timeout: float = 25.0):
+    """التغييرات في الردهة بعد إصدار معين، مع الانتظار حتى حدوث تغيير (long-poll)"""
+    changes = await lobby_index.wait_for_changes(since, min(max(timeout, 0.0), 60.0))
+    if changes is None:
+        # الإصدار قديم جداً أو من عملية سابقة: على العميل إعادة تحميل /lobby/tables
+        return {"version": lobby_index.version_token, "reset": True, "changes": []}
+    return {"version": lobby_index.version_token, "reset": False, "changes": changes}
+
+
+def _resolve_table_id(table_id: str) -> Any:
+    """معرف الطاولة في poker_tables (المعرفات الرقمية تصل من WebSocket كأرقام)"""
+    if table_id in poker_tables:
+        return table_id
+    try:
+        return int(table_id)
+    except ValueError:
+        return table_id
+
+
+@app.post("/poker/tables/{table_id}/bots")
+async def add_table_bots(request: Request, table_id: str, payload: Dict[str, Any] = Body(default={})):
+    """إجلاس لاعبين وهميين على طاولة بوكر (متاح من الجهاز المحلي فقط أو برمز DRAIN_TOKEN)"""
+    _require_admin(request)
+    _reject_while_draining()
+    if not virtual_players_enabled:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="اللاعبون الوهميون غير مفعلين")
+    
+    table_id = _resolve_table_id(table_id)
+    if not shard_map.is_local(table_id):
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail={"message": "الطاولة مملوكة لعملية أخرى", "owner": shard_map.owner(table_id)}
+        )
+    
+    try:
+        bots = await virtual_players.add_bots(
+            table_id,
+            count=int(payload.get("count", 1)),
+            level=payload.get("level", "intermediate"),
+            chips=int(payload.get("chips", 5000))
+        )
+    except (TypeError, ValueError) as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    
+    return {"success": True, "bots": bots}
+
+
+@app.delete("/poker/tables/{table_id}/bots")
+async def remove_table_bots(request: Request, table_id: str):
+    """إقامة جميع اللاعبين الوهميين من طاولة بوكر"""
+    _require_admin(request)
+    _reject_while_draining()
+    
+    table_id = _resolve_table_id(table_id)
+    if not shard_map.is_local(table_id):
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail={"message": "الطاولة مملوكة لعملية أخرى", "owner": shard_map.owner(table_id)}
+        )
+    
+    removed = await virtual_players.remove_bots(table_id)
+    return {"success": True, "removed": removed}
+
+
+@app.get("/bots/stats")
+async def get_bot_stats():
+    """إحصائيات اللاعبين الوهميين ودفعات القرارات"""
+    return virtual_players.stats()
+
+
+async def _settle_rocket_round(round_info: Dict[str, Any], results: List[Dict[str, Any]]):
+    """إضافة أرباح جولة الصاروخ إلى طابور التسوية (مبالغ الرهانات خُصمت عند قبولها)"""
+    if settlement_queue.store is None:
+        # بدون مخزن لا تُكتب الدفعات أبداً فيكبر الطابور بلا حد
+        return
+    for result in results:
+        if not result["winAmount"]:
+            continue
+        settlement_queue.submit(
+            result["userId"],
+            result["winAmount"],
+            key=f"egypt_rocket:{round_info['hash']}:{result['userId']}",
+            transaction_type="egypt_rocket_win",
+            description=f"ربح في لعبة صاروخ مصر بمضاعف {result['multiplier']}x",
+            details={
+                "round": round_info["round"],
+                "crashPoint": round_info["crashPoint"],
+                **result
+            }
+        )
+
+
+async def _debit_rocket_bets(round_key: str, requests: List[Dict[str, Any]]):
+    """خصم دفعة طلبات رهان من نبضة واحدة في معاملة واحدة ثم تسجيلها في الجولة
+
+    يُعاد المبلغ إذا رُفض الرهان بعد الخصم.
+    """
+    if not settlement_enabled or settlement_queue.store is None:
+        raise RuntimeError("التسوية معطلة")
+
+    balances = await settlement_queue.debit(
+        [
+            (request["userId"], request["amount"], rocket_engine.bet_key(request["userId"], round_key))
+            for request in requests
+        ],
+        transaction_type="egypt_rocket_bet",
+        description=f"رهان في لعبة صاروخ مصر (الجولة {rocket_engine.round_id})",
+    )
+
+    for request in requests:
+        user_id = request["userId"]
+        key = rocket_engine.bet_key(user_id, round_key)
+        if key not in balances:
+            rocket_engine.release_bet(user_id)
+            rocket_engine.notify_user(user_id, {"type": "error", "message": "رصيدك غير كافٍ", "timestamp": time.time()})
+            continue
+
+        error = rocket_engine.place_bet(user_id, request["amount"], request["autoCashout"], round_key)
+        if error:
+            settlement_queue.submit(
+                user_id,
+                request["amount"],
+                key=f"{key}:refund",
+                transaction_type="egypt_rocket_refund",
+                description="إعادة مبلغ رهان لم يُقبل في لعبة صاروخ مصر",
+            )
+            rocket_engine.notify_user(user_id, {"type": "error", "message": error, "timestamp": time.time()})
+
+
+def _request_rocket_bet(user_id: int, message: Dict[str, Any]):
+    """إضافة طلب رهان إلى دفعة النبضة التالية (يُرفض فوراً إذا لم يُضبط مخزن التسوية)"""
+    auto_cashout = message.get("autoCashout")
+    auto_cashout = float(auto_cashout) if auto_cashout else None
+
+    if not settlement_enabled or settlement_queue.store is None:
+        error = "المراهنة غير متاحة حالياً"
+    else:
+        error = rocket_engine.request_bet(user_id, message.get("amount"), auto_cashout)
+    if error:
+        rocket_engine.notify_user(user_id, {"type": "error", "message": error, "timestamp": time.time()})
+
+
+@app.get("/rocket/state")
+async def get_rocket_state():
+    """الحالة الحالية لجولة صاروخ مصر مع التزام سلسلة التجزئة"""
+    state = rocket_engine.snapshot()
+    state["subscribers"] = rocket_engine.subscriber_count
+    return state
+
+
+@app.websocket("/ws/rocket/{user_id:int}")
+async def rocket_websocket_endpoint(websocket: WebSocket, user_id: int):
+    """نقطة نهاية WebSocket للعبة صاروخ مصر"""
+    if drain_controller.draining or not rocket_engine_enabled:
+        await websocket.close(code=SERVICE_RESTART_CLOSE_CODE)
+        return
+    
+    await websocket.accept()
+    capture_id = traffic_recorder.open(websocket.url.path)
+    rocket_engine.subscribe(websocket, user_id)
+    logger.info(f"اشترك المستخدم {user_id} في جولات صاروخ مصر")
+    
+    # الاتصال غير الموثق يشاهد الجولات فقط ولا يراهن أو يسحب باسم المستخدم
+    authenticated = user_tokens.authenticate(
+        websocket.query_params.get("token"),
+        user_id,
+        websocket.client.host if websocket.client else None,
+    )
+    
+    try:
+        while True:
+            data = await websocket.receive_text()
+            traffic_recorder.frame(capture_id, data)
+            
+            try:
+                message = json.loads(data)
+                message_type = message.get("type")
+                
+                if message_type in ("place_bet", "cash_out") and not authenticated:
+                    await websocket.send_json({
+                        "type": "error",
+                        "message": "يجب تسجيل الدخول للمراهنة",
+                        "timestamp": datetime.now().isoformat()
+                    })
+                elif message_type == "place_bet":
+                    _request_rocket_bet(user_id, message)
+                elif message_type == "cash_out":
+                    rocket_engine.cash_out(user_id)
+                elif message_type == "ping":
+                    await websocket.send_json({
+                        "type": "pong",
+                        "timestamp": datetime.now().isoformat()
+                    })
+                else:
+                    logger.warning(f"نوع رسالة غير معروف من اتصال الصاروخ: {message_type}")
+            
+            except (json.JSONDecodeError, TypeError, ValueError):
+                logger.warning(f"تم استلام رسالة غير صالحة من المستخدم {user_id} في لعبة الصاروخ")
+    
+    except WebSocketDisconnect:
+        logger.info(f"انقطع اتصال المستخدم {user_id} بجولات صاروخ مصر")
+    
+    except Exception as e:
+        logger.error(f"حدث خطأ في اتصال الصاروخ للمستخدم {user_id}: {str(e)}")
+    
+    finally:
+        rocket_engine.unsubscribe(websocket)
+        traffic_recorder.close(capture_id)
+
+
+@app.websocket("/ws/{user_id:int}")
 async def websocket_endpoint(websocket: WebSocket, user_id: int):
     """نقطة نهاية WebSocket للاتصال المستمر"""
+    if drain_controller.draining:
+        await websocket.close(code=SERVICE_RESTART_CLOSE_CODE)
+        return
+    
     await websocket.accept()
+    capture_id = traffic_recorder.open(websocket.url.path)
     
     # إضافة الاتصال إلى القاموس
     if user_id not in active_connections:
@@ -282,12 +1246,14 @@ async def websocket_endpoint(websocket: WebSocket, user_id: int):
             await websocket.send_json(message)
         # مسح التحديثات المؤقتة بعد إرسالها
         user_updates[user_id] = []
+        snapshot_store.mark_user_updates_reset(user_id)
     
     # استمرار في الاستماع للرسائل
     try:
         while True:
             # انتظار رسائل من العميل
             data = await websocket.receive_text()
+            traffic_recorder.frame(capture_id, data)
             
             try:
                 message = json.loads(data)
@@ -350,12 +1316,20 @@ async def websocket_endpoint(websocket: WebSocket, user_id: int):
     
     except Exception as e:
         logger.error(f"حدث خطأ في اتصال المستخدم {user_id}: {str(e)}")
+    
+    finally:
+        traffic_recorder.close(capture_id)
 
 
 @app.websocket("/ws/poker")
 async def poker_websocket_endpoint(websocket: WebSocket):
     """نقطة نهاية WebSocket للعبة البوكر"""
+    if drain_controller.draining:
+        await websocket.close(code=SERVICE_RESTART_CLOSE_CODE)
+        return
+    
     await websocket.accept()
+    capture_id = traffic_recorder.open(websocket.url.path)
     logger.info("اتصال WebSocket جديد للعبة البوكر")
     
     # إرسال رسالة ترحيب
@@ -367,11 +1341,13 @@ async def poker_websocket_endpoint(websocket: WebSocket):
     
     player_id = None
     table_id = None
+    spectating_table = None
     
     try:
         while True:
             # انتظار رسائل من العميل
             data = await websocket.receive_text()
+            traffic_recorder.frame(capture_id, data)
             
             try:
                 message = json.loads(data)
@@ -379,6 +1355,17 @@ async def poker_websocket_endpoint(websocket: WebSocket):
                 
                 message_type = message.get("type")
                 
+                # توجيه اتصالات الطاولات المملوكة لعملية أخرى (الاستئناف يُوجَّه بالطاولة المضمّنة في رمزه)
+                route_table_id = message.get("tableId")
+                if message_type == "resume_session":
+                    token_table_id = table_id_from_token(message.get("resumeToken"))
+                    if token_table_id is not None:
+                        route_table_id = token_table_id
+                if message_type in ("join_table", "spectate_table", "resume_session") and await _route_to_shard(
+                    websocket, route_table_id, data
+                ):
+                    raise WebSocketDisconnect(SHARD_REDIRECT_CLOSE_CODE)
+                
                 # معالجة الرسالة حسب نوعها
                 if message_type == "ping":
                     # رد على نبض الحياة
@@ -401,53 +1388,97 @@ async def poker_websocket_endpoint(websocket: WebSocket):
                         })
                         continue
                     
-                    # إضافة الاتصال إلى قواميس البوكر
-                    if table_id not in poker_connections:
-                        poker_connections[table_id] = []
-                    poker_connections[table_id].append(websocket)
+                    seat_sessions.release(player_id)
+                    await seat_player(table_id, player_id, player_info, websocket)
+                    
+                    # رمز الاستئناف للعودة إلى المقعد بعد انقطاع الاتصال
+                    resume_token = seat_sessions.issue(table_id, poker_tables[table_id], player_id)
+                    table_changed(table_id)
+                    await websocket.send_json({
+                        "type": "session_created",
+                        "tableId": table_id,
+                        "resumeToken": resume_token,
+                        "graceSeconds": seat_sessions.grace_period,
+                        "seq": table_events.last_seq(table_id),
+                        "epoch": table_events.epoch,
+                        "timestamp": datetime.now().isoformat()
+                    })
+                    await send_chat_history(table_id, websocket)
+                
+                elif message_type == "resume_session":
+                    # استئناف جلسة بعد انقطاع الاتصال دون إعادة الانضمام
+                    session = seat_sessions.lookup(message.get("resumeToken", ""))
+                    if session is None or session[0] not in poker_tables or session[1] not in poker_tables[session[0]]["players"]:
+                        await websocket.send_json({
+                            "type": "session_expired",
+                            "message": "انتهت الجلسة، يرجى الانضمام إلى الطاولة من جديد",
+                            "timestamp": datetime.now().isoformat()
+                        })
+                        continue
+                    
+                    table_id, player_id = session
+                    # التحقق من رقم آخر حدث قبل إلغاء حجز المقعد (رقم غير صالح = إرسال الحالة كاملة)
+                    try:
+                        last_seq = int(message.get("lastSeq"))
+                    except (TypeError, ValueError):
+                        last_seq = None
+                    seat_sessions.release(player_id)
                     
-                    # ربط اللاعب بالاتصال والطاولة
+                    # استبدال الاتصال القديم إن كان ما زال مسجلاً (اتصال نصف مفتوح)
+                    old_connection = player_connection_map.get(player_id, {}).get("connection")
+                    connections = poker_connections.setdefault(table_id, [])
+                    if old_connection is not None and old_connection is not websocket and old_connection in connections:
+                        connections.remove(old_connection)
+                    if websocket not in connections:
+                        connections.append(websocket)
                     player_connection_map[player_id] = {
                         "connection": websocket,
                         "table_id": table_id,
-                        "info": player_info
+                        "info": poker_tables[table_id]["players"][player_id]
                     }
                     
-                    # إضافة اللاعب إلى الطاولة
-                    if table_id not in poker_tables:
-                        poker_tables[table_id] = {
-                            "players": {},
-                            "game_state": {
-                                "phase": "waiting",
-                                "pot": 0,
-                                "community_cards": [],
-                                "current_player": None,
-                                "dealer_position": 0,
-                                "blind_amount": player_info.get("blindAmount", 10),
-                                "min_bet": player_info.get("blindAmount", 10) * 2
-                            }
-                        }
-                    
-                    poker_tables[table_id]["players"][player_id] = player_info
-                    
-                    # إعلام جميع اللاعبين في الطاولة بالانضمام
-                    await broadcast_to_table(table_id, {
-                        "type": "player_joined",
-                        "data": player_info,
-                        "tableId": table_id,
-                        "timestamp": datetime.now().isoformat()
-                    })
-                    
-                    # إرسال حالة اللعبة الحالية للاعب المنضم
+                    missed = (
+                        table_events.since(table_id, last_seq, message.get("epoch"))
+                        if last_seq is not None else None
+                    )
                     await websocket.send_json({
-                        "type": "game_state",
+                        "type": "session_resumed",
                         "tableId": table_id,
-                        "data": poker_tables[table_id]["game_state"],
-                        "players": poker_tables[table_id]["players"],
+                        "playerId": player_id,
+                        "replayed": len(missed) if missed is not None else 0,
+                        "seq": table_events.last_seq(table_id),
+                        "epoch": table_events.epoch,
                         "timestamp": datetime.now().isoformat()
                     })
+                    if missed is None:
+                        # السجل لا يغطي ما فات: إرسال الحالة كاملة
+                        await send_table_state(table_id, websocket)
+                    else:
+                        for text in missed:
+                            await websocket.send_text(text)
+                    await send_chat_history(table_id, websocket)
                     
-                    logger.info(f"انضم اللاعب {player_id} إلى طاولة البوكر {table_id}")
+                    logger.info(f"استأنف اللاعب {player_id} جلسته في طاولة البوكر {table_id}")
+                
+                elif message_type == "spectate_table":
+                    # مشاهدة طاولة دون الجلوس: يستلم المشاهد الإطار العام فقط
+                    spectate_id = message.get("tableId")
+                    if not spectate_id or spectate_id not in poker_tables:
+                        await websocket.send_json({
+                            "type": "error",
+                            "message": "الطاولة غير موجودة",
+                            "timestamp": datetime.now().isoformat()
+                        })
+                        continue
+                    
+                    if spectate_id not in poker_connections:
+                        poker_connections[spectate_id] = []
+                    if websocket not in poker_connections[spectate_id]:
+                        poker_connections[spectate_id].append(websocket)
+                    spectating_table = spectate_id
+                    
+                    await websocket.send_text(table_views.public_frame(spectate_id, poker_tables[spectate_id]))
+                    await send_chat_history(spectate_id, websocket)
                 
                 elif message_type == "leave_table":
                     # مغادرة طاولة البوكر
@@ -455,23 +1486,31 @@ async def poker_websocket_endpoint(websocket: WebSocket):
                         table_data = player_connection_map[player_id]
                         table_id = table_data.get("table_id")
                         
-                        if table_id and table_id in poker_tables and player_id in poker_tables[table_id]["players"]:
+                        if table_id:
                             # إزالة اللاعب من الطاولة
-                            del poker_tables[table_id]["players"][player_id]
-                            
-                            # إعلام جميع اللاعبين في الطاولة بالمغادرة
-                            await broadcast_to_table(table_id, {
-                                "type": "player_left",
-                                "playerId": player_id,
-                                "tableId": table_id,
-                                "timestamp": datetime.now().isoformat()
-                            })
-                            
-                            logger.info(f"غادر اللاعب {player_id} طاولة البوكر {table_id}")
+                            seat_sessions.revoke(table_id, poker_tables.get(table_id), player_id)
+                            await unseat_player(table_id, player_id)
                         
                         # إزالة اللاعب من خريطة الاتصالات
                         del player_connection_map[player_id]
                 
+                elif message_type == "start_hand":
+                    # بدء يد جديدة (من لاعب جالس فقط)
+                    if not player_id or not table_id or player_id not in poker_tables.get(table_id, {}).get("players", {}):
+                        await websocket.send_json({
+                            "type": "error",
+                            "message": "يجب الانضمام إلى طاولة أولاً",
+                            "timestamp": datetime.now().isoformat()
+                        })
+                        continue
+                    
+                    if not await start_hand(table_id):
+                        await websocket.send_json({
+                            "type": "error",
+                            "message": "يلزم لاعبان على الأقل لبدء يد جديدة",
+                            "timestamp": datetime.now().isoformat()
+                        })
+                
                 elif message_type == "player_action":
                     # إجراء اللاعب (مثل المراهنة، الطي، إلخ)
                     if not player_id or not table_id:
@@ -485,21 +1524,7 @@ async def poker_websocket_endpoint(websocket: WebSocket):
                     action = message.get("action")
                     amount = message.get("amount", 0)
                     
-                    if table_id in poker_tables:
-                        # تحديث حالة اللعبة (هنا سيكون المنطق الكامل للعبة البوكر)
-                        # لأغراض هذا المثال، نقوم فقط بإعادة توجيه الإجراء إلى جميع اللاعبين
-                        
-                        # إعلام جميع اللاعبين في الطاولة بالإجراء
-                        await broadcast_to_table(table_id, {
-                            "type": "action_result",
-                            "playerId": player_id,
-                            "action": action,
-                            "amount": amount,
-                            "tableId": table_id,
-                            "timestamp": datetime.now().isoformat()
-                        })
-                        
-                        logger.info(f"قام اللاعب {player_id} بإجراء {action} بمبلغ {amount} في طاولة {table_id}")
+                    await apply_player_action(table_id, player_id, action, amount)
                 
                 elif message_type == "chat_message":
                     # رسالة دردشة
@@ -511,25 +1536,27 @@ async def poker_websocket_endpoint(websocket: WebSocket):
                         })
                         continue
                     
-                    message_text = message.get("message", "")
-                    
-                    if table_id in poker_connections:
-                        # إرسال رسالة الدردشة إلى جميع اللاعبين في الطاولة
-                        player_name = "مجهول"
-                        if player_id in player_connection_map:
-                            player_info = player_connection_map[player_id].get("info", {})
-                            player_name = player_info.get("username", player_id)
-                        
-                        await broadcast_to_table(table_id, {
-                            "type": "chat_message",
-                            "senderId": player_id,
-                            "senderName": player_name,
-                            "message": message_text,
-                            "tableId": table_id,
+                    retry_after = table_chat.allow(player_id)
+                    if retry_after:
+                        await websocket.send_json({
+                            "type": "chat_throttled",
+                            "message": "ترسل الرسائل بسرعة كبيرة، يرجى الانتظار قليلاً",
+                            "retryAfterMs": int(retry_after * 1000),
                             "timestamp": datetime.now().isoformat()
                         })
-                        
-                        logger.info(f"رسالة دردشة من اللاعب {player_id} في طاولة {table_id}: {message_text}")
+                        continue
+                    
+                    player_name = "مجهول"
+                    if player_id in player_connection_map:
+                        player_info = player_connection_map[player_id].get("info", {})
+                        player_name = player_info.get("username", player_id)
+                    
+                    chat = table_chat.prepare(table_id, player_id, player_name, message.get("message", ""))
+                    if chat is not None:
+                        # الدردشة تُرسل عبر طابور الطاولة الخاص بها وخارج سجل أحداث اللعبة المرقمة
+                        table_chat.publish(table_id, chat, lambda t: poker_connections.get(t, []))
+                        if hand_history_enabled:
+                            hand_history.record(table_id, chat, poker_tables.get(table_id, {}).get("game_state", {}).get("hand_number", 0))
                 
                 else:
                     # رسائل أخرى غير معروفة
@@ -550,7 +1577,15 @@ async def poker_websocket_endpoint(websocket: WebSocket):
     
     except WebSocketDisconnect:
         # تنظيف عند قطع الاتصال
-        if player_id and player_id in player_connection_map:
+        if spectating_table in poker_connections and websocket in poker_connections[spectating_table]:
+            poker_connections[spectating_table].remove(websocket)
+        
+        # إذا استأنف اللاعب جلسته من اتصال آخر فذلك الاتصال هو المسؤول عن المقعد الآن
+        if (
+            player_id
+            and player_id in player_connection_map
+            and player_connection_map[player_id].get("connection") is websocket
+        ):
             table_data = player_connection_map[player_id]
             table_id = table_data.get("table_id")
             
@@ -559,17 +1594,16 @@ async def poker_websocket_endpoint(websocket: WebSocket):
                 if table_id in poker_connections and websocket in poker_connections[table_id]:
                     poker_connections[table_id].remove(websocket)
                 
-                # إزالة اللاعب من الطاولة
-                if table_id in poker_tables and player_id in poker_tables[table_id]["players"]:
-                    del poker_tables[table_id]["players"][player_id]
-                    
-                    # إعلام جميع اللاعبين في الطاولة بالمغادرة
-                    await broadcast_to_table(table_id, {
-                        "type": "player_left",
-                        "playerId": player_id,
-                        "tableId": table_id,
-                        "timestamp": datetime.now().isoformat()
-                    })
+                # إزالة اللاعب من الطاولة (إلا أثناء التصريف حتى تنتقل المقاعد للعملية الجديدة)
+                if not drain_controller.draining:
+                    if seat_sessions.grace_period > 0 and table_id in poker_tables:
+                        # حجز المقعد مدة السماح دون بث player_left
+                        table_data["connection"] = None
+                        seat_sessions.hold(player_id, lambda t=table_id, p=player_id: _expire_seat(t, p))
+                        logger.info(f"انقطع اتصال لاعب البوكر {player_id}، المقعد محجوز {seat_sessions.grace_period} ثانية")
+                        return
+                    seat_sessions.revoke(table_id, poker_tables.get(table_id), player_id)
+                    await unseat_player(table_id, player_id)
             
             # إزالة اللاعب من خريطة الاتصالات
             del player_connection_map[player_id]
@@ -580,19 +1614,17 @@ async def poker_websocket_endpoint(websocket: WebSocket):
         logger.error(f"حدث خطأ في اتصال البوكر: {str(e)}")
         if player_id and player_id in player_connection_map:
             del player_connection_map[player_id]
+    
+    finally:
+        traffic_recorder.close(capture_id)
 
 
 # وظيفة لبدء الخادم
 def start_realtime_server(host="0.0.0.0", port=3001, log_level="info"):
-    """بدء تشغيل خادم التحديثات الفورية"""
+    """بدء تشغيل خادم التحديثات الفورية عبر نقطة التشغيل الموحدة"""
     try:
-        uvicorn.run(
-            "python.realtime_server:app",
-            host=host,
-            port=port,
-            log_level=log_level,
-            reload=False  # تعطيل إعادة التحميل التلقائي في بيئة الإنتاج
-        )
+        from python.launcher import main
+        main(["--host", host, "--port", str(port), "--log-level", log_level])
     except Exception as e:
         logger.error(f"فشل في بدء خادم التحديثات الفورية: {str(e)}")
 
@@ -0,0 +1,528 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+صاروخ مصر - محرك جولات اللعبة
+==========================
+هذا الملف يدير جولات لعبة صاروخ مصر على خادم التحديثات الفورية:
+
+- سلسلة تجزئة (hash chain) محسوبة مسبقاً تحدد نقطة الانفجار لكل جولة بشكل قابل للتحقق
+- مجدول واحد يحسب المضاعف 20 مرة في الثانية ويُسلسل إطار التحديث مرة واحدة لكل نبضة
+  ثم يسلمه لجميع المشتركين (العميل البطيء يتخطى الإطارات القديمة ولا يؤخر الآخرين)
+- طلبات الرهان تُجمع وتُخصم مبالغها من الرصيد دفعة واحدة في كل نبضة، ثم تُبث مع طلبات السحب
+"""
+
+import os
+import hmac
+import json
+import math
+import time
+import asyncio
+import hashlib
+import logging
+import secrets
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Set
+
+logger = logging.getLogger("rocket_engine")
+
+# ثوابت منحنى المضاعف (نفس معادلة الواجهة: 1.05 ^ (الثواني × 10))
+GROWTH_BASE = 1.05
+GROWTH_STEPS_PER_SECOND = 10
+
+# احتمال الانفجار الفوري عند 1.00 (ميزة الخادم)
+INSTANT_CRASH_MODULUS = 33
+
+# الحد الأقصى للإطارات المهمة المعلقة قبل فصل المشترك البطيء
+MAX_RELIABLE_BACKLOG = 500
+
+
+def crash_point_from_hash(game_hash: str, salt: str, max_multiplier: float = 1000.0) -> float:
+    """حساب نقطة الانفجار من تجزئة الجولة بطريقة قابلة للتحقق"""
+    digest = hmac.new(game_hash.encode("utf-8"), salt.encode("utf-8"), hashlib.sha256).hexdigest()
+    h = int(digest[:13], 16)
+    e = 2 ** 52
+    if h % INSTANT_CRASH_MODULUS == 0:
+        return 1.0
+    point = math.floor((100 * e - h) / (e - h)) / 100.0
+    return min(max(point, 1.0), max_multiplier)
+
+
+def multiplier_at(elapsed: float) -> float:
+    """المضاعف بعد عدد معين من الثواني منذ الإقلاع"""
+    return GROWTH_BASE ** (elapsed * GROWTH_STEPS_PER_SECOND)
+
+
+def verify_chain_link(game_hash: str, next_hash: str) -> bool:
+    """التحقق من أن تجزئة الجولة هي أصل تجزئة الجولة التي سبقتها في السلسلة"""
+    return hashlib.sha256(game_hash.encode("utf-8")).hexdigest() == next_hash
+
+
+class HashChain:
+    """سلسلة تجزئة محسوبة مسبقاً تُستهلك من نهايتها"""
+
+    def __init__(self, length: int = 10000, seed: Optional[str] = None):
+        seed = seed or secrets.token_hex(32)
+        chain = [seed]
+        for _ in range(length - 1):
+            chain.append(hashlib.sha256(chain[-1].encode("utf-8")).hexdigest())
+
+        # آخر تجزئة هي الالتزام المعلن ولا تُستخدم لجولة
+        self.commitment = chain.pop()
+        self._chain = chain
+
+    def __len__(self) -> int:
+        return len(self._chain)
+
+    def next_hash(self) -> str:
+        """تجزئة الجولة التالية (تجزئتها تساوي تجزئة الجولة السابقة)"""
+        return self._chain.pop()
+
+
+class _Subscriber:
+    """مشترك في بث الجولات مع صندوق لآخر إطار نبضة وطابور للإطارات المهمة"""
+
+    __slots__ = ("websocket", "user_id", "tick_frame", "reliable", "wakeup", "task")
+
+    def __init__(self, websocket: Any, user_id: int):
+        self.websocket = websocket
+        self.user_id = user_id
+        self.tick_frame: Optional[str] = None
+        self.reliable: Deque[str] = deque()
+        self.wakeup = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+
+
+class RocketRoundEngine:
+    """محرك جولات صاروخ مصر"""
+
+    def __init__(
+        self,
+        tick_rate: int = 20,
+        betting_seconds: float = 10.0,
+        crashed_seconds: float = 5.0,
+        chain_length: int = 10000,
+        seed: Optional[str] = None,
+        salt: str = "egypt-rocket",
+        max_multiplier: float = 1000.0,
+        min_bet: int = 10,
+        max_bet: int = 1000000,
+    ):
+        self.tick_interval = 1.0 / tick_rate
+        self.betting_seconds = betting_seconds
+        self.crashed_seconds = crashed_seconds
+        self.chain_length = chain_length
+        self.salt = salt
+        self.max_multiplier = max_multiplier
+        self.min_bet = min_bet
+        self.max_bet = max_bet
+
+        # السلسلة تُحسب عند بدء أول جولة وليس عند إنشاء المحرك
+        self.chain: Optional[HashChain] = None
+        self._seed = seed
+
+        self.round_id = 0
+        self.phase = "waiting"
+        self.game_hash: Optional[str] = None
+        # معرف عشوائي للجولة لمفاتيح الرهانات: تجزئة الجولة تكشف نقطة الانفجار فلا تُرسل قبله
+        self.round_key: Optional[str] = None
+        self.crash_point = 1.0
+        self.multiplier = 1.0
+        self._phase_started = 0.0
+
+        # الرهانات الحالية {user_id: {amount, auto_cashout, cashed_out_at}}
+        self.bets: Dict[int, Dict[str, Any]] = {}
+        self.history: Deque[Dict[str, Any]] = deque(maxlen=20)
+
+        # الرهانات المقبولة وطلبات السحب الواردة بين النبضات
+        self._pending_bets: List[Dict[str, Any]] = []
+        self._pending_cashouts: List[int] = []
+        # المستخدمون الذين يجري خصم مبلغ رهانهم الآن
+        self._reserving: Set[int] = set()
+        # طلبات الرهان المنتظرة للخصم، ودفعة الخصم الجارية (دفعة واحدة في كل مرة)
+        self._bet_requests: List[Dict[str, Any]] = []
+        self._debit_task: Optional[asyncio.Task] = None
+        self._bet_handler: Optional[Callable[[str, List[Dict[str, Any]]], Awaitable[None]]] = None
+
+        self._subscribers: Dict[int, _Subscriber] = {}
+        self._settle_handlers: List[Callable[[Dict[str, Any], List[Dict[str, Any]]], Awaitable[None]]] = []
+
+    @classmethod
+    def from_env(cls) -> "RocketRoundEngine":
+        """إنشاء المحرك من متغيرات البيئة"""
+        return cls(
+            tick_rate=int(os.environ.get("ROCKET_TICK_RATE", 20)),
+            betting_seconds=float(os.environ.get("ROCKET_BETTING_SECONDS", 10)),
+            crashed_seconds=float(os.environ.get("ROCKET_CRASHED_SECONDS", 5)),
+            chain_length=int(os.environ.get("ROCKET_CHAIN_LENGTH", 10000)),
+            seed=os.environ.get("ROCKET_SEED"),
+            salt=os.environ.get("ROCKET_SALT", "egypt-rocket"),
+            max_multiplier=float(os.environ.get("ROCKET_MAX_MULTIPLIER", 1000)),
+        )
+
+    def add_settle_handler(self, handler: Callable[[Dict[str, Any], List[Dict[str, Any]]], Awaitable[None]]):
+        """تسجيل دالة تستلم نتائج الجولة بعد الانفجار"""
+        self._settle_handlers.append(handler)
+
+    def set_bet_handler(self, handler: Callable[[str, List[Dict[str, Any]]], Awaitable[None]]):
+        """تسجيل دالة تخصم دفعة طلبات الرهان (معرف الجولة، الطلبات) ثم تسجلها بـ place_bet"""
+        self._bet_handler = handler
+
+    # الاشتراك
+    def subscribe(self, websocket: Any, user_id: int) -> _Subscriber:
+        """إضافة مشترك وبدء مهمة الإرسال الخاصة به"""
+        self.unsubscribe(websocket)
+        subscriber = _Subscriber(websocket, user_id)
+        subscriber.reliable.append(self._encode(self.snapshot()))
+        subscriber.wakeup.set()
+        subscriber.task = asyncio.create_task(self._writer(subscriber))
+        self._subscribers[id(websocket)] = subscriber
+        return subscriber
+
+    def unsubscribe(self, websocket: Any):
+        """إزالة مشترك وإيقاف مهمة الإرسال الخاصة به"""
+        subscriber = self._subscribers.pop(id(websocket), None)
+        if subscriber and subscriber.task:
+            subscriber.task.cancel()
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._subscribers)
+
+    def connections(self) -> List[Any]:
+        """اتصالات جميع المشتركين"""
+        return [subscriber.websocket for subscriber in self._subscribers.values()]
+
+    async def _writer(self, subscriber: _Subscriber):
+        """إرسال الإطارات لمشترك واحد: الإطارات المهمة بالترتيب ثم آخر نبضة فقط"""
+        websocket = subscriber.websocket
+        try:
+            while True:
+                await subscriber.wakeup.wait()
+                subscriber.wakeup.clear()
+                while subscriber.reliable:
+                    await websocket.send_text(subscriber.reliable.popleft())
+                frame, subscriber.tick_frame = subscriber.tick_frame, None
+                if frame is not None:
+                    await websocket.send_text(frame)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            self._subscribers.pop(id(websocket), None)
+
+    def _publish_tick(self, frame: str):
+        """تسليم إطار النبضة لجميع المشتركين (يستبدل الإطار غير المرسل)"""
+        for subscriber in self._subscribers.values():
+            subscriber.tick_frame = frame
+            subscriber.wakeup.set()
+
+    def _publish_reliable(self, frame: str):
+        """تسليم إطار مهم لجميع المشتركين دون إسقاطه"""
+        stalled = []
+        for key, subscriber in self._subscribers.items():
+            if len(subscriber.reliable) >= MAX_RELIABLE_BACKLOG:
+                stalled.append(key)
+                continue
+            subscriber.reliable.append(frame)
+            subscriber.wakeup.set()
+
+        for key in stalled:
+            subscriber = self._subscribers.pop(key)
+            if subscriber.task:
+                subscriber.task.cancel()
+            logger.warning(f"تم فصل المستخدم {subscriber.user_id} من بث الصاروخ لبطء الاستقبال")
+
+    def notify_user(self, user_id: int, message: Dict[str, Any]):
+        """إرسال رد خاص لمستخدم مشترك"""
+        frame = self._encode(message)
+        for subscriber in self._subscribers.values():
+            if subscriber.user_id == user_id:
+                subscriber.reliable.append(frame)
+                subscriber.wakeup.set()
+
+    @staticmethod
+    def _encode(message: Dict[str, Any]) -> str:
+        return json.dumps(message, ensure_ascii=False, separators=(",", ":"))
+
+    # استقبال الطلبات
+    def validate_bet(self, user_id: int, amount: Any) -> Optional[str]:
+        """سبب رفض الرهان أو None إذا كان مقبولاً في المرحلة الحالية"""
+        if self.phase != "waiting":
+            return "لا يمكن المراهنة بعد إقلاع الصاروخ"
+        if user_id in self.bets or user_id in self._reserving:
+            return "لديك رهان بالفعل في هذه الجولة"
+        if type(amount) is not int or amount < self.min_bet or amount > self.max_bet:
+            return "مبلغ الرهان غير صالح"
+        return None
+
+    def reserve_bet(self, user_id: int, amount: Any) -> Optional[str]:
+        """حجز مكان الرهان أثناء خصم المبلغ من الرصيد (يمنع رهانين متزامنين لنفس المستخدم)"""
+        error = self.validate_bet(user_id, amount)
+        if error is None:
+            self._reserving.add(user_id)
+        return error
+
+    def release_bet(self, user_id: int):
+        self._reserving.discard(user_id)
+
+    def request_bet(self, user_id: int, amount: Any, auto_cashout: Optional[float]) -> Optional[str]:
+        """إضافة طلب رهان إلى دفعة الخصم التالية (يُرجع سبب الرفض الفوري إن وُجد)"""
+        if self._bet_handler is None:
+            return "المراهنة غير متاحة حالياً"
+        error = self.reserve_bet(user_id, amount)
+        if error is None:
+            self._bet_requests.append({"userId": user_id, "amount": amount, "autoCashout": auto_cashout})
+        return error
+
+    def bet_key(self, user_id: int, round_key: Optional[str] = None) -> str:
+        """مفتاح عدم تكرار خصم رهان المستخدم في الجولة (لا يحتوي على تجزئة الجولة)"""
+        return f"egypt_rocket:{round_key or self.round_key}:{user_id}:bet"
+
+    def place_bet(self, user_id: int, amount: int, auto_cashout: Optional[float], round_key: Optional[str]) -> Optional[str]:
+        """تسجيل رهان خُصم مبلغه بالفعل (يُرجع سبب الرفض إذا تغيرت الجولة أثناء الخصم)"""
+        self._reserving.discard(user_id)
+        if round_key != self.round_key:
+            return "انتهت مرحلة المراهنة في هذه الجولة"
+        error = self.validate_bet(user_id, amount)
+        if error:
+            return error
+
+        if auto_cashout is not None and auto_cashout <= 1.0:
+            auto_cashout = None
+        self.bets[user_id] = {"amount": amount, "auto_cashout": auto_cashout, "cashed_out_at": None}
+        self._pending_bets.append({"userId": user_id, "amount": amount})
+        return None
+
+    def cash_out(self, user_id: int):
+        self._pending_cashouts.append(user_id)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """حالة الجولة الحالية للمشتركين الجدد"""
+        return {
+            "type": "rocket_state",
+            "round": self.round_id,
+            "phase": self.phase,
+            "multiplier": round(self.multiplier, 2),
+            "commitment": self.chain.commitment if self.chain else None,
+            "bets": [
+                {"userId": user_id, "amount": bet["amount"], "cashedOutAt": bet["cashed_out_at"]}
+                for user_id, bet in self.bets.items()
+            ],
+            "history": list(self.history),
+            "timestamp": time.time(),
+        }
+
+    # منطق الجولة
+    def _start_round(self, now: float):
+        if self.chain is None:
+            self.chain = HashChain(self.chain_length, self._seed)
+            logger.info(f"التزام سلسلة جولات الصاروخ: {self.chain.commitment}")
+        elif not len(self.chain):
+            self.chain = HashChain(self.chain_length)
+            logger.info(f"انتهت سلسلة التجزئة، الالتزام الجديد: {self.chain.commitment}")
+
+        self.round_id += 1
+        self.phase = "waiting"
+        self.game_hash = self.chain.next_hash()
+        self.round_key = secrets.token_hex(8)
+        self.crash_point = crash_point_from_hash(self.game_hash, self.salt, self.max_multiplier)
+        self.multiplier = 1.0
+        self.bets = {}
+        self._phase_started = now
+
+        self._publish_reliable(self._encode({
+            "type": "rocket_round_start",
+            "round": self.round_id,
+            "bettingMs": int(self.betting_seconds * 1000),
+            "timestamp": time.time(),
+        }))
+
+    def _process_bets(self, tick_bets: List[Dict[str, Any]]):
+        tick_bets.extend(self._pending_bets)
+        self._pending_bets = []
+
+        if self._bet_requests and self.phase != "waiting":
+            # انتهت مرحلة المراهنة قبل خصم الطلبات: تُرفض دون خصم
+            for request in self._bet_requests:
+                self._reserving.discard(request["userId"])
+                self.notify_user(request["userId"], {
+                    "type": "error",
+                    "message": "لا يمكن المراهنة بعد إقلاع الصاروخ",
+                    "timestamp": time.time(),
+                })
+            self._bet_requests = []
+
+        # طلبات هذه النبضة تُخصم معاً، وما يصل أثناء دفعة جارية ينتظر الدفعة التالية
+        if self._bet_requests and (self._debit_task is None or self._debit_task.done()):
+            requests, self._bet_requests = self._bet_requests, []
+            self._debit_task = asyncio.create_task(self._debit_bets(self.round_key, requests))
+
+    async def _debit_bets(self, round_key: str, requests: List[Dict[str, Any]]):
+        try:
+            await self._bet_handler(round_key, requests)
+        except Exception as e:
+            logger.error(f"تعذر خصم دفعة رهانات الصاروخ: {str(e)}")
+            for request in requests:
+                if request["userId"] in self._reserving:
+                    self.notify_user(request["userId"], {
+                        "type": "error",
+                        "message": "تعذر تسجيل الرهان",
+                        "timestamp": time.time(),
+                    })
+        finally:
+            for request in requests:
+                self._reserving.discard(request["userId"])
+
+    def _process_cashouts(self, tick_cashouts: List[Dict[str, Any]]):
+        pending, self._pending_cashouts = self._pending_cashouts, []
+        if self.phase != "flying":
+            return
+
+        for user_id in pending:
+            bet = self.bets.get(user_id)
+            if bet and bet["cashed_out_at"] is None:
+                bet["cashed_out_at"] = round(self.multiplier, 2)
+                tick_cashouts.append({"userId": user_id, "multiplier": bet["cashed_out_at"]})
+
+        # السحب التلقائي
+        for user_id, bet in self.bets.items():
+            if bet["cashed_out_at"] is None and bet["auto_cashout"] and self.multiplier >= bet["auto_cashout"]:
+                bet["cashed_out_at"] = bet["auto_cashout"]
+                tick_cashouts.append({"userId": user_id, "multiplier": bet["cashed_out_at"]})
+
+    async def _crash(self, now: float, cashouts: Optional[List[Dict[str, Any]]] = None):
+        self.phase = "crashed"
+        self.multiplier = self.crash_point
+        self._phase_started = now
+
+        results = []
+        for user_id, bet in self.bets.items():
+            cashed_out_at = bet["cashed_out_at"]
+            win_amount = int(bet["amount"] * cashed_out_at) if cashed_out_at else 0
+            results.append({
+                "userId": user_id,
+                "betAmount": bet["amount"],
+                "winAmount": win_amount,
+                "multiplier": cashed_out_at or 0,
+                "gameResult": "cashed_out" if cashed_out_at else "rocket_crashed",
+            })
+
+        round_info = {
+            "round": self.round_id,
+            "crashPoint": self.crash_point,
+            "hash": self.game_hash,
+        }
+        self.history.appendleft(round_info)
+        crashed: Dict[str, Any] = {"type": "rocket_crashed", **round_info, "timestamp": time.time()}
+        if cashouts:
+            crashed["cashouts"] = cashouts
+        self._publish_reliable(self._encode(crashed))
+
+        for handler in self._settle_handlers:
+            try:
+                await handler(round_info, results)
+            except Exception as e:
+                logger.error(f"خطأ أثناء تسوية جولة الصاروخ {self.round_id}: {str(e)}")
+
+    async def tick(self, now: float):
+        """نبضة واحدة: معالجة الطلبات المجمعة، تحديث المضاعف، وبث إطار واحد"""
+        tick_bets: List[Dict[str, Any]] = []
+        tick_cashouts: List[Dict[str, Any]] = []
+
+        if self.phase == "waiting":
+            self._process_bets(tick_bets)
+            if now - self._phase_started >= self.betting_seconds:
+                self.phase = "flying"
+                self._phase_started = now
+                self._publish_reliable(self._encode({
+                    "type": "rocket_launch",
+                    "round": self.round_id,
+                    "timestamp": time.time(),
+                }))
+
+        elif self.phase == "flying":
+            self._process_bets(tick_bets)
+            self.multiplier = multiplier_at(now - self._phase_started)
+            if self.multiplier >= self.crash_point:
+                self._pending_cashouts.clear()
+                # النبضة تخطت نقطة الانفجار: السحب التلقائي الأقل منها يُدفع بقيمته المحددة
+                for user_id, bet in self.bets.items():
+                    if bet["cashed_out_at"] is None and bet["auto_cashout"] and bet["auto_cashout"] < self.crash_point:
+                        bet["cashed_out_at"] = bet["auto_cashout"]
+                        tick_cashouts.append({"userId": user_id, "multiplier": bet["cashed_out_at"]})
+                await self._crash(now, tick_cashouts)
+                return
+            self._process_cashouts(tick_cashouts)
+
+        elif self.phase == "crashed":
+            self._process_bets(tick_bets)
+            self._pending_cashouts.clear()
+            if now - self._phase_started >= self.crashed_seconds:
+                self._start_round(now)
+            return
+
+        if not self._subscribers:
+            return
+
+        frame: Dict[str, Any] = {
+            "type": "rocket_tick",
+            "round": self.round_id,
+            "phase": self.phase,
+            "m": round(self.multiplier, 2),
+        }
+        if tick_bets:
+            frame["bets"] = tick_bets
+        if tick_cashouts:
+            frame["cashouts"] = tick_cashouts
+
+        if tick_bets or tick_cashouts:
+            # الرهانات والسحوبات لا يجب أن تُسقط مع الإطارات القديمة
+            self._publish_reliable(self._encode(frame))
+        else:
+            self._publish_tick(self._encode(frame))
+
+    async def abort_round(self) -> List[Dict[str, Any]]:
+        """إنهاء الجولة الحالية دون انفجار بعد إيقاف run (عند تصريف الخادم)
+
+        ينتظر دفعة الخصم الجارية ويرفض الطلبات المنتظرة، ثم يُرجع رهانات الجولة غير المنتهية
+        مع المبلغ المستحق لكل منها: مبلغ الرهان، أو ربح السحب إذا سحب اللاعب قبل الإيقاف.
+        """
+        if self._debit_task is not None:
+            await asyncio.gather(self._debit_task, return_exceptions=True)
+        for request in self._bet_requests:
+            self._reserving.discard(request["userId"])
+        self._bet_requests = []
+
+        if self.phase in ("crashed", "stopped"):
+            return []
+        self.phase = "stopped"
+        bets, self.bets = self.bets, {}
+        return [
+            {
+                "userId": user_id,
+                "betAmount": bet["amount"],
+                "amount": int(bet["amount"] * bet["cashed_out_at"]) if bet["cashed_out_at"] else bet["amount"],
+                "multiplier": bet["cashed_out_at"] or 0,
+            }
+            for user_id, bet in bets.items()
+        ]
+
+    async def run(self):
+        """المجدول الوحيد لجميع الجولات مع تصحيح انحراف التوقيت"""
+        loop = asyncio.get_running_loop()
+        self._start_round(loop.time())
+        next_tick = loop.time()
+        while True:
+            now = loop.time()
+            try:
+                await self.tick(now)
+            except Exception as e:
+                logger.error(f"خطأ في نبضة محرك الصاروخ: {str(e)}")
+
+            next_tick += self.tick_interval
+            delay = next_tick - loop.time()
+            if delay < 0:
+                # تأخرنا أكثر من نبضة كاملة: نتخطى النبضات الفائتة بدلاً من تكديسها
+                next_tick = loop.time()
+                delay = 0
+            await asyncio.sleep(delay)
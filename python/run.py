@@ -4,54 +4,19 @@
 """
 صاروخ مصر - سكريبت التشغيل
 =========================
-هذا الملف يستخدم لتشغيل خادم التحديثات الفورية باستخدام FastAPI وWebSockets
+هذا الملف يستخدم لتشغيل خادم التحديثات الفورية عبر نقطة التشغيل الموحدة
 """
 
 import os
 import sys
-import time
-import threading
-import logging
-import subprocess
-import signal
-import uvicorn
-import traceback
 
-# استيراد محتويات الوحدة مباشرة إذا كانت متاحة
-from python.realtime_server import app as fast_api_app
+# إضافة المسار الرئيسي للمشروع إلى مسار Python
+current_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if current_dir not in sys.path:
+    sys.path.insert(0, current_dir)
 
-# إعداد التسجيل
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
-logger = logging.getLogger("python_runner")
-
-def start_realtime_server():
-    """بدء تشغيل خادم التحديثات الفورية بشكل مباشر"""
-    try:
-        logger.info("بدء تشغيل خادم التحديثات الفورية على المنفذ 3001...")
-        
-        # تكوين وتشغيل Uvicorn مباشرة
-        uvicorn.run(
-            fast_api_app,
-            host="0.0.0.0",
-            port=3001,
-            log_level="info"
-        )
-        
-        return True
-    except Exception as e:
-        error_traceback = traceback.format_exc()
-        logger.error(f"فشل في بدء تشغيل خادم التحديثات الفورية: {str(e)}\n{error_traceback}")
-        return False
+from python.launcher import main
 
 if __name__ == '__main__':
     """تشغيل نقطة الدخول الرئيسية"""
-    logger.info("بدء تشغيل خدمات Python...")
-    logger.info("يرجى استخدام start_realtime_server.py بدلاً من run.py")
-    
-    # توجيه المستخدم لاستخدام الملف الرئيسي
-    command = os.path.join(os.getcwd(), "start_realtime_server.py")
-    print(f"يرجى تشغيل الخادم باستخدام: python {command}")
-    sys.exit(0)
\ No newline at end of file
+    sys.exit(main())
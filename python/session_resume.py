@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+صاروخ مصر - استئناف جلسات مقاعد البوكر
+==================================
+هذا الملف يسمح للاعب الذي انقطع اتصاله (نفق، مصعد، تبديل شبكة) بالعودة إلى مقعده
+دون إعادة join_table ودون بث player_left / player_joined لبقية الطاولة.
+
+- رمز استئناف يُصدر عند الانضمام ويُحفظ مع الطاولة (فينتقل مع اللقطة عند إعادة التشغيل)
+- يُحجز المقعد لمدة سماح قابلة للضبط بعد الانقطاع، ثم يُقام اللاعب إذا لم يعد
+- لكل حدث في الطاولة رقم تسلسلي، وتُحفظ آخر الأحداث في سجل دائري حتى يُعاد للاعب
+  العائد ما فاته فقط بدلاً من إرسال الحالة كاملة
+- الأرقام التسلسلية تبدأ من جديد في كل عملية، لذلك تُرسل معها حقبة العملية (epoch) ويُرسل
+  للعميل الذي يعود بحقبة مختلفة الحالة كاملة
+"""
+
+import os
+import json
+import asyncio
+import logging
+import secrets
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+
+logger = logging.getLogger("session_resume")
+
+
+def table_id_from_token(token: Any) -> Optional[Any]:
+    """معرف الطاولة المضمّن في رمز الاستئناف (None للرموز القديمة أو التالفة)
+
+    يسمح بتوجيه resume_session للعملية المالكة دون أن يرسل العميل tableId.
+    """
+    if not isinstance(token, str) or "." not in token:
+        return None
+    try:
+        return json.loads(bytes.fromhex(token.split(".", 1)[0]).decode("utf-8"))
+    except ValueError:
+        return None
+
+
+class TableEventLog:
+    """ترقيم أحداث الطاولات وحفظ آخرها لإعادة إرسالها عند الاستئناف"""
+
+    def __init__(self, size: int = 256):
+        self.size = size
+        # حقبة العملية: تتغير مع كل تشغيل (بما في ذلك إعادة التشغيل المتدرج ونقل الطاولة)
+        self.epoch = secrets.token_hex(4)
+        self._seq: Dict[Any, int] = {}
+        self._events: Dict[Any, Deque[Tuple[int, str]]] = {}
+
+    def append(self, table_id: Any, message: Dict[str, Any]) -> str:
+        """إضافة رقم تسلسلي للحدث وحفظه، وإرجاعه مسلسلاً مرة واحدة لجميع المستلمين"""
+        seq = self._seq.get(table_id, 0) + 1
+        self._seq[table_id] = seq
+        message["seq"] = seq
+        text = json.dumps(message, ensure_ascii=False, separators=(",", ":"), default=str)
+        events = self._events.get(table_id)
+        if events is None:
+            events = self._events[table_id] = deque(maxlen=self.size)
+        events.append((seq, text))
+        return text
+
+    def last_seq(self, table_id: Any) -> int:
+        return self._seq.get(table_id, 0)
+
+    def since(self, table_id: Any, seq: int, epoch: Optional[str] = None) -> Optional[List[str]]:
+        """الأحداث بعد رقم تسلسلي (None إذا لم يعد السجل يغطيها أو كان الرقم من عملية أخرى)"""
+        if epoch != self.epoch:
+            return None
+        last = self._seq.get(table_id, 0)
+        if seq == last:
+            return []
+        events = self._events.get(table_id)
+        # رقم من عملية سابقة أو أقدم من السجل الدائري
+        if seq > last or not events or seq < events[0][0] - 1:
+            return None
+        return [text for event_seq, text in events if event_seq > seq]
+
+
+class SeatSessions:
+    """رموز الاستئناف وحجز المقاعد خلال مدة السماح"""
+
+    def __init__(self, grace_period: float = 30.0):
+        self.grace_period = grace_period
+        # {token: (table_id, player_id)}
+        self._tokens: Dict[str, Tuple[Any, str]] = {}
+        self._holds: Dict[str, asyncio.Task] = {}
+
+    @classmethod
+    def from_env(cls) -> "SeatSessions":
+        """إنشاء جلسات المقاعد من متغيرات البيئة"""
+        return cls(grace_period=float(os.environ.get("SEAT_GRACE_PERIOD", 30)))
+
+    def issue(self, table_id: Any, table: Dict[str, Any], player_id: str) -> str:
+        """إصدار رمز استئناف للاعب (يُحفظ في table["sessions"] ليبقى مع اللقطة)"""
+        sessions = table.setdefault("sessions", {})
+        old_token = sessions.get(player_id)
+        if old_token:
+            self._tokens.pop(old_token, None)
+        # بادئة الرمز معرف الطاولة (ترميز سداسي لمعرف JSON) حتى يُوجَّه الاستئناف دون حالة محلية
+        table_key = json.dumps(table_id, ensure_ascii=False).encode("utf-8").hex()
+        token = f"{table_key}.{secrets.token_urlsafe(24)}"
+        sessions[player_id] = token
+        self._tokens[token] = (table_id, player_id)
+        return token
+
+    def lookup(self, token: str) -> Optional[Tuple[Any, str]]:
+        return self._tokens.get(token)
+
+    def revoke(self, table_id: Any, table: Optional[Dict[str, Any]], player_id: str):
+        """إلغاء رمز اللاعب وأي حجز لمقعده (عند المغادرة أو انتهاء مدة السماح)"""
+        self.release(player_id)
+        token = table.get("sessions", {}).pop(player_id, None) if table else None
+        if token:
+            self._tokens.pop(token, None)
+
+    def hold(self, player_id: str, on_expire: Callable[[], Awaitable[None]]):
+        """حجز المقعد مدة السماح ثم استدعاء on_expire إذا لم يعد اللاعب"""
+        self.release(player_id)
+        self._holds[player_id] = asyncio.create_task(self._expire_later(player_id, on_expire))
+
+    async def _expire_later(self, player_id: str, on_expire: Callable[[], Awaitable[None]]):
+        try:
+            await asyncio.sleep(self.grace_period)
+        except asyncio.CancelledError:
+            return
+        self._holds.pop(player_id, None)
+        try:
+            await on_expire()
+        except Exception as e:
+            logger.error(f"خطأ عند انتهاء مدة حجز مقعد اللاعب {player_id}: {str(e)}")
+
+    def release(self, player_id: str) -> bool:
+        """إلغاء حجز المقعد عند عودة اللاعب"""
+        task = self._holds.pop(player_id, None)
+        if task is None:
+            return False
+        task.cancel()
+        return True
+
+    def is_held(self, player_id: str) -> bool:
+        return player_id in self._holds
+
+    def adopt(
+        self,
+        tables: Dict[Any, Dict[str, Any]],
+        on_expire: Callable[[Any, str], Awaitable[None]],
+    ) -> int:
+        """تسجيل رموز الطاولات المستعادة وحجز مقاعد لاعبيها حتى يستأنفوا"""
+        held = 0
+        for table_id, table in tables.items():
+            for player_id, token in table.get("sessions", {}).items():
+                self._tokens[token] = (table_id, player_id)
+                if player_id in table.get("players", {}):
+                    self.hold(player_id, lambda t=table_id, p=player_id: on_expire(t, p))
+                    held += 1
+        return held
+
+    def close(self):
+        for task in self._holds.values():
+            task.cancel()
+        self._holds.clear()
@@ -0,0 +1,361 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+صاروخ مصر - طابور تسوية الرقائق
+============================
+هذا الملف يجمع تغييرات أرصدة اللاعبين ويكتبها على دفعات في معاملة واحدة لكل دفعة
+(بدلاً من كتابة مستقلة لكل لاعب في كل جولة)، ثم يرسل إشعارات chips_update دفعة واحدة.
+
+لكل تغيير مفتاح عدم تكرار (idempotency key) يُحفظ في عمود reference في جدول
+user_chips_transactions، فإعادة المحاولة بعد فشل أو إعادة الإرسال لا تصرف المبلغ مرتين.
+قاعدة البيانات نفسها تفرض ذلك بفهرس فريد على reference (migrations/0001_chips_transactions_reference.sql).
+
+- PostgresSettlementStore: قاعدة البيانات الرئيسية عبر DATABASE_URL (يتطلب psycopg)
+- SQLiteSettlementStore: بديل محلي بنفس بنية الجداول للاختبارات وإعادة تشغيل الحركة فقط،
+  ولا يُستخدم إلا إذا طُلب صراحة عبر SETTLEMENT_BACKEND=sqlite
+
+بدون DATABASE_URL (أو البديل المحلي الصريح) تبقى التسوية معطلة، حتى لا تُحسب أرصدة
+لا تعرفها قاعدة البيانات الرئيسية.
+"""
+
+import os
+import asyncio
+import logging
+import sqlite3
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+logger = logging.getLogger("settlement")
+
+# المسار الافتراضي لمخزن SQLite المحلي
+DEFAULT_SETTLEMENT_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "settlements.sqlite3"
+)
+
+# الرصيد الابتدائي للمستخدم (نفس القيمة الافتراضية في جدول users)
+DEFAULT_CHIPS = 5000
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+  id INTEGER PRIMARY KEY,
+  chips INTEGER NOT NULL DEFAULT 5000
+);
+CREATE TABLE IF NOT EXISTS user_chips_transactions (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+  amount INTEGER NOT NULL,
+  balance_after INTEGER NOT NULL,
+  type TEXT NOT NULL,
+  description TEXT,
+  created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  game_id INTEGER,
+  table_id INTEGER,
+  source_user_id INTEGER,
+  reference TEXT
+);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_user_chips_transactions_reference ON user_chips_transactions(reference);
+CREATE INDEX IF NOT EXISTS idx_user_chips_transactions_user_id ON user_chips_transactions(user_id);
+"""
+
+
+def _compute_balances(
+    entries: List[Dict[str, Any]],
+    existing: Set[str],
+    balances: Dict[int, int],
+    require_funds: bool = False,
+) -> List[Dict[str, Any]]:
+    """حساب الرصيد بعد كل معاملة بالترتيب وإرجاع المعاملات المطبقة فقط
+
+    تُتخطى المفاتيح المطبقة سابقاً والمستخدمون غير الموجودين في جدول users (لا تُنشأ لهم محافظ)،
+    ومع require_funds يُتخطى أيضاً الخصم الذي لا يكفيه الرصيد.
+    """
+    missing = sorted({entry["user_id"] for entry in entries if entry["user_id"] not in balances})
+    if missing:
+        logger.warning(f"تخطي تسوية لمستخدمين غير موجودين: {missing}")
+
+    applied = []
+    seen = set(existing)
+    for entry in entries:
+        user_id = entry["user_id"]
+        if entry["key"] in seen or user_id not in balances:
+            continue
+        if require_funds and balances[user_id] + entry["amount"] < 0:
+            continue
+        seen.add(entry["key"])
+        balances[user_id] += entry["amount"]
+        applied.append({**entry, "balance_after": balances[user_id]})
+    return applied
+
+
+def _transaction_row(item: Dict[str, Any]) -> tuple:
+    return (item["user_id"], item["amount"], item["balance_after"], item["type"],
+            item.get("description"), item.get("game_id"), item.get("table_id"), item["key"])
+
+
+class SQLiteSettlementStore:
+    """مخزن تسوية محلي بنفس بنية جداول قاعدة البيانات (للاختبارات فقط)"""
+
+    def __init__(self, path: str = DEFAULT_SETTLEMENT_PATH):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(SQLITE_SCHEMA)
+
+    def create_user(self, user_id: int, chips: int = DEFAULT_CHIPS):
+        """إنشاء مستخدم في الجدول المحلي (يقابل التسجيل في قاعدة البيانات الرئيسية)"""
+        self._conn.execute("INSERT OR IGNORE INTO users (id, chips) VALUES (?, ?)", (user_id, chips))
+
+    def apply_batch(self, entries: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """كتابة دفعة في معاملة واحدة وإرجاع المعاملات الجديدة فقط"""
+        return self._write(entries, require_funds=False)
+
+    def debit_batch(self, entries: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """خصم دفعة في معاملة واحدة بشرط كفاية رصيد كل مستخدم، وإرجاع ما خُصم فقط"""
+        return self._write(entries, require_funds=True)
+
+    def _write(self, entries: List[Dict[str, Any]], require_funds: bool) -> List[Dict[str, Any]]:
+        conn = self._conn
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            keys = [entry["key"] for entry in entries]
+            existing = {
+                row[0] for row in conn.execute(
+                    f"SELECT reference FROM user_chips_transactions WHERE reference IN ({','.join('?' * len(keys))})",
+                    keys,
+                )
+            }
+            user_ids = sorted({entry["user_id"] for entry in entries})
+            balances = dict(conn.execute(
+                f"SELECT id, chips FROM users WHERE id IN ({','.join('?' * len(user_ids))})", user_ids
+            ))
+
+            applied = _compute_balances(entries, existing, balances, require_funds)
+            if applied:
+                conn.executemany(
+                    "INSERT INTO user_chips_transactions "
+                    "(user_id, amount, balance_after, type, description, game_id, table_id, reference) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    [_transaction_row(item) for item in applied],
+                )
+                conn.executemany("UPDATE users SET chips = ? WHERE id = ?",
+                                 [(balances[user_id], user_id) for user_id in {item["user_id"] for item in applied}])
+            conn.execute("COMMIT")
+            return applied
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def close(self):
+        self._conn.close()
+
+
+class PostgresSettlementStore:
+    """مخزن التسوية في قاعدة بيانات PostgreSQL الرئيسية"""
+
+    def __init__(self, dsn: str):
+        try:
+            import psycopg
+        except ImportError:
+            raise RuntimeError("مكتبة psycopg غير مثبتة، يرجى تثبيتها لاستخدام PostgreSQL في التسوية")
+        self._conn = psycopg.connect(dsn)
+
+    def apply_batch(self, entries: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """كتابة دفعة في معاملة واحدة وإرجاع المعاملات الجديدة فقط"""
+        return self._write(entries, require_funds=False)
+
+    def debit_batch(self, entries: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """خصم دفعة في معاملة واحدة بشرط كفاية رصيد كل مستخدم، وإرجاع ما خُصم فقط"""
+        return self._write(entries, require_funds=True)
+
+    def _write(self, entries: List[Dict[str, Any]], require_funds: bool) -> List[Dict[str, Any]]:
+        with self._conn.transaction():
+            with self._conn.cursor() as cur:
+                user_ids = sorted({entry["user_id"] for entry in entries})
+
+                # قفل صفوف المستخدمين أولاً: أي تسوية أخرى لنفس المستخدم تنتظر حتى تنتهي هذه،
+                # لذلك يبقى فحص المفاتيح التالي صحيحاً حتى مع عدة عمليات
+                cur.execute("SELECT id, chips FROM users WHERE id = ANY(%s) ORDER BY id FOR UPDATE", (user_ids,))
+                balances = dict(cur.fetchall())
+
+                cur.execute(
+                    "SELECT reference FROM user_chips_transactions WHERE reference = ANY(%s)",
+                    ([entry["key"] for entry in entries],),
+                )
+                existing = {row[0] for row in cur.fetchall()}
+
+                applied = _compute_balances(entries, existing, balances, require_funds)
+                if not applied:
+                    return []
+
+                rows = ",".join(["(%s, %s, %s, %s, %s, %s, %s, %s)"] * len(applied))
+                cur.execute(
+                    "INSERT INTO user_chips_transactions "
+                    "(user_id, amount, balance_after, type, description, game_id, table_id, reference) "
+                    f"VALUES {rows} ON CONFLICT (reference) DO NOTHING RETURNING reference",
+                    [value for item in applied for value in _transaction_row(item)],
+                )
+                if len(cur.fetchall()) != len(applied):
+                    # مفتاح أدخلته عملية أخرى بعد الفحص: التراجع عن الدفعة كاملة، والإعادة تتخطى المفتاح
+                    raise RuntimeError("تعارض مفتاح عدم تكرار مع تسوية متزامنة")
+                cur.executemany(
+                    "UPDATE users SET chips = %s, updated_at = NOW() WHERE id = %s",
+                    [(balances[user_id], user_id) for user_id in {item["user_id"] for item in applied}],
+                )
+                return applied
+
+    def close(self):
+        self._conn.close()
+
+
+def create_store_from_env():
+    """إنشاء مخزن التسوية حسب متغيرات البيئة (None إذا لم تُحدد قاعدة بيانات)
+
+    PostgreSQL عند وجود DATABASE_URL، والبديل المحلي فقط مع SETTLEMENT_BACKEND=sqlite.
+    """
+    backend = os.environ.get("SETTLEMENT_BACKEND", "").lower()
+    if backend == "sqlite":
+        logger.warning("التسوية تستخدم مخزن SQLite المحلي (للاختبارات فقط، ليس قاعدة البيانات الرئيسية)")
+        return SQLiteSettlementStore(os.environ.get("SETTLEMENT_DB_PATH", DEFAULT_SETTLEMENT_PATH))
+    database_url = os.environ.get("DATABASE_URL")
+    if database_url:
+        return PostgresSettlementStore(database_url)
+    return None
+
+
+class SettlementQueue:
+    """طابور تسوية بكتابة مؤجلة على دفعات وإشعارات مجمعة"""
+
+    def __init__(
+        self,
+        store: Optional[Any],
+        notify: Callable[[Dict[int, Dict[str, Any]]], Awaitable[None]],
+        flush_interval: float = 0.2,
+        max_batch: int = 1000,
+    ):
+        self.store = store
+        self.notify = notify
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+
+        # التغييرات المعلقة بترتيب الإضافة {key: entry}
+        self._pending: Dict[str, Dict[str, Any]] = {}
+        self._flush_lock = asyncio.Lock()
+
+    def submit(
+        self,
+        user_id: int,
+        amount: int,
+        key: str,
+        transaction_type: str,
+        description: Optional[str] = None,
+        game_id: Optional[int] = None,
+        table_id: Optional[int] = None,
+        details: Optional[Dict[str, Any]] = None,
+    ) -> bool:
+        """إضافة تغيير رصيد إلى الطابور (يُرجع False إذا كان المفتاح معلقاً بالفعل)"""
+        if key in self._pending:
+            return False
+        self._pending[key] = self._entry(user_id, amount, key, transaction_type, description, game_id, table_id, details)
+        return True
+
+    @staticmethod
+    def _entry(
+        user_id: int,
+        amount: int,
+        key: str,
+        transaction_type: str,
+        description: Optional[str] = None,
+        game_id: Optional[int] = None,
+        table_id: Optional[int] = None,
+        details: Optional[Dict[str, Any]] = None,
+    ) -> Dict[str, Any]:
+        return {
+            "key": key,
+            "user_id": int(user_id),
+            "amount": int(amount),
+            "type": transaction_type,
+            "description": description,
+            "game_id": game_id,
+            "table_id": table_id,
+            "details": details,
+        }
+
+    async def debit(
+        self,
+        debits: List[Tuple[int, int, str]],
+        transaction_type: str,
+        description: Optional[str] = None,
+    ) -> Dict[str, int]:
+        """خصم دفعة مبالغ فوراً في معاملة واحدة خارج الطابور (للرهانات) بشرط كفاية رصيد كل مستخدم
+
+        debits: قائمة (المستخدم، المبلغ، مفتاح عدم التكرار). يُرجع {المفتاح: الرصيد الجديد}
+        للمبالغ التي خُصمت فقط.
+        """
+        entries = [
+            self._entry(user_id, -int(amount), key, transaction_type, description)
+            for user_id, amount, key in debits
+        ]
+        if not entries:
+            return {}
+        async with self._flush_lock:
+            applied = await asyncio.to_thread(self.store.debit_batch, entries)
+        if applied:
+            await self.notify(self._chips_updates(applied))
+        return {item["key"]: item["balance_after"] for item in applied}
+
+    @staticmethod
+    def _chips_updates(applied: List[Dict[str, Any]]) -> Dict[int, Dict[str, Any]]:
+        """إشعار chips_update واحد لكل مستخدم بآخر رصيد وقائمة التغييرات"""
+        updates: Dict[int, Dict[str, Any]] = {}
+        for item in applied:
+            update = updates.setdefault(item["user_id"], {
+                "type": "chips_update",
+                "changes": [],
+            })
+            update["chips"] = item["balance_after"]
+            update["changes"].append({
+                "amount": item["amount"],
+                "type": item["type"],
+                "description": item["description"],
+                "reference": item["key"],
+                **({"details": item["details"]} if item.get("details") else {}),
+            })
+        return updates
+
+    @property
+    def pending_count(self) -> int:
+        return len(self._pending)
+
+    async def flush(self):
+        """كتابة دفعة واحدة ثم إرسال إشعار واحد لكل مستخدم"""
+        if not self._pending:
+            return
+
+        async with self._flush_lock:
+            keys = list(self._pending)[: self.max_batch]
+            entries = [self._pending.pop(key) for key in keys]
+
+            try:
+                applied = await asyncio.to_thread(self.store.apply_batch, entries)
+            except Exception:
+                # إعادة التغييرات للطابور، ومفاتيح عدم التكرار تمنع الصرف المزدوج عند الإعادة
+                for entry in entries:
+                    self._pending.setdefault(entry["key"], entry)
+                raise
+
+            updates = self._chips_updates(applied)
+            if updates:
+                await self.notify(updates)
+
+    async def run(self):
+        """حلقة التسوية الدورية في الخلفية"""
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                while self._pending:
+                    await self.flush()
+            except Exception as e:
+                logger.error(f"خطأ أثناء تسوية الرقائق: {str(e)}")
@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+صاروخ مصر - توزيع طاولات البوكر على العمليات
+=======================================
+هذا الملف يوزع الطاولات على عدة عمليات للخادم (كل عملية على منفذها الخاص) بالتجزئة
+المتسقة (consistent hashing)، حتى يصل جميع لاعبي الطاولة إلى العملية المالكة لها.
+
+- حلقة تجزئة بعقد افتراضية: إضافة عملية تنقل جزءاً صغيراً فقط من الطاولات
+- توجيه اتصال /ws/poker للعملية المالكة: إعادة توجيه العميل (redirect) أو تمرير
+  الاتصال عبر العملية الحالية (proxy، يتطلب مكتبة websockets)
+- إعادة التوزيع أثناء التشغيل: نقل الطاولات التي تغير مالكها مع رموز الاستئناف
+
+الإعداد عبر متغيرات البيئة:
+  SHARD_WORKERS="http://127.0.0.1:3001,http://127.0.0.1:3002"
+  SHARD_SELF="http://127.0.0.1:3001"
+  SHARD_ROUTING=redirect|proxy
+"""
+
+import os
+import json
+import bisect
+import asyncio
+import hashlib
+import logging
+import urllib.request
+from typing import Any, Dict, Iterable, List, Optional
+
+logger = logging.getLogger("sharding")
+
+# رمز إغلاق WebSocket عند توجيه العميل لعملية أخرى
+SHARD_REDIRECT_CLOSE_CODE = 4001
+
+ROUTING_MODES = ("redirect", "proxy")
+
+
+def _hash(value: str) -> int:
+    return int.from_bytes(hashlib.blake2b(value.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+def websocket_url(worker: str, path: str = "/ws/poker") -> str:
+    """عنوان WebSocket للعملية (http -> ws و https -> wss)"""
+    if worker.startswith("https://"):
+        return "wss://" + worker[len("https://"):].rstrip("/") + path
+    if worker.startswith("http://"):
+        return "ws://" + worker[len("http://"):].rstrip("/") + path
+    return worker.rstrip("/") + path
+
+
+class HashRing:
+    """حلقة تجزئة متسقة بعقد افتراضية"""
+
+    def __init__(self, nodes: Iterable[str] = (), vnodes: int = 64):
+        self.vnodes = vnodes
+        self.nodes: List[str] = []
+        self._points: List[int] = []
+        self._owners: List[str] = []
+        for node in nodes:
+            self.add(node)
+
+    def add(self, node: str):
+        if node in self.nodes:
+            return
+        self.nodes.append(node)
+        for i in range(self.vnodes):
+            point = _hash(f"{node}#{i}")
+            index = bisect.bisect(self._points, point)
+            self._points.insert(index, point)
+            self._owners.insert(index, node)
+
+    def remove(self, node: str):
+        if node not in self.nodes:
+            return
+        self.nodes.remove(node)
+        kept = [(point, owner) for point, owner in zip(self._points, self._owners) if owner != node]
+        self._points = [point for point, _ in kept]
+        self._owners = [owner for _, owner in kept]
+
+    def node_for(self, key: Any) -> Optional[str]:
+        """العملية المالكة للمفتاح (أول عقدة افتراضية بعد تجزئة المفتاح)"""
+        if not self._points:
+            return None
+        index = bisect.bisect(self._points, _hash(str(key))) % len(self._points)
+        return self._owners[index]
+
+
+class ShardMap:
+    """خريطة توزيع الطاولات على العمليات"""
+
+    def __init__(self, workers: List[str], self_node: Optional[str], routing: str = "redirect", vnodes: int = 64):
+        self.self_node = self_node
+        self.routing = routing if routing in ROUTING_MODES else "redirect"
+        self.vnodes = vnodes
+        self.ring = HashRing(workers, vnodes)
+
+    @classmethod
+    def from_env(cls) -> "ShardMap":
+        """إنشاء خريطة التوزيع من متغيرات البيئة (معطلة إذا لم تُحدد العمليات)"""
+        workers = [worker.strip() for worker in os.environ.get("SHARD_WORKERS", "").split(",") if worker.strip()]
+        return cls(
+            workers,
+            os.environ.get("SHARD_SELF") or None,
+            routing=os.environ.get("SHARD_ROUTING", "redirect").lower(),
+            vnodes=int(os.environ.get("SHARD_VNODES", 64)),
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return self.self_node is not None and len(self.ring.nodes) > 1
+
+    @property
+    def workers(self) -> List[str]:
+        return list(self.ring.nodes)
+
+    def owner(self, table_id: Any) -> Optional[str]:
+        return self.ring.node_for(table_id)
+
+    def is_local(self, table_id: Any) -> bool:
+        if not self.enabled:
+            return True
+        return self.owner(table_id) == self.self_node
+
+    def set_workers(self, workers: List[str]) -> HashRing:
+        """استبدال قائمة العمليات وإرجاع الحلقة القديمة لحساب الطاولات المنقولة"""
+        old_ring = self.ring
+        self.ring = HashRing(workers, self.vnodes)
+        return old_ring
+
+    def moved_tables(self, table_ids: Iterable[Any]) -> Dict[Any, str]:
+        """الطاولات المحلية التي أصبحت مملوكة لعملية أخرى {table_id: المالك الجديد}"""
+        if self.self_node is None:
+            return {}
+        moved = {}
+        for table_id in table_ids:
+            owner = self.owner(table_id)
+            if owner is not None and owner != self.self_node:
+                moved[table_id] = owner
+        return moved
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "self": self.self_node,
+            "workers": self.workers,
+            "routing": self.routing,
+            "vnodes": self.vnodes,
+        }
+
+    async def post(self, worker: str, path: str, payload: Dict[str, Any], timeout: float = 10.0) -> Dict[str, Any]:
+        """إرسال طلب إداري لعملية أخرى (في خيط منفصل حتى لا تتعطل حلقة الأحداث)"""
+        def send():
+            request = urllib.request.Request(
+                worker.rstrip("/") + path,
+                data=json.dumps(payload, ensure_ascii=False, default=str).encode("utf-8"),
+                method="POST",
+            )
+            request.add_header("Content-Type", "application/json")
+            if os.environ.get("DRAIN_TOKEN"):
+                request.add_header("X-Drain-Token", os.environ["DRAIN_TOKEN"])
+            with urllib.request.urlopen(request, timeout=timeout) as response:
+                return json.loads(response.read().decode("utf-8"))
+
+        return await asyncio.to_thread(send)
+
+
+async def proxy_websocket(websocket: Any, target_url: str, first_message: str) -> bool:
+    """تمرير اتصال العميل إلى العملية المالكة حتى ينقطع أحد الطرفين
+
+    يُرجع False إذا لم تكن مكتبة websockets متوفرة (فيُستخدم التوجيه بدلاً من ذلك).
+    """
+    try:
+        import websockets
+    except ImportError:
+        logger.warning("مكتبة websockets غير مثبتة، سيتم توجيه العميل بدلاً من تمرير الاتصال")
+        return False
+
+    async with websockets.connect(target_url) as upstream:
+        # رسالة الترحيب من العملية المالكة (أرسلنا للعميل رسالة ترحيب بالفعل)
+        await upstream.recv()
+        await upstream.send(first_message)
+
+        async def client_to_upstream():
+            while True:
+                await upstream.send(await websocket.receive_text())
+
+        async def upstream_to_client():
+            async for data in upstream:
+                await websocket.send_text(data if isinstance(data, str) else data.decode("utf-8"))
+
+        tasks = [asyncio.create_task(client_to_upstream()), asyncio.create_task(upstream_to_client())]
+        done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        for task in pending:
+            task.cancel()
+        for task in done:
+            # قراءة الاستثناء (انقطاع أحد الطرفين) حتى لا يُسجل كاستثناء غير معالج
+            task.exception()
+    return True
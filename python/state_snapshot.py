@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+صاروخ مصر - لقطات حالة الخادم
+===========================
+هذا الملف يحفظ حالة طاولات البوكر والتحديثات المؤقتة للمستخدمين في ملف SQLite محلي
+بأسلوب الكتابة المؤجلة (write-behind)، ويستعيدها خلال أجزاء من الثانية عند إعادة التشغيل.
+
+- الطاولات تُحفظ كلقطات تزايدية: تُكتب فقط الطاولات التي تغيرت منذ آخر دفعة
+- التحديثات المؤقتة تُضاف إلى سجل إلحاقي صغير، ويُدمج السجل في اللقطة دورياً
+- كل دفعة تُكتب في معاملة واحدة، ووضع WAL مع synchronous=NORMAL يجمع عمليات fsync
+"""
+
+import os
+import json
+import time
+import asyncio
+import logging
+import sqlite3
+from typing import Dict, List, Optional, Set, Any, Tuple
+
+logger = logging.getLogger("state_snapshot")
+
+# المسار الافتراضي لملف اللقطات
+DEFAULT_SNAPSHOT_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "realtime_state.sqlite3"
+)
+
+# أوضاع المزامنة المسموح بها في SQLite
+SYNC_MODES = ("OFF", "NORMAL", "FULL")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS table_snapshots (
+  table_key TEXT PRIMARY KEY,
+  data TEXT NOT NULL,
+  updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS user_update_snapshots (
+  user_id INTEGER PRIMARY KEY,
+  data TEXT NOT NULL,
+  updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS user_update_log (
+  seq INTEGER PRIMARY KEY AUTOINCREMENT,
+  user_id INTEGER NOT NULL,
+  data TEXT NOT NULL
+);
+"""
+
+
+class StateSnapshotStore:
+    """مخزن لقطات حالة الخادم مع كتابة مؤجلة على دفعات"""
+
+    def __init__(
+        self,
+        path: str = DEFAULT_SNAPSHOT_PATH,
+        flush_interval: float = 0.5,
+        sync_mode: str = "NORMAL",
+        compact_every: int = 120,
+    ):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.sync_mode = sync_mode.upper() if sync_mode.upper() in SYNC_MODES else "NORMAL"
+        self.compact_every = compact_every
+
+        self._conn: Optional[sqlite3.Connection] = None
+        self._flush_lock = asyncio.Lock()
+        self._flush_count = 0
+
+        # التغييرات المعلقة منذ آخر دفعة
+        self._dirty_tables: Set[Any] = set()
+        self._deleted_tables: Set[Any] = set()
+        self._reset_users: Set[int] = set()
+        self._pending_log: List[Tuple[int, Any]] = []
+
+        # المستخدمون الذين لديهم سجلات في ملف السجل الإلحاقي
+        self._logged_users: Set[int] = set()
+
+    @classmethod
+    def from_env(cls) -> "StateSnapshotStore":
+        """إنشاء المخزن من متغيرات البيئة"""
+        return cls(
+            path=os.environ.get("REALTIME_SNAPSHOT_PATH", DEFAULT_SNAPSHOT_PATH),
+            flush_interval=float(os.environ.get("REALTIME_SNAPSHOT_INTERVAL", 0.5)),
+            sync_mode=os.environ.get("REALTIME_SNAPSHOT_SYNC", "NORMAL"),
+            compact_every=int(os.environ.get("REALTIME_SNAPSHOT_COMPACT_EVERY", 120)),
+        )
+
+    # فتح وإغلاق الملف
+    def open(self):
+        """فتح ملف اللقطات وتهيئة الجداول"""
+        if self._conn is not None:
+            return
+
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(f"PRAGMA synchronous={self.sync_mode}")
+        # ربط الملف بالذاكرة لتسريع القراءة عند الاستعادة
+        self._conn.execute("PRAGMA mmap_size=67108864")
+        self._conn.executescript(SCHEMA)
+
+    def close(self):
+        """إغلاق ملف اللقطات"""
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    # تسجيل التغييرات (تُستدعى من حلقة الأحداث ولا تلمس القرص)
+    def mark_table_dirty(self, table_id: Any):
+        """تسجيل تغير حالة طاولة لحفظها في الدفعة القادمة"""
+        self._deleted_tables.discard(table_id)
+        self._dirty_tables.add(table_id)
+
+    def mark_table_deleted(self, table_id: Any):
+        """تسجيل حذف طاولة"""
+        self._dirty_tables.discard(table_id)
+        self._deleted_tables.add(table_id)
+
+    def log_user_update(self, user_id: int, message: Dict[str, Any]):
+        """إلحاق تحديث مؤقت جديد لمستخدم بالسجل"""
+        self._pending_log.append((user_id, message))
+
+    def mark_user_updates_reset(self, user_id: int):
+        """تسجيل أن قائمة تحديثات المستخدم أُعيد كتابتها (تم تسليمها أو تقليمها)"""
+        self._reset_users.add(user_id)
+
+    # الاستعادة
+    def restore(self, poker_tables: Dict[Any, Dict[str, Any]], user_updates: Dict[int, List[Dict[str, Any]]]) -> Dict[str, Any]:
+        """استعادة الحالة المحفوظة إلى القواميس المعطاة"""
+        self.open()
+        started = time.perf_counter()
+
+        for table_key, data in self._conn.execute("SELECT table_key, data FROM table_snapshots"):
+            poker_tables[json.loads(table_key)] = json.loads(data)
+
+        for user_id, data in self._conn.execute("SELECT user_id, data FROM user_update_snapshots"):
+            user_updates[user_id] = json.loads(data)
+
+        log_entries = 0
+        for user_id, data in self._conn.execute("SELECT user_id, data FROM user_update_log ORDER BY seq"):
+            user_updates.setdefault(user_id, []).append(json.loads(data))
+            self._logged_users.add(user_id)
+            log_entries += 1
+
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        stats = {
+            "tables": len(poker_tables),
+            "users": len(user_updates),
+            "log_entries": log_entries,
+            "elapsed_ms": round(elapsed_ms, 2),
+        }
+        logger.info(f"تمت استعادة حالة الخادم من {self.path}: {stats}")
+        return stats
+
+    # الكتابة على دفعات
+    def _collect_batch(self, poker_tables: Dict[Any, Dict[str, Any]], user_updates: Dict[int, List[Dict[str, Any]]], compact: bool):
+        """تجميع التغييرات المعلقة وتحويلها إلى صفوف جاهزة للكتابة"""
+        now = time.time()
+
+        dirty_tables, self._dirty_tables = self._dirty_tables, set()
+        deleted_tables, self._deleted_tables = self._deleted_tables, set()
+        reset_users, self._reset_users = self._reset_users, set()
+        pending_log, self._pending_log = self._pending_log, []
+
+        if compact:
+            # دمج السجل الإلحاقي في اللقطة عبر إعادة كتابة كل من له سجلات
+            reset_users |= self._logged_users
+            reset_users |= {user_id for user_id, _ in pending_log}
+
+        table_rows = []
+        for table_id in dirty_tables:
+            if table_id in poker_tables:
+                table_rows.append((json.dumps(table_id), json.dumps(poker_tables[table_id], default=str), now))
+            else:
+                deleted_tables.add(table_id)
+
+        user_rows = []
+        cleared_users = []
+        for user_id in reset_users:
+            updates = user_updates.get(user_id)
+            if updates:
+                user_rows.append((user_id, json.dumps(updates, default=str), now))
+            else:
+                cleared_users.append((user_id,))
+
+        # السجلات التي تخص مستخدماً أُعيدت كتابة لقطته أصبحت جزءاً من اللقطة
+        log_rows = [
+            (user_id, json.dumps(message, default=str))
+            for user_id, message in pending_log
+            if user_id not in reset_users
+        ]
+
+        return {
+            "tables": table_rows,
+            "deleted_tables": [(json.dumps(table_id),) for table_id in deleted_tables],
+            "users": user_rows,
+            "cleared_users": cleared_users,
+            "reset_users": [(user_id,) for user_id in reset_users],
+            "log": log_rows,
+            "_source": (dirty_tables | deleted_tables, reset_users, pending_log),
+        }
+
+    def _write_batch(self, batch: Dict[str, List[tuple]]):
+        """كتابة دفعة واحدة في معاملة واحدة (تُنفذ في خيط منفصل)"""
+        conn = self._conn
+        conn.execute("BEGIN")
+        try:
+            if batch["tables"]:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO table_snapshots (table_key, data, updated_at) VALUES (?, ?, ?)",
+                    batch["tables"],
+                )
+            if batch["deleted_tables"]:
+                conn.executemany("DELETE FROM table_snapshots WHERE table_key = ?", batch["deleted_tables"])
+            if batch["reset_users"]:
+                conn.executemany("DELETE FROM user_update_log WHERE user_id = ?", batch["reset_users"])
+            if batch["users"]:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO user_update_snapshots (user_id, data, updated_at) VALUES (?, ?, ?)",
+                    batch["users"],
+                )
+            if batch["cleared_users"]:
+                conn.executemany("DELETE FROM user_update_snapshots WHERE user_id = ?", batch["cleared_users"])
+            if batch["log"]:
+                conn.executemany("INSERT INTO user_update_log (user_id, data) VALUES (?, ?)", batch["log"])
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _apply_batch_bookkeeping(self, batch: Dict[str, List[tuple]]):
+        """تحديث قائمة المستخدمين الذين لديهم سجلات بعد نجاح الكتابة"""
+        for (user_id,) in batch["reset_users"]:
+            self._logged_users.discard(user_id)
+        for user_id, _ in batch["log"]:
+            self._logged_users.add(user_id)
+
+    def _requeue(self, batch: Dict[str, Any]):
+        """إعادة التغييرات إلى قائمة الانتظار بعد فشل الكتابة"""
+        tables, reset_users, pending_log = batch["_source"]
+        self._dirty_tables |= tables
+        self._reset_users |= reset_users
+        self._pending_log[:0] = pending_log
+
+    def _has_pending(self) -> bool:
+        return bool(self._dirty_tables or self._deleted_tables or self._reset_users or self._pending_log)
+
+    async def flush(self, poker_tables: Dict[Any, Dict[str, Any]], user_updates: Dict[int, List[Dict[str, Any]]]):
+        """كتابة التغييرات المعلقة دون حجب حلقة الأحداث"""
+        if self._conn is None or not self._has_pending():
+            return
+
+        async with self._flush_lock:
+            self._flush_count += 1
+            compact = self.compact_every > 0 and self._flush_count % self.compact_every == 0
+            batch = self._collect_batch(poker_tables, user_updates, compact)
+            write = asyncio.ensure_future(asyncio.to_thread(self._write_batch, batch))
+            try:
+                await asyncio.shield(write)
+            except asyncio.CancelledError:
+                # الخيط يكمل الكتابة رغم إلغاء المهمة، فلا يُحرر القفل قبل انتهائها
+                await asyncio.wait([write])
+                raise
+            finally:
+                if write.done():
+                    if write.exception() is None:
+                        self._apply_batch_bookkeeping(batch)
+                    else:
+                        self._requeue(batch)
+
+    def flush_now(self, poker_tables: Dict[Any, Dict[str, Any]], user_updates: Dict[int, List[Dict[str, Any]]]):
+        """كتابة متزامنة مع دمج السجل (تُستخدم عند الإغلاق بعد توقف مهمة الكتابة)"""
+        if self._conn is None:
+            return
+
+        batch = self._collect_batch(poker_tables, user_updates, compact=True)
+        self._write_batch(batch)
+        self._apply_batch_bookkeeping(batch)
+        self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        logger.info(f"تم حفظ لقطة نهائية لحالة الخادم في {self.path}")
+
+    async def flush_final(self, poker_tables: Dict[Any, Dict[str, Any]], user_updates: Dict[int, List[Dict[str, Any]]]):
+        """انتظار انتهاء أي دفعة جارية في خيط الكتابة ثم الكتابة النهائية المتزامنة"""
+        async with self._flush_lock:
+            self.flush_now(poker_tables, user_updates)
+
+    async def run(self, poker_tables: Dict[Any, Dict[str, Any]], user_updates: Dict[int, List[Dict[str, Any]]]):
+        """حلقة الكتابة الدورية في الخلفية"""
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush(poker_tables, user_updates)
+            except Exception as e:
+                logger.error(f"خطأ أثناء حفظ لقطة حالة الخادم: {str(e)}")
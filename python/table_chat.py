@@ -0,0 +1,326 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+صاروخ مصر - دردشة طاولات البوكر
+============================
+هذا الملف يعالج رسائل الدردشة في طاولات البوكر بعيداً عن مسار أحداث اللعبة:
+
+- مرشح كلمات (بذاءات وروابط دعائية) بخوارزمية Aho-Corasick يطابق جميع الكلمات
+  في مرور واحد على النص، بعد توحيد الكتابة العربية في نفس المرور (إزالة التشكيل
+  والتطويل، توحيد الألف والياء والتاء المربوطة، ودمج الحروف المكررة)
+- سجل دائري محدود لكل طاولة يُرسل للمنضم الجديد كإطار واحد
+- تحديد معدل الرسائل لكل مرسل (token bucket)
+- طابور إرسال لكل طاولة: معالج رسالة المرسل لا ينتظر الإرسال، وتُسلسل كل رسالة مرة واحدة
+"""
+
+import os
+import json
+import time
+import asyncio
+import logging
+from collections import deque
+from datetime import datetime
+from typing import Any, Callable, Deque, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger("table_chat")
+
+# كلمات محظورة افتراضياً (يمكن استبدالها بملف عبر CHAT_FILTER_WORDS_FILE، كلمة في كل سطر)
+DEFAULT_BLOCKED_WORDS = [
+    "http://",
+    "https://",
+    "www.",
+    "t.me/",
+    "wa.me/",
+    "واتساب",
+    "حمار",
+    "غبي",
+    "حقير",
+    "وسخ",
+]
+
+
+
+def is_link_pattern(word: str) -> bool:
+    """الكلمات التي تمثل بداية رابط (http://، www.، t.me/) يُحجب معها الرابط كاملاً"""
+    return "://" in word or word.endswith("/") or word.endswith(".")
+
+
+# عدد المرسلين الذين يُحتفظ برصيدهم قبل حذف غير النشطين
+MAX_TRACKED_SENDERS = 10000
+
+
+def _build_char_map() -> Dict[str, str]:
+    """جدول توحيد الحروف: سلسلة فارغة تعني حذف الحرف"""
+    char_map: Dict[str, str] = {}
+    # التشكيل وعلامات القرآن والتطويل والحروف الخفية
+    for code in list(range(0x064B, 0x0660)) + [0x0670] + list(range(0x06D6, 0x06EE)):
+        char_map[chr(code)] = ""
+    for char in ("ـ", "​", "‌", "‍", "‎", "‏", "؜", "﻿"):
+        char_map[char] = ""
+    # أشكال الحروف المتشابهة
+    for char in "أإآٱ":
+        char_map[char] = "ا"
+    for char in "ىیئ":
+        char_map[char] = "ي"
+    char_map["ة"] = "ه"
+    char_map["ؤ"] = "و"
+    char_map["ک"] = "ك"
+    # الأرقام العربية والحروف اللاتينية الكبيرة
+    for i, char in enumerate("٠١٢٣٤٥٦٧٨٩"):
+        char_map[char] = str(i)
+    for code in range(ord("A"), ord("Z") + 1):
+        char_map[chr(code)] = chr(code).lower()
+    return char_map
+
+
+_CHAR_MAP = _build_char_map()
+
+
+def normalize_text(text: str) -> Tuple[str, List[int], List[int]]:
+    """توحيد النص في مرور واحد مع حفظ موضع بداية ونهاية كل حرف في النص الأصلي"""
+    chars: List[str] = []
+    starts: List[int] = []
+    ends: List[int] = []
+    last = None
+    for index, char in enumerate(text):
+        normalized = _CHAR_MAP.get(char, char)
+        if not normalized:
+            if ends:
+                ends[-1] = index
+            continue
+        if normalized == last and normalized > "\x7f":
+            # دمج الحروف العربية المكررة (حماااار -> حمار)
+            ends[-1] = index
+            continue
+        chars.append(normalized)
+        starts.append(index)
+        ends.append(index)
+        last = normalized
+    return "".join(chars), starts, ends
+
+
+class AhoCorasick:
+    """مطابق متعدد الكلمات (Aho-Corasick) يمر على النص مرة واحدة"""
+
+    def __init__(self, patterns: Iterable[str]):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        # طول أطول كلمة تنتهي عند كل حالة (0 إذا لا توجد)
+        self._match: List[int] = [0]
+
+        for pattern in patterns:
+            if pattern:
+                self._add(pattern)
+        self._build()
+
+    def _add(self, pattern: str):
+        state = 0
+        for char in pattern:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][char] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._match.append(0)
+            state = next_state
+        self._match[state] = max(self._match[state], len(pattern))
+
+    def _build(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[next_state] = self._goto[fail].get(char, 0)
+                self._match[next_state] = max(self._match[next_state], self._match[self._fail[next_state]])
+
+    def search(self, text: str) -> List[Tuple[int, int]]:
+        """مواضع الكلمات المطابقة كأزواج (البداية، النهاية) شاملة"""
+        spans = []
+        state = 0
+        goto, fail, match = self._goto, self._fail, self._match
+        for index, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if match[state]:
+                spans.append((index - match[state] + 1, index))
+        return spans
+
+
+class ChatFilter:
+    """مرشح رسائل الدردشة: يستبدل الكلمات المحظورة بنجوم في النص الأصلي"""
+
+    def __init__(self, words: Iterable[str]):
+        normalized = {normalize_text(word.strip())[0] for word in words if word.strip()}
+        self.size = len(normalized)
+        self._matcher = AhoCorasick(word for word in normalized if not is_link_pattern(word))
+        # الروابط تُحجب حتى حدود الكلمة في النص وليس الجزء المطابق فقط
+        self._link_matcher = AhoCorasick(word for word in normalized if is_link_pattern(word))
+
+    @classmethod
+    def from_env(cls) -> "ChatFilter":
+        """تحميل الكلمات من ملف CHAT_FILTER_WORDS_FILE أو القائمة الافتراضية"""
+        path = os.environ.get("CHAT_FILTER_WORDS_FILE")
+        if path:
+            try:
+                with open(path, encoding="utf-8") as f:
+                    return cls(line for line in f if not line.startswith("#"))
+            except OSError as e:
+                logger.error(f"تعذر قراءة ملف كلمات مرشح الدردشة {path}: {str(e)}")
+        return cls(DEFAULT_BLOCKED_WORDS)
+
+    def censor(self, text: str) -> Tuple[str, bool]:
+        """إرجاع النص بعد الترشيح وما إذا كان يحتوي على كلمات محظورة"""
+        normalized, starts, ends = normalize_text(text)
+        spans = [(starts[start], ends[end]) for start, end in self._matcher.search(normalized)]
+        for start, end in self._link_matcher.search(normalized):
+            start, end = starts[start], ends[end]
+            while start > 0 and not text[start - 1].isspace():
+                start -= 1
+            while end + 1 < len(text) and not text[end + 1].isspace():
+                end += 1
+            spans.append((start, end))
+        if not spans:
+            return text, False
+
+        chars = list(text)
+        for start, end in spans:
+            for index in range(start, end + 1):
+                if not chars[index].isspace():
+                    chars[index] = "*"
+        return "".join(chars), True
+
+
+class TableChat:
+    """دردشة الطاولات: ترشيح، تحديد معدل، سجل دائري، وطابور إرسال لكل طاولة"""
+
+    def __init__(
+        self,
+        chat_filter: ChatFilter,
+        history_size: int = 50,
+        rate: float = 1.0,
+        burst: int = 5,
+        max_length: int = 500,
+    ):
+        self.filter = chat_filter
+        self.history_size = history_size
+        self.rate = rate
+        self.burst = burst
+        self.max_length = max_length
+
+        self._history: Dict[Any, Deque[Dict[str, Any]]] = {}
+        self._history_frames: Dict[Any, str] = {}
+        # {sender_id: (الرصيد المتبقي، وقت آخر تحديث)}
+        self._buckets: Dict[Any, Tuple[float, float]] = {}
+        self._outbox: Dict[Any, List[str]] = {}
+        self._senders: Dict[Any, asyncio.Task] = {}
+
+    @classmethod
+    def from_env(cls) -> "TableChat":
+        """إنشاء دردشة الطاولات من متغيرات البيئة"""
+        return cls(
+            ChatFilter.from_env(),
+            history_size=int(os.environ.get("CHAT_HISTORY_SIZE", 50)),
+            rate=float(os.environ.get("CHAT_RATE_PER_SEC", 1.0)),
+            burst=int(os.environ.get("CHAT_BURST", 5)),
+            max_length=int(os.environ.get("CHAT_MAX_LENGTH", 500)),
+        )
+
+    def allow(self, sender_id: Any, now: Optional[float] = None) -> float:
+        """تحديد معدل المرسل: 0 إذا سُمح بالرسالة، وإلا عدد الثواني حتى الرسالة التالية"""
+        now = time.monotonic() if now is None else now
+        if len(self._buckets) > MAX_TRACKED_SENDERS:
+            self._prune(now)
+        tokens, updated = self._buckets.get(sender_id, (float(self.burst), now))
+        tokens = min(float(self.burst), tokens + (now - updated) * self.rate)
+        if tokens < 1.0:
+            self._buckets[sender_id] = (tokens, now)
+            return (1.0 - tokens) / self.rate
+        self._buckets[sender_id] = (tokens - 1.0, now)
+        return 0.0
+
+    def _prune(self, now: float):
+        """حذف المرسلين الذين امتلأ رصيدهم (لم يرسلوا منذ مدة)"""
+        refill = self.burst / self.rate
+        self._buckets = {
+            sender_id: bucket for sender_id, bucket in self._buckets.items()
+            if now - bucket[1] < refill
+        }
+
+    def prepare(self, table_id: Any, sender_id: Any, sender_name: str, text: Any) -> Optional[Dict[str, Any]]:
+        """ترشيح الرسالة وإضافتها لسجل الطاولة (None إذا كانت فارغة)"""
+        text = str(text or "").strip()[: self.max_length]
+        if not text:
+            return None
+
+        text, filtered = self.filter.censor(text)
+        message = {
+            "type": "chat_message",
+            "senderId": sender_id,
+            "senderName": sender_name,
+            "message": text,
+            "tableId": table_id,
+            "timestamp": datetime.now().isoformat(),
+        }
+        if filtered:
+            message["filtered"] = True
+
+        history = self._history.get(table_id)
+        if history is None:
+            history = self._history[table_id] = deque(maxlen=self.history_size)
+        history.append(message)
+        self._history_frames.pop(table_id, None)
+        return message
+
+    def history_frame(self, table_id: Any) -> Optional[str]:
+        """سجل الدردشة الأخير كإطار واحد (مسلسل مرة واحدة حتى الرسالة التالية)"""
+        if not self._history.get(table_id):
+            return None
+        frame = self._history_frames.get(table_id)
+        if frame is None:
+            frame = json.dumps({
+                "type": "chat_history",
+                "tableId": table_id,
+                "messages": list(self._history[table_id]),
+            }, ensure_ascii=False, separators=(",", ":"))
+            self._history_frames[table_id] = frame
+        return frame
+
+    def publish(self, table_id: Any, message: Dict[str, Any], connections: Callable[[Any], List[Any]]):
+        """إضافة الرسالة لطابور الطاولة دون انتظار إرسالها"""
+        text = json.dumps(message, ensure_ascii=False, separators=(",", ":"))
+        self._outbox.setdefault(table_id, []).append(text)
+        sender = self._senders.get(table_id)
+        if sender is None or sender.done():
+            self._senders[table_id] = asyncio.create_task(self._deliver(table_id, connections))
+
+    async def _deliver(self, table_id: Any, connections: Callable[[Any], List[Any]]):
+        """إرسال رسائل الطاولة المتراكمة بالترتيب لجميع الاتصالات بالتوازي"""
+        while self._outbox.get(table_id):
+            pending = self._outbox.pop(table_id)
+            recipients = list(connections(table_id))
+            await asyncio.gather(*(self._send_all(connection, pending) for connection in recipients))
+        self._senders.pop(table_id, None)
+
+    @staticmethod
+    async def _send_all(connection: Any, texts: List[str]):
+        try:
+            for text in texts:
+                await connection.send_text(text)
+        except Exception:
+            # الاتصالات المقطوعة تُزال في مسار أحداث الطاولة
+            pass
+
+    def forget(self, table_id: Any):
+        self._history.pop(table_id, None)
+        self._history_frames.pop(table_id, None)
+        self._outbox.pop(table_id, None)
+        sender = self._senders.pop(table_id, None)
+        if sender is not None:
+            sender.cancel()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+صاروخ مصر - عرض حالة الطاولة لكل مستلم
+===================================
+هذا الملف يبني إطارات game_state لطاولات البوكر بحيث يُسلسل الجزء العام من الطاولة
+مرة واحدة فقط لكل تغيير في الحالة، ثم يُلحق بكل مقعد جزءاً خاصاً صغيراً
+(أوراق اللاعب والإجراءات المتاحة له). المشاهدون يستلمون الإطار العام المخزن كما هو.
+
+البيانات الخاصة بكل مقعد تُحفظ في poker_tables[table_id]["private"][player_id]
+(أوراق اللاعب توزع عند بدء كل يد) ولا تظهر أبداً في الجزء العام.
+الطابع الزمني يُضاف عند كل إرسال ولا يُخزن مع الجزء العام.
+"""
+
+import json
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+# حقول معلومات اللاعب التي لا تُرسل للآخرين
+PRIVATE_PLAYER_FIELDS = frozenset({
+    "cards",
+    "holeCards",
+    "hole_cards",
+    "availableActions",
+    "token",
+    "authToken",
+    "sessionId",
+    "resumeToken",
+    "email",
+    "password",
+})
+
+# حقول حالة اللعبة التي لا تُرسل للجميع
+PRIVATE_STATE_FIELDS = frozenset({"deck", "hole_cards"})
+
+
+def public_player_info(player_info: Dict[str, Any]) -> Dict[str, Any]:
+    """معلومات اللاعب العامة فقط"""
+    return {key: value for key, value in player_info.items() if key not in PRIVATE_PLAYER_FIELDS}
+
+
+def _dumps(value: Any) -> str:
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"), default=str)
+
+
+class TableViewCache:
+    """ذاكرة مؤقتة للجزء العام من حالة كل طاولة"""
+
+    def __init__(self):
+        # {table_id: بداية الإطار العام دون الطابع الزمني والقوس الأخير}
+        self._public: Dict[Any, str] = {}
+
+    def invalidate(self, table_id: Any):
+        """إبطال الإطار المخزن بعد أي تغيير في حالة الطاولة"""
+        self._public.pop(table_id, None)
+
+    def _public_prefix(self, table_id: Any, table: Dict[str, Any]) -> str:
+        cached = self._public.get(table_id)
+        if cached is None:
+            game_state = {
+                key: value for key, value in table.get("game_state", {}).items()
+                if key not in PRIVATE_STATE_FIELDS
+            }
+            players = {
+                player_id: public_player_info(info)
+                for player_id, info in table.get("players", {}).items()
+            }
+            cached = (
+                '{"type":"game_state","tableId":' + _dumps(table_id)
+                + ',"data":' + _dumps(game_state)
+                + ',"players":' + _dumps(players)
+            )
+            self._public[table_id] = cached
+        return cached
+
+    def public_frame(self, table_id: Any, table: Dict[str, Any], timestamp: Optional[str] = None) -> str:
+        """الإطار العام (للمشاهدين ولمن ليس لديه بيانات خاصة)"""
+        return self.frame_for(table_id, table, None, timestamp)
+
+    def frame_for(
+        self, table_id: Any, table: Dict[str, Any], player_id: Optional[str], timestamp: Optional[str] = None
+    ) -> str:
+        """إطار مستلم واحد: الجزء العام المخزن مع الجزء الخاص بمقعده إن وجد
+
+        timestamp يُحسب مرة واحدة لكل إرسال لجميع المستلمين (الآن إذا لم يُحدد).
+        """
+        frame = self._public_prefix(table_id, table)
+        if player_id is not None:
+            private = table.get("private", {}).get(player_id)
+            if private:
+                frame += ',"private":' + _dumps(private)
+        return frame + ',"timestamp":' + _dumps(timestamp or datetime.now().isoformat()) + "}"
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+
+"""اختبارات سجل أحداث الطاولات: الترميز، الفهرس المتناثر، وإصلاح المقاطع المقطوعة"""
+
+import os
+
+from python.hand_history import (
+    INDEX_ENTRY,
+    HandHistoryLog,
+    HandHistoryReader,
+    index_path,
+    list_segments,
+    repair_segment,
+    segment_path,
+    table_id_from_key,
+    table_key,
+)
+
+
+def _write(base_dir, events, **options):
+    log = HandHistoryLog(str(base_dir), **options)
+    for table_id, message, hand in events:
+        log.record(table_id, message, hand)
+    log.flush_now()
+    return log
+
+
+def _replay(base_dir, table_id, **options):
+    return list(HandHistoryReader(str(base_dir)).replay(table_id, **options))
+
+
+def test_table_key_is_collision_free_and_reversible():
+    ids = ["a/b", "a_b", "a.b", 1, "1", "طاولة"]
+    keys = [table_key(table_id) for table_id in ids]
+    assert len(set(keys)) == len(ids)
+    assert [table_id_from_key(key) for key in keys] == ids
+
+
+def test_record_keeps_a_copy_of_the_message(tmp_path):
+    log = HandHistoryLog(str(tmp_path))
+    message = {"type": "player_joined", "playerId": "p1"}
+    log.record(1, message, 1)
+    # المستدعي يضيف seq بعد التسجيل
+    message["seq"] = 5
+    log.flush_now()
+
+    assert _replay(tmp_path, 1)[0]["data"] == {"playerId": "p1"}
+
+
+def test_replay_filters_by_hand_using_the_sparse_index(tmp_path):
+    events = [
+        (7, {"type": "action_result", "playerId": "p1", "n": i}, hand)
+        for hand in (1, 2, 3)
+        for i in range(5)
+    ]
+    _write(tmp_path, events, index_every=2, segment_max_bytes=200)
+    directory = os.path.join(str(tmp_path), table_key(7))
+    assert len(list_segments(directory)) > 1
+
+    replayed = _replay(tmp_path, 7, from_hand=2, to_hand=2)
+    assert [event["hand"] for event in replayed] == [2] * 5
+    assert [event["data"]["n"] for event in replayed] == list(range(5))
+    assert {event["type"] for event in replayed} == {"action_result"}
+    assert len(_replay(tmp_path, 7)) == 15
+
+
+def test_unknown_event_types_keep_their_name(tmp_path):
+    _write(tmp_path, [(1, {"type": "custom_event", "x": 1}, 0)])
+    [event] = _replay(tmp_path, 1)
+    assert (event["type"], event["hand"], event["data"]) == ("custom_event", 0, {"x": 1})
+
+
+def test_repair_segment_truncates_a_torn_tail(tmp_path):
+    _write(tmp_path, [(1, {"type": "action_result", "n": i}, 1) for i in range(3)])
+    directory = os.path.join(str(tmp_path), table_key(1))
+    path = segment_path(directory, 0)
+    valid = os.path.getsize(path)
+
+    # سجل ناقص ومدخل فهرس يشير إليه، كما يحدث عند الانقطاع أثناء الكتابة
+    with open(path, "ab") as segment_file:
+        segment_file.write(b"\x40\x00\x00\x00\x03\x00partial")
+    with open(index_path(directory, 0), "ab") as index_file:
+        index_file.write(INDEX_ENTRY.pack(2, 0.0, valid))
+
+    assert repair_segment(directory, 0) == valid
+    assert os.path.getsize(path) == valid
+    assert os.path.getsize(index_path(directory, 0)) % INDEX_ENTRY.size == 0
+
+    # الكاتب الجديد يكمل بعد آخر سجل صالح
+    _write(tmp_path, [(1, {"type": "action_result", "n": 3}, 2)])
+    assert [event["data"]["n"] for event in _replay(tmp_path, 1)] == [0, 1, 2, 3]
+    assert [event["data"]["n"] for event in _replay(tmp_path, 1, from_hand=2)] == [3]
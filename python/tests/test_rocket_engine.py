@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+
+"""اختبارات محرك جولات الصاروخ: سلسلة التجزئة وعدم كشف تجزئة الجولة قبل الانفجار"""
+
+import asyncio
+import hashlib
+import json
+
+from python.rocket_engine import (
+    HashChain,
+    RocketRoundEngine,
+    crash_point_from_hash,
+    verify_chain_link,
+)
+
+
+class FakeWebSocket:
+    def __init__(self):
+        self.frames = []
+
+    async def send_text(self, text):
+        self.frames.append(json.loads(text))
+
+
+def test_hash_chain_links_back_to_the_commitment():
+    chain = HashChain(50, seed="seed")
+    assert len(chain) == 49
+
+    hashes = [chain.next_hash() for _ in range(len(chain))]
+    # كل جولة تكشف أصل تجزئة الجولة التي سبقتها، وأول جولة أصل الالتزام
+    assert verify_chain_link(hashes[0], chain.commitment)
+    for previous, current in zip(hashes, hashes[1:]):
+        assert verify_chain_link(current, previous)
+    assert hashes[-1] == "seed"
+
+
+def test_crash_point_is_deterministic_and_bounded():
+    points = [
+        crash_point_from_hash(hashlib.sha256(str(i).encode()).hexdigest(), "salt", max_multiplier=50.0)
+        for i in range(500)
+    ]
+    assert points == [
+        crash_point_from_hash(hashlib.sha256(str(i).encode()).hexdigest(), "salt", max_multiplier=50.0)
+        for i in range(500)
+    ]
+    assert all(1.0 <= point <= 50.0 for point in points)
+    assert any(point == 1.0 for point in points)
+
+
+def test_round_hash_is_not_sent_before_the_crash():
+    async def play():
+        engine = RocketRoundEngine(chain_length=20, betting_seconds=1.0, crashed_seconds=1.0)
+        websocket = FakeWebSocket()
+        engine.subscribe(websocket, 7)
+
+        engine._start_round(0.0)
+        game_hash = engine.game_hash
+        key = engine.bet_key(7)
+        assert engine.reserve_bet(7, 100) is None
+        assert engine.place_bet(7, 100, None, engine.round_key) is None
+        engine.notify_user(7, {"type": "bet_accepted", "key": key})
+
+        now = 0.0
+        while engine.phase != "crashed":
+            now += 0.05
+            await engine.tick(now)
+            await asyncio.sleep(0)
+        for _ in range(3):
+            await asyncio.sleep(0)
+        return game_hash, key, websocket.frames
+
+    game_hash, key, frames = asyncio.run(play())
+    assert game_hash not in key
+
+    crashed_at = next(i for i, frame in enumerate(frames) if frame["type"] == "rocket_crashed")
+    assert frames[crashed_at]["hash"] == game_hash
+    for frame in frames[:crashed_at]:
+        assert game_hash not in json.dumps(frame)
+
+
+def test_bet_from_a_previous_round_is_rejected():
+    async def play():
+        engine = RocketRoundEngine(chain_length=20)
+        engine._start_round(0.0)
+        round_key = engine.round_key
+        assert engine.reserve_bet(1, 100) is None
+        engine._start_round(1.0)
+        return engine.place_bet(1, 100, None, round_key), engine.bets
+
+    error, bets = asyncio.run(play())
+    assert error is not None
+    assert bets == {}
+
+
+def test_bet_requests_are_debited_once_per_tick():
+    batches = []
+
+    async def play():
+        engine = RocketRoundEngine(chain_length=20, betting_seconds=10.0)
+
+        async def debit(round_key, requests):
+            batches.append([request["userId"] for request in requests])
+            for request in requests:
+                engine.place_bet(request["userId"], request["amount"], request["autoCashout"], round_key)
+
+        engine.set_bet_handler(debit)
+        engine._start_round(0.0)
+        for user_id in (1, 2, 3):
+            assert engine.request_bet(user_id, 100, None) is None
+        # طلب ثانٍ لنفس المستخدم قبل خصم الأول يُرفض
+        assert engine.request_bet(1, 100, None) is not None
+
+        await engine.tick(0.05)
+        await engine._debit_task
+        assert engine.request_bet(4, 100, None) is None
+        await engine.tick(0.1)
+        await engine._debit_task
+        return engine
+
+    engine = asyncio.run(play())
+    assert batches == [[1, 2, 3], [4]]
+    assert set(engine.bets) == {1, 2, 3, 4}
+    assert not engine._reserving
+
+
+def test_bet_requests_after_launch_are_not_debited():
+    async def play():
+        engine = RocketRoundEngine(chain_length=20, betting_seconds=1.0)
+
+        async def debit(round_key, requests):
+            raise AssertionError("لا يجب الخصم بعد الإقلاع")
+
+        engine.set_bet_handler(debit)
+        engine._start_round(0.0)
+        assert engine.request_bet(1, 100, None) is None
+        engine.phase = "flying"
+        await engine.tick(0.05)
+        return engine
+
+    engine = asyncio.run(play())
+    assert engine._debit_task is None
+    assert not engine._reserving and engine.bets == {}
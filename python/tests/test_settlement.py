@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+
+"""اختبارات طابور تسوية الرقائق باستخدام مخزن SQLite بدلاً من قاعدة البيانات الرئيسية"""
+
+import asyncio
+import sqlite3
+
+import pytest
+
+from python.settlement import DEFAULT_CHIPS, SQLiteSettlementStore, SettlementQueue, create_store_from_env
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = SQLiteSettlementStore(str(tmp_path / "settlements.sqlite3"))
+    store.create_user(1)
+    store.create_user(2)
+    yield store
+    store.close()
+
+
+def _entry(key, user_id=1, amount=100):
+    return SettlementQueue._entry(user_id, amount, key, "test")
+
+
+def _balance(store, user_id):
+    return store._conn.execute("SELECT chips FROM users WHERE id = ?", (user_id,)).fetchone()[0]
+
+
+class FlakyStore:
+    """مخزن يفشل في أول دفعة ثم يمرر الدفعات للمخزن الحقيقي"""
+
+    def __init__(self, store):
+        self.store = store
+        self.calls = 0
+
+    def apply_batch(self, entries):
+        self.calls += 1
+        if self.calls == 1:
+            raise sqlite3.OperationalError("database is locked")
+        return self.store.apply_batch(entries)
+
+
+def test_apply_batch_skips_keys_already_applied(store):
+    assert len(store.apply_batch([_entry("k1")])) == 1
+    applied = store.apply_batch([_entry("k1"), _entry("k2", amount=50)])
+
+    assert [item["key"] for item in applied] == ["k2"]
+    assert _balance(store, 1) == DEFAULT_CHIPS + 150
+
+
+def test_reference_is_unique_in_the_database(store):
+    store.apply_batch([_entry("k1")])
+    with pytest.raises(sqlite3.IntegrityError):
+        store._conn.execute(
+            "INSERT INTO user_chips_transactions (user_id, amount, balance_after, type, reference) "
+            "VALUES (1, 100, 0, 'test', 'k1')"
+        )
+
+
+def test_submit_rejects_pending_duplicate_key():
+    queue = SettlementQueue(None, None)
+    assert queue.submit(1, 100, key="k1", transaction_type="test")
+    assert not queue.submit(1, 100, key="k1", transaction_type="test")
+    assert queue.pending_count == 1
+
+
+def test_failed_batch_is_requeued_and_applied_once(store):
+    notifications = []
+
+    async def notify(updates):
+        notifications.append(updates)
+
+    queue = SettlementQueue(FlakyStore(store), notify)
+    queue.submit(1, 100, key="k1", transaction_type="test")
+    queue.submit(2, -30, key="k2", transaction_type="test")
+
+    with pytest.raises(sqlite3.OperationalError):
+        asyncio.run(queue.flush())
+    assert queue.pending_count == 2
+
+    asyncio.run(queue.flush())
+    assert queue.pending_count == 0
+    assert _balance(store, 1) == DEFAULT_CHIPS + 100
+    assert _balance(store, 2) == DEFAULT_CHIPS - 30
+    assert notifications == [{
+        1: {"type": "chips_update", "chips": DEFAULT_CHIPS + 100, "changes": [
+            {"amount": 100, "type": "test", "description": None, "reference": "k1"}]},
+        2: {"type": "chips_update", "chips": DEFAULT_CHIPS - 30, "changes": [
+            {"amount": -30, "type": "test", "description": None, "reference": "k2"}]},
+    }]
+
+    # إعادة إرسال نفس المفاتيح بعد نجاحها لا تصرف المبلغ مرة أخرى
+    queue.submit(1, 100, key="k1", transaction_type="test")
+    asyncio.run(queue.flush())
+    assert _balance(store, 1) == DEFAULT_CHIPS + 100
+    assert len(notifications) == 1
+
+
+def test_debit_batch_requires_sufficient_balance(store):
+    updates = []
+
+    async def notify(chips_updates):
+        updates.append(chips_updates)
+
+    queue = SettlementQueue(store, notify)
+    balances = asyncio.run(queue.debit(
+        [(1, DEFAULT_CHIPS + 1, "bet1"), (2, 100, "bet2"), (1, 100, "bet3")],
+        transaction_type="bet",
+    ))
+    # الخصم الذي لا يكفيه الرصيد يُتخطى وحده، والبقية تُكتب في معاملة واحدة
+    assert balances == {"bet2": DEFAULT_CHIPS - 100, "bet3": DEFAULT_CHIPS - 100}
+    assert len(updates) == 1
+    assert {user_id: update["chips"] for user_id, update in updates[0].items()} == {
+        1: DEFAULT_CHIPS - 100,
+        2: DEFAULT_CHIPS - 100,
+    }
+
+    # نفس المفتاح لا يُخصم مرتين
+    assert asyncio.run(queue.debit([(1, 100, "bet3")], transaction_type="bet")) == {}
+    assert _balance(store, 1) == DEFAULT_CHIPS - 100
+
+
+def test_unknown_users_get_no_wallet(store):
+    applied = store.apply_batch([_entry("k1", user_id=99), _entry("k2", user_id=1)])
+    assert [item["key"] for item in applied] == ["k2"]
+    assert store._conn.execute("SELECT COUNT(*) FROM users WHERE id = 99").fetchone()[0] == 0
+    assert store.debit_batch([SettlementQueue._entry(99, -10, "bet99", "bet")]) == []
+
+
+def test_store_is_disabled_without_a_database(monkeypatch, tmp_path):
+    monkeypatch.delenv("DATABASE_URL", raising=False)
+    monkeypatch.delenv("SETTLEMENT_BACKEND", raising=False)
+    assert create_store_from_env() is None
+
+    # البديل المحلي يُستخدم فقط عند طلبه صراحة
+    monkeypatch.setenv("SETTLEMENT_BACKEND", "sqlite")
+    monkeypatch.setenv("SETTLEMENT_DB_PATH", str(tmp_path / "local.sqlite3"))
+    store = create_store_from_env()
+    assert isinstance(store, SQLiteSettlementStore)
+    store.close()
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+
+"""اختبارات توزيع الطاولات: حلقة التجزئة المتسقة ورموز الاستئناف القابلة للتوجيه"""
+
+from python.session_resume import SeatSessions, table_id_from_token
+from python.sharding import HashRing, ShardMap, websocket_url
+
+WORKERS = ["http://127.0.0.1:3001", "http://127.0.0.1:3002", "http://127.0.0.1:3003"]
+
+
+def test_ring_is_deterministic_and_uses_every_node():
+    keys = list(range(1000))
+    owners = [HashRing(WORKERS).node_for(key) for key in keys]
+    assert owners == [HashRing(reversed(WORKERS)).node_for(key) for key in keys]
+    assert set(owners) == set(WORKERS)
+    assert HashRing().node_for(1) is None
+
+
+def test_adding_a_node_only_moves_keys_to_it():
+    ring = HashRing(WORKERS)
+    keys = list(range(1000))
+    before = {key: ring.node_for(key) for key in keys}
+
+    ring.add("http://127.0.0.1:3004")
+    after = {key: ring.node_for(key) for key in keys}
+    moved = [key for key in keys if before[key] != after[key]]
+    assert moved
+    assert all(after[key] == "http://127.0.0.1:3004" for key in moved)
+    # قرابة الربع فقط ينتقل للعقدة الجديدة وليس إعادة توزيع كاملة
+    assert len(moved) < len(keys) / 2
+
+    ring.remove("http://127.0.0.1:3004")
+    assert {key: ring.node_for(key) for key in keys} == before
+
+
+def test_shard_map_is_local_and_moved_tables():
+    assert ShardMap([], None).is_local(1)
+    assert ShardMap(WORKERS[:1], WORKERS[0]).is_local(1)
+
+    shards = ShardMap(WORKERS[:2], WORKERS[0])
+    tables = list(range(200))
+    assert shards.enabled
+    assert all(shards.is_local(t) == (shards.owner(t) == WORKERS[0]) for t in tables)
+
+    local = [t for t in tables if shards.is_local(t)]
+    shards.set_workers(WORKERS)
+    moved = shards.moved_tables(local)
+    assert moved and all(owner == WORKERS[2] for owner in moved.values())
+
+
+def test_websocket_url():
+    assert websocket_url("http://127.0.0.1:3001/") == "ws://127.0.0.1:3001/ws/poker"
+    assert websocket_url("https://example.com") == "wss://example.com/ws/poker"
+
+
+def test_resume_token_carries_its_table_id():
+    sessions = SeatSessions()
+    for table_id in (7, "7", "طاولة.1"):
+        table = {}
+        token = sessions.issue(table_id, table, "p1")
+        assert table_id_from_token(token) == table_id
+        assert sessions.lookup(token) == (table_id, "p1")
+
+    assert table_id_from_token("رمز-قديم") is None
+    assert table_id_from_token("zz.abc") is None
+    assert table_id_from_token(None) is None
@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+
+"""اختبارات لقطات حالة الخادم: الكتابة التزايدية، دمج السجل الإلحاقي، والاستعادة"""
+
+import asyncio
+import sqlite3
+
+import pytest
+
+from python.state_snapshot import StateSnapshotStore
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "state.sqlite3")
+
+
+def _store(path, compact_every=0):
+    store = StateSnapshotStore(path, compact_every=compact_every)
+    store.open()
+    return store
+
+
+def _restore(path):
+    tables, updates = {}, {}
+    store = StateSnapshotStore(path)
+    store.restore(tables, updates)
+    store.close()
+    return tables, updates
+
+
+def _count(store, table):
+    return store._conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+
+def test_flush_writes_only_dirty_tables_and_restores_them(path):
+    store = _store(path)
+    tables = {1: {"players": {"a": {}}}, "vip": {"players": {}}}
+    updates = {}
+    store.mark_table_dirty(1)
+    asyncio.run(store.flush(tables, updates))
+    assert _count(store, "table_snapshots") == 1
+
+    store.mark_table_dirty("vip")
+    store.mark_table_deleted(1)
+    asyncio.run(store.flush(tables, updates))
+    store.close()
+
+    restored, _ = _restore(path)
+    # مفاتيح الطاولات تحتفظ بنوعها (رقم أو نص)
+    assert restored == {"vip": {"players": {}}}
+
+
+def test_user_updates_are_logged_then_compacted_into_the_snapshot(path):
+    store = _store(path, compact_every=2)
+    tables = {}
+    updates = {7: [{"n": 1}]}
+    store.log_user_update(7, {"n": 1})
+    asyncio.run(store.flush(tables, updates))
+    assert _count(store, "user_update_log") == 1
+    assert _count(store, "user_update_snapshots") == 0
+
+    # الدفعة الثانية تدمج السجل في لقطة المستخدم وتفرغه
+    updates[7].append({"n": 2})
+    store.log_user_update(7, {"n": 2})
+    asyncio.run(store.flush(tables, updates))
+    assert _count(store, "user_update_log") == 0
+    assert _count(store, "user_update_snapshots") == 1
+    store.close()
+
+    _, restored = _restore(path)
+    assert restored == {7: [{"n": 1}, {"n": 2}]}
+
+
+def test_restore_combines_snapshot_and_log_in_order(path):
+    store = _store(path)
+    updates = {3: [{"n": 1}]}
+    store.mark_user_updates_reset(3)
+    asyncio.run(store.flush({}, updates))
+
+    updates[3].append({"n": 2})
+    store.log_user_update(3, {"n": 2})
+    asyncio.run(store.flush({}, updates))
+    store.close()
+
+    _, restored = _restore(path)
+    assert restored == {3: [{"n": 1}, {"n": 2}]}
+
+
+def test_delivered_updates_are_cleared(path):
+    store = _store(path)
+    updates = {5: [{"n": 1}]}
+    store.log_user_update(5, {"n": 1})
+    asyncio.run(store.flush({}, updates))
+
+    updates[5] = []
+    store.mark_user_updates_reset(5)
+    asyncio.run(store.flush({}, updates))
+    store.close()
+
+    _, restored = _restore(path)
+    assert restored == {}
+
+
+def test_failed_write_is_requeued(path, monkeypatch):
+    store = _store(path)
+    tables = {1: {"players": {}}}
+    store.mark_table_dirty(1)
+    store.log_user_update(2, {"n": 1})
+
+    def fail(batch):
+        raise sqlite3.OperationalError("disk I/O error")
+
+    monkeypatch.setattr(store, "_write_batch", fail)
+    with pytest.raises(sqlite3.OperationalError):
+        asyncio.run(store.flush(tables, {2: [{"n": 1}]}))
+    monkeypatch.undo()
+
+    asyncio.run(store.flush(tables, {2: [{"n": 1}]}))
+    store.close()
+
+    restored_tables, restored_updates = _restore(path)
+    assert restored_tables == {1: {"players": {}}}
+    assert restored_updates == {2: [{"n": 1}]}
+
+
+def test_flush_final_compacts_and_checkpoints(path):
+    store = _store(path)
+    updates = {9: [{"n": 1}]}
+    store.log_user_update(9, {"n": 1})
+    asyncio.run(store.flush_final({}, updates))
+    assert _count(store, "user_update_log") == 0
+    store.close()
+
+    _, restored = _restore(path)
+    assert restored == {9: [{"n": 1}]}
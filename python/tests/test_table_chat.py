@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+
+"""اختبارات دردشة الطاولات: توحيد الكتابة العربية ومطابقة Aho-Corasick وحجب الكلمات"""
+
+from python.table_chat import DEFAULT_BLOCKED_WORDS, AhoCorasick, ChatFilter, TableChat, normalize_text
+
+
+def test_normalize_text_maps_back_to_the_original_positions():
+    text = "حَمـااار"
+    normalized, starts, ends = normalize_text(text)
+    # حذف التشكيل والتطويل ودمج الألف المكررة
+    assert normalized == "حمار"
+    assert [text[start:end + 1] for start, end in zip(starts, ends)] == ["حَ", "مـ", "ااا", "ر"]
+
+    assert normalize_text("أحمد إلى مدرسة WWW")[0] == "احمد الي مدرسه www"
+    assert normalize_text("٢٠٢٤")[0] == "2024"
+    # الحروف اللاتينية المكررة لا تُدمج
+    assert normalize_text("www")[0] == "www"
+
+
+def test_aho_corasick_finds_overlapping_patterns_in_one_pass():
+    matcher = AhoCorasick(["he", "she", "his", "hers"])
+    # عند كل موضع نهاية يُرجع أطول كلمة منتهية فيه
+    assert matcher.search("ushers") == [(1, 3), (2, 5)]
+    assert matcher.search("ahishe") == [(1, 3), (3, 5)]
+    assert matcher.search("xyz") == []
+    assert AhoCorasick([]).search("anything") == []
+
+
+def test_filter_masks_obfuscated_words_in_the_original_text():
+    chat_filter = ChatFilter(DEFAULT_BLOCKED_WORDS)
+
+    assert chat_filter.censor("يا حَمـااار تعال") == ("يا ******** تعال", True)
+    assert chat_filter.censor("انت غبى") == ("انت ***", True)
+    assert chat_filter.censor("مرحبا يا صديقي") == ("مرحبا يا صديقي", False)
+
+
+def test_filter_masks_links_up_to_the_word_boundary():
+    chat_filter = ChatFilter(DEFAULT_BLOCKED_WORDS)
+
+    assert chat_filter.censor("زور www.spam.com الآن") == ("زور ************ الآن", True)
+    assert chat_filter.censor("HTTPS://X.y/z ok") == ("************* ok", True)
+
+
+def test_prepare_flags_filtered_messages_and_keeps_history():
+    chat = TableChat(ChatFilter(["غبي"]), history_size=2, max_length=10)
+
+    assert chat.prepare(1, "p1", "a", "   ") is None
+    message = chat.prepare(1, "p1", "a", "انت غبي")
+    assert message["message"] == "انت ***" and message["filtered"] is True
+    assert "filtered" not in chat.prepare(1, "p1", "a", "مرحبا")
+    assert chat.prepare(1, "p1", "a", "x" * 50)["message"] == "x" * 10
+    # السجل الدائري يحتفظ بآخر رسالتين فقط
+    assert len(chat._history[1]) == 2
+
+
+def test_rate_limit_refills_over_time():
+    chat = TableChat(ChatFilter([]), rate=1.0, burst=2)
+
+    assert chat.allow("p1", now=0.0) == 0.0
+    assert chat.allow("p1", now=0.0) == 0.0
+    assert chat.allow("p1", now=0.0) == 1.0
+    assert chat.allow("p2", now=0.0) == 0.0
+    assert chat.allow("p1", now=1.0) == 0.0
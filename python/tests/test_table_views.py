@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+
+"""اختبارات إطارات حالة الطاولة: الجزء العام المخزن والجزء الخاص بكل مقعد"""
+
+import json
+
+from python.table_views import TableViewCache
+
+
+def _table():
+    return {
+        "players": {"p1": {"username": "a", "token": "secret"}, "p2": {"username": "b"}},
+        "game_state": {"phase": "preflop", "deck": ["2s", "3s"]},
+        "private": {"p1": {"hole_cards": ["As", "Kd"]}, "p2": {"hole_cards": ["10h", "10c"]}},
+    }
+
+
+def test_each_seat_sees_only_its_own_private_part():
+    views = TableViewCache()
+    table = _table()
+
+    p1 = json.loads(views.frame_for(1, table, "p1", "t"))
+    p2 = json.loads(views.frame_for(1, table, "p2", "t"))
+    spectator = json.loads(views.public_frame(1, table, "t"))
+
+    assert p1["private"] == {"hole_cards": ["As", "Kd"]}
+    assert p2["private"] == {"hole_cards": ["10h", "10c"]}
+    assert "private" not in spectator
+    assert "deck" not in spectator["data"]
+    assert "token" not in spectator["players"]["p1"]
+    assert {**p1, "private": None} == {**spectator, "private": None}
+
+
+def test_timestamp_is_not_frozen_in_the_cached_prefix():
+    views = TableViewCache()
+    table = _table()
+
+    assert json.loads(views.public_frame(1, table, "t1"))["timestamp"] == "t1"
+    assert json.loads(views.public_frame(1, table, "t2"))["timestamp"] == "t2"
+
+    # التغيير لا يظهر حتى يُبطل الإطار المخزن
+    table["game_state"]["phase"] = "flop"
+    assert json.loads(views.public_frame(1, table))["data"]["phase"] == "preflop"
+    views.invalidate(1)
+    assert json.loads(views.public_frame(1, table))["data"]["phase"] == "flop"
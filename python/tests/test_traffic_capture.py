@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+
+"""اختبارات تسجيل الحركة: كتابة السجلات على دفعات وقراءتها بنفس الترتيب"""
+
+import asyncio
+import gzip
+import os
+
+from python.traffic_capture import (
+    KIND_CLOSE,
+    KIND_FRAME,
+    KIND_HTTP,
+    KIND_OPEN,
+    TrafficRecorder,
+    read_capture,
+    summarize,
+)
+
+
+def test_records_round_trip_across_flushes(tmp_path):
+    path = str(tmp_path / "capture" / "traffic-{pid}.bin")
+    recorder = TrafficRecorder(path)
+    assert recorder.path == path.format(pid=os.getpid())
+
+    conn_id = recorder.open("/ws/42")
+    recorder.frame(conn_id, '{"type":"ping"}')
+    recorder.flush_now()
+    # كل دفعة عضو gzip مستقل يُقرأ مع ما قبله
+    recorder.frame(conn_id, '{"type":"chat_message","message":"مرحبا"}')
+    recorder.http("POST", "/rocket/bet", {"amount": 100})
+    recorder.close(conn_id)
+    asyncio.run(recorder.flush())
+
+    records = list(read_capture(recorder.path))
+    assert [(record.conn_id, record.kind, record.payload) for record in records] == [
+        (1, KIND_OPEN, "/ws/42"),
+        (1, KIND_FRAME, '{"type":"ping"}'),
+        (1, KIND_FRAME, '{"type":"chat_message","message":"مرحبا"}'),
+        (0, KIND_HTTP, 'POST /rocket/bet\n{"amount": 100}'),
+        (1, KIND_CLOSE, ""),
+    ]
+    assert [record.timestamp for record in records] == sorted(record.timestamp for record in records)
+
+    summary = summarize(records)
+    assert summary["records"] == 5
+    assert summary["connections"] == {"/ws/{user_id}": 1}
+    assert summary["frames"] == {"ping": 1, "chat_message": 1}
+    assert summary["http"] == {"/rocket/bet": 1}
+
+
+def test_truncated_capture_stops_at_the_last_complete_record(tmp_path):
+    recorder = TrafficRecorder(str(tmp_path / "traffic.bin"))
+    conn_id = recorder.open("/ws/poker")
+    recorder.frame(conn_id, '{"type":"join_table"}')
+    recorder.flush_now()
+
+    with gzip.open(recorder.path, "rb") as f:
+        data = f.read()
+    with gzip.open(recorder.path, "wb") as f:
+        f.write(data[:-5])
+
+    assert [record.kind for record in read_capture(recorder.path)] == [KIND_OPEN]
+
+
+def test_disabled_recorder_writes_nothing():
+    recorder = TrafficRecorder(None)
+    assert not recorder.enabled
+    assert recorder.open("/ws/1") == 0
+    recorder.frame(0, "{}")
+    recorder.http("POST", "/rocket/bet", {})
+    assert recorder._pending == []
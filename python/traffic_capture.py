@@ -0,0 +1,489 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+صاروخ مصر - تسجيل حركة الخادم وإعادة تشغيلها
+=======================================
+هذا الملف يسجل الإطارات الواردة الحقيقية (اتصالات WebSocket ورسائلها وطلبات الدفع عبر HTTP)
+في ملف مضغوط، ثم يعيد تشغيلها على نسخة محلية من realtime_server.app بسرعة 1x حتى 100x
+لمقارنة زمن الاستجابة واستهلاك المعالج بين نسختين من الخادم. الحمل المصطنع لا يشبه
+الحركة الحقيقية (موجات إعادة الاتصال، ذروات الدردشة، موجات الانضمام).
+
+التسجيل اختياري عبر TRAFFIC_CAPTURE_PATH (يمكن أن يحتوي المسار على {pid} عند تشغيل عدة عمليات).
+
+صيغة الملف: gzip يحتوي سجلات متتالية، لكل سجل رأس ثابت <dIBI (الطابع الزمني، رقم الاتصال،
+النوع، طول البيانات) يليه نص UTF-8. الأنواع: 1 فتح اتصال (البيانات = المسار)، 2 إطار وارد،
+3 إغلاق، 4 طلب HTTP (رقم الاتصال 0 والبيانات = "METHOD PATH" ثم سطر جديد ثم الجسم).
+
+الاستخدام:
+  python -m python.traffic_capture report CAPTURE
+  python -m python.traffic_capture replay CAPTURE [--speed 10] [--build DIR ...] [--output report.json]
+  python -m python.traffic_capture compare BASE.json NEW.json
+"""
+
+import os
+import sys
+import gzip
+import json
+import time
+import socket
+import struct
+import signal
+import asyncio
+import logging
+import argparse
+import tempfile
+import subprocess
+import urllib.request
+from collections import Counter, defaultdict, deque, namedtuple
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger("traffic_capture")
+
+RECORD_HEADER = struct.Struct("<dIBI")
+
+KIND_OPEN = 1
+KIND_FRAME = 2
+KIND_CLOSE = 3
+KIND_HTTP = 4
+
+CaptureRecord = namedtuple("CaptureRecord", ["timestamp", "conn_id", "kind", "payload"])
+
+# أنواع الرد التي تُحسب بها زمن الاستجابة لكل نوع رسالة واردة
+RESPONSE_TYPES: Dict[str, Tuple[str, ...]] = {
+    "ping": ("pong",),
+    "join_table": ("game_state", "error"),
+    "spectate_table": ("game_state", "error"),
+    "resume_session": ("session_resumed", "session_expired"),
+    "start_hand": ("hand_started", "error"),
+    "player_action": ("action_result", "error"),
+    "chat_message": ("chat_message", "chat_throttled", "error"),
+    "local_update": ("local_update_confirmed",),
+}
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class TrafficRecorder:
+    """مسجل الإطارات الواردة على دفعات خارج حلقة الأحداث"""
+
+    def __init__(self, path: Optional[str], flush_interval: float = 0.5):
+        self.path = path.format(pid=os.getpid()) if path else None
+        self.flush_interval = flush_interval
+        self._next_conn_id = 0
+        self._pending: List[bytes] = []
+        self._flush_lock = asyncio.Lock()
+
+    @classmethod
+    def from_env(cls) -> "TrafficRecorder":
+        """إنشاء المسجل من متغيرات البيئة (معطل إذا لم يُحدد TRAFFIC_CAPTURE_PATH)"""
+        return cls(
+            os.environ.get("TRAFFIC_CAPTURE_PATH") or None,
+            flush_interval=float(os.environ.get("TRAFFIC_CAPTURE_INTERVAL", 0.5)),
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return self.path is not None
+
+    def _append(self, conn_id: int, kind: int, payload: str):
+        data = payload.encode("utf-8")
+        self._pending.append(RECORD_HEADER.pack(time.time(), conn_id, kind, len(data)) + data)
+
+    def open(self, path: str) -> int:
+        """تسجيل اتصال WebSocket جديد وإرجاع رقمه (0 إذا كان التسجيل معطلاً)"""
+        if not self.enabled:
+            return 0
+        self._next_conn_id += 1
+        self._append(self._next_conn_id, KIND_OPEN, path)
+        return self._next_conn_id
+
+    def frame(self, conn_id: int, text: str):
+        if conn_id:
+            self._append(conn_id, KIND_FRAME, text)
+
+    def close(self, conn_id: int):
+        if conn_id:
+            self._append(conn_id, KIND_CLOSE, "")
+
+    def http(self, method: str, path: str, body: Any):
+        """تسجيل طلب دفع عبر HTTP"""
+        if self.enabled:
+            self._append(0, KIND_HTTP, f"{method} {path}\n" + json.dumps(body, ensure_ascii=False, default=str))
+
+    def _write(self, batch: List[bytes]):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # كل دفعة عضو gzip مستقل، وقراءة الملف تدمج الأعضاء تلقائياً
+        with gzip.open(self.path, "ab", compresslevel=1) as f:
+            f.write(b"".join(batch))
+
+    async def flush(self):
+        if not self._pending:
+            return
+        async with self._flush_lock:
+            batch, self._pending = self._pending, []
+            await asyncio.to_thread(self._write, batch)
+
+    def flush_now(self):
+        batch, self._pending = self._pending, []
+        if batch:
+            self._write(batch)
+
+    async def run(self):
+        """حلقة الكتابة الدورية في الخلفية"""
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"خطأ أثناء كتابة ملف تسجيل الحركة: {str(e)}")
+
+
+def read_capture(path: str) -> Iterator[CaptureRecord]:
+    """قراءة سجلات ملف التسجيل بالترتيب"""
+    with gzip.open(path, "rb") as f:
+        while True:
+            header = f.read(RECORD_HEADER.size)
+            if len(header) < RECORD_HEADER.size:
+                return
+            timestamp, conn_id, kind, length = RECORD_HEADER.unpack(header)
+            payload = f.read(length)
+            if len(payload) < length:
+                return
+            yield CaptureRecord(timestamp, conn_id, kind, payload.decode("utf-8"))
+
+
+def _message_type(text: str) -> Optional[str]:
+    try:
+        message = json.loads(text)
+    except ValueError:
+        return None
+    return message.get("type") if isinstance(message, dict) else None
+
+
+def _endpoint(path: str) -> str:
+    """تجميع المسارات حسب نقطة النهاية (/ws/42 -> /ws/{user_id})"""
+    parts = path.split("/")
+    return "/".join("{user_id}" if part.isdigit() else part for part in parts)
+
+
+def summarize(records: List[CaptureRecord]) -> Dict[str, Any]:
+    """ملخص ملف التسجيل: المدة، الاتصالات حسب نقطة النهاية، أنواع الإطارات، وذروة المعدل"""
+    if not records:
+        return {"records": 0}
+
+    connections = Counter()
+    frame_types = Counter()
+    http_paths = Counter()
+    per_second = Counter()
+    start = records[0].timestamp
+    for record in records:
+        if record.kind == KIND_OPEN:
+            connections[_endpoint(record.payload)] += 1
+        elif record.kind == KIND_FRAME:
+            frame_types[_message_type(record.payload) or "unknown"] += 1
+            per_second[int(record.timestamp - start)] += 1
+        elif record.kind == KIND_HTTP:
+            http_paths[_endpoint(record.payload.split("\n", 1)[0].split(" ", 1)[1])] += 1
+
+    return {
+        "records": len(records),
+        "duration_s": round(records[-1].timestamp - start, 3),
+        "connections": dict(connections),
+        "frames": dict(frame_types.most_common()),
+        "http": dict(http_paths),
+        "peak_frames_per_s": max(per_second.values()) if per_second else 0,
+    }
+
+
+def _percentile(values: List[float], percent: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(percent / 100 * (len(ordered) - 1))))
+    return round(ordered[index] * 1000, 3)
+
+
+def _process_cpu_seconds(pid: int) -> float:
+    """زمن المعالج (مستخدم + نظام) لعملية من /proc"""
+    with open(f"/proc/{pid}/stat") as f:
+        fields = f.read().rsplit(")", 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+class Replayer:
+    """إعادة تشغيل ملف تسجيل على خادم محلي بسرعة مضاعفة"""
+
+    def __init__(self, records: List[CaptureRecord], base_url: str, speed: float = 1.0,
+                 response_timeout: float = 2.0):
+        self.records = records
+        self.base_url = base_url.rstrip("/")
+        self.ws_url = "ws" + self.base_url[len("http"):]
+        self.speed = speed
+        self.response_timeout = response_timeout
+
+        self.latencies: List[float] = []
+        self.http_latencies: List[float] = []
+        self.sent = 0
+        self.received = 0
+        self.timeouts = 0
+        self.errors = 0
+
+    async def _sleep_until(self, timestamp: float):
+        delay = (timestamp - self._t0) / self.speed - (time.perf_counter() - self._started)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    async def _replay_connection(self, events: List[CaptureRecord]):
+        import websockets
+
+        await self._sleep_until(events[0].timestamp)
+        try:
+            connection = await websockets.connect(self.ws_url + events[0].payload, max_size=None)
+        except Exception:
+            self.errors += 1
+            return
+
+        # الرسائل المنتظرة للرد: (أنواع الرد المتوقعة، وقت الإرسال)
+        pending: deque = deque()
+
+        async def read():
+            async for data in connection:
+                self.received += 1
+                reply_type = _message_type(data if isinstance(data, str) else data.decode("utf-8"))
+                for item in pending:
+                    if reply_type in item[0]:
+                        self.latencies.append(time.perf_counter() - item[1])
+                        pending.remove(item)
+                        break
+
+        reader = asyncio.create_task(read())
+        try:
+            for record in events[1:]:
+                await self._sleep_until(record.timestamp)
+                if record.kind == KIND_CLOSE:
+                    break
+                expected = RESPONSE_TYPES.get(_message_type(record.payload))
+                if expected:
+                    pending.append((expected, time.perf_counter()))
+                await connection.send(record.payload)
+                self.sent += 1
+
+            # انتظار الردود المتبقية حتى المهلة
+            deadline = time.perf_counter() + self.response_timeout
+            while pending and time.perf_counter() < deadline and not reader.done():
+                await asyncio.sleep(0.01)
+            self.timeouts += len(pending)
+        except Exception:
+            self.errors += 1
+        finally:
+            reader.cancel()
+            try:
+                await connection.close()
+            except Exception:
+                pass
+
+    async def _replay_http(self, record: CaptureRecord):
+        await self._sleep_until(record.timestamp)
+        request_line, body = record.payload.split("\n", 1)
+        method, path = request_line.split(" ", 1)
+        request = urllib.request.Request(self.base_url + path, data=body.encode("utf-8"), method=method)
+        request.add_header("Content-Type", "application/json")
+
+        started = time.perf_counter()
+        try:
+            await asyncio.to_thread(lambda: urllib.request.urlopen(request, timeout=10).read())
+            self.http_latencies.append(time.perf_counter() - started)
+        except Exception:
+            self.errors += 1
+
+    async def run(self) -> Dict[str, Any]:
+        connections: Dict[int, List[CaptureRecord]] = defaultdict(list)
+        http_records = []
+        for record in self.records:
+            if record.kind == KIND_HTTP:
+                http_records.append(record)
+            elif record.kind == KIND_OPEN or record.conn_id in connections:
+                # الإطارات التي بدأ اتصالها قبل بداية التسجيل تُتجاهل
+                connections[record.conn_id].append(record)
+
+        self._t0 = self.records[0].timestamp
+        self._started = time.perf_counter()
+        await asyncio.gather(
+            *(self._replay_connection(events) for events in connections.values()),
+            *(self._replay_http(record) for record in http_records),
+        )
+
+        return {
+            "speed": self.speed,
+            "wall_s": round(time.perf_counter() - self._started, 3),
+            "connections": len(connections),
+            "sent": self.sent,
+            "received": self.received,
+            "responses": len(self.latencies),
+            "timeouts": self.timeouts,
+            "errors": self.errors,
+            "latency_ms": {
+                "p50": _percentile(self.latencies, 50),
+                "p95": _percentile(self.latencies, 95),
+                "p99": _percentile(self.latencies, 99),
+                "max": _percentile(self.latencies, 100),
+            },
+            "http_latency_ms": {
+                "p50": _percentile(self.http_latencies, 50),
+                "p95": _percentile(self.http_latencies, 95),
+                "max": _percentile(self.http_latencies, 100),
+            },
+        }
+
+
+def _free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _wait_until_ready(base_url: str, process: subprocess.Popen, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("توقفت عملية الخادم قبل أن تصبح جاهزة")
+        try:
+            urllib.request.urlopen(base_url + "/", timeout=1).read()
+            return
+        except Exception:
+            time.sleep(0.1)
+    raise RuntimeError("لم يصبح الخادم جاهزاً في الوقت المحدد")
+
+
+def replay_build(build_dir: str, records: List[CaptureRecord], speed: float) -> Dict[str, Any]:
+    """تشغيل realtime_server.app من مجلد نسخة في عملية منفصلة وإعادة تشغيل الحركة عليه"""
+    port = _free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    with tempfile.TemporaryDirectory() as data_dir:
+        env = dict(os.environ)
+        env.pop("TRAFFIC_CAPTURE_PATH", None)
+        env.update({
+            "PYTHONPATH": build_dir,
+            "REALTIME_SNAPSHOT_PATH": os.path.join(data_dir, "snapshot.sqlite3"),
+            "HAND_HISTORY_DIR": os.path.join(data_dir, "hand_history"),
+            "SETTLEMENT_BACKEND": "sqlite",
+            "SETTLEMENT_DB_PATH": os.path.join(data_dir, "settlements.sqlite3"),
+        })
+        process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "python.realtime_server:app",
+             "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+            cwd=build_dir, env=env,
+        )
+        try:
+            _wait_until_ready(base_url, process)
+            cpu_before = _process_cpu_seconds(process.pid)
+            result = asyncio.run(Replayer(records, base_url, speed).run())
+            cpu_seconds = _process_cpu_seconds(process.pid) - cpu_before
+        finally:
+            process.send_signal(signal.SIGTERM)
+            try:
+                process.wait(timeout=15)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+    result["build"] = build_dir
+    result["cpu_s"] = round(cpu_seconds, 3)
+    result["cpu_ms_per_1k_frames"] = round(cpu_seconds * 1000 / result["sent"] * 1000, 3) if result["sent"] else None
+    return result
+
+
+def _change(base: Optional[float], new: Optional[float]) -> str:
+    if base is None or new is None:
+        return "-"
+    if base == 0:
+        return f"{new:+.3f}"
+    return f"{(new - base) / base * 100:+.1f}%"
+
+
+def format_comparison(base: Dict[str, Any], new: Dict[str, Any]) -> str:
+    """جدول الفروق بين تقريري نسختين"""
+    rows = [
+        ("latency p50 (ms)", base["latency_ms"]["p50"], new["latency_ms"]["p50"]),
+        ("latency p95 (ms)", base["latency_ms"]["p95"], new["latency_ms"]["p95"]),
+        ("latency p99 (ms)", base["latency_ms"]["p99"], new["latency_ms"]["p99"]),
+        ("latency max (ms)", base["latency_ms"]["max"], new["latency_ms"]["max"]),
+        ("http p95 (ms)", base["http_latency_ms"]["p95"], new["http_latency_ms"]["p95"]),
+        ("cpu (s)", base["cpu_s"], new["cpu_s"]),
+        ("cpu ms / 1k frames", base["cpu_ms_per_1k_frames"], new["cpu_ms_per_1k_frames"]),
+        ("timeouts", base["timeouts"], new["timeouts"]),
+        ("errors", base["errors"], new["errors"]),
+    ]
+    lines = [f"{'':<22}{'base':>12}{'new':>12}{'change':>10}",
+             f"{'build':<22}{os.path.basename(base['build'].rstrip('/')):>12}{os.path.basename(new['build'].rstrip('/')):>12}"]
+    for name, base_value, new_value in rows:
+        lines.append(f"{name:<22}{str(base_value):>12}{str(new_value):>12}{_change(base_value, new_value):>10}")
+    return "\n".join(lines)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="تسجيل حركة الخادم وإعادة تشغيلها")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    report = commands.add_parser("report", help="ملخص ملف تسجيل")
+    report.add_argument("capture")
+
+    replay = commands.add_parser("replay", help="إعادة تشغيل ملف تسجيل على نسخة أو أكثر من الخادم")
+    replay.add_argument("capture")
+    replay.add_argument("--speed", type=float, default=1.0, help="سرعة إعادة التشغيل (1 حتى 100)")
+    replay.add_argument("--build", action="append", help="مجلد نسخة الخادم (يمكن تكراره للمقارنة)")
+    replay.add_argument("--output", help="حفظ التقرير بصيغة JSON")
+
+    compare = commands.add_parser("compare", help="مقارنة تقريري إعادة تشغيل")
+    compare.add_argument("base")
+    compare.add_argument("new")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "report":
+        print(json.dumps(summarize(list(read_capture(args.capture))), ensure_ascii=False, indent=2))
+        return 0
+
+    if args.command == "compare":
+        with open(args.base) as f:
+            base = json.load(f)
+        with open(args.new) as f:
+            new = json.load(f)
+        print(format_comparison(base[-1] if isinstance(base, list) else base,
+                                new[-1] if isinstance(new, list) else new))
+        return 0
+
+    try:
+        import websockets  # noqa: F401
+    except ImportError:
+        print("مكتبة websockets مطلوبة لإعادة التشغيل: pip install websockets")
+        return 1
+
+    records = list(read_capture(args.capture))
+    if not records:
+        print("ملف التسجيل فارغ")
+        return 1
+    speed = min(max(args.speed, 1.0), 100.0)
+    builds = [os.path.abspath(build) for build in (args.build or [ROOT_DIR])]
+
+    results = []
+    for build in builds:
+        print(f"إعادة تشغيل {len(records)} سجل بسرعة {speed}x على {build}...")
+        result = replay_build(build, records, speed)
+        print(json.dumps(result, ensure_ascii=False, indent=2))
+        results.append(result)
+
+    if len(results) > 1:
+        for result in results[1:]:
+            print(format_comparison(results[0], result))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results if len(results) > 1 else results[0], f, ensure_ascii=False, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+صاروخ مصر - التحقق من هوية المستخدمين
+================================
+هذا الملف يتحقق من أن صاحب اتصال WebSocket هو المستخدم المذكور في المسار قبل قبول
+الرهانات باسمه. الخادم الرئيسي (Node.js) يصدر رمزاً موقعاً بنفس السر المشترك
+REALTIME_AUTH_SECRET ويرسله العميل في معامل الاستعلام token.
+
+صيغة الرمز: "USER_ID.EXPIRES.SIGNATURE" حيث SIGNATURE = HMAC-SHA256(السر، "USER_ID.EXPIRES").
+
+الاستخدام (إصدار رمز للاختبار):
+  python -m python.user_auth USER_ID [TTL_SECONDS]
+"""
+
+import os
+import sys
+import hmac
+import time
+import hashlib
+import logging
+from typing import List, Optional
+
+logger = logging.getLogger("user_auth")
+
+# العناوين المسموح لها بدون رمز عندما لا يُحدد السر (التطوير المحلي فقط)
+LOOPBACK_HOSTS = ("127.0.0.1", "::1")
+
+
+class UserTokens:
+    """إصدار رموز المستخدمين الموقعة والتحقق منها"""
+
+    def __init__(self, secret: Optional[str]):
+        self.secret = secret
+
+    @classmethod
+    def from_env(cls) -> "UserTokens":
+        """إنشاء المتحقق من متغيرات البيئة (بدون سر يُسمح للجهاز المحلي فقط)"""
+        return cls(os.environ.get("REALTIME_AUTH_SECRET") or None)
+
+    @property
+    def enabled(self) -> bool:
+        return self.secret is not None
+
+    def _signature(self, user_id: int, expires: int) -> str:
+        return hmac.new(
+            self.secret.encode("utf-8"), f"{user_id}.{expires}".encode("utf-8"), hashlib.sha256
+        ).hexdigest()
+
+    def sign(self, user_id: int, ttl: int = 3600) -> str:
+        """إصدار رمز للمستخدم صالح لعدد من الثواني"""
+        if not self.enabled:
+            raise RuntimeError("REALTIME_AUTH_SECRET غير محدد")
+        expires = int(time.time()) + ttl
+        return f"{user_id}.{expires}.{self._signature(user_id, expires)}"
+
+    def verify(self, token: Optional[str], user_id: int) -> bool:
+        """التحقق من أن الرمز صادر لهذا المستخدم ولم تنته صلاحيته"""
+        if not self.enabled or not token:
+            return False
+        try:
+            token_user, expires, signature = token.split(".", 2)
+            if int(token_user) != user_id or int(expires) < time.time():
+                return False
+        except ValueError:
+            return False
+        return hmac.compare_digest(signature, self._signature(user_id, int(expires)))
+
+    def authenticate(self, token: Optional[str], user_id: int, client_host: Optional[str]) -> bool:
+        """التحقق من هوية صاحب الاتصال: الرمز الموقع، أو الجهاز المحلي إذا لم يُحدد السر"""
+        if self.enabled:
+            return self.verify(token, user_id)
+        return client_host in LOOPBACK_HOSTS
+
+
+def main(argv: List[str]) -> int:
+    if not argv:
+        print("الاستخدام: python -m python.user_auth USER_ID [TTL_SECONDS]")
+        return 1
+
+    tokens = UserTokens.from_env()
+    if not tokens.enabled:
+        print("يرجى تحديد REALTIME_AUTH_SECRET")
+        return 1
+    print(tokens.sign(int(argv[0]), int(argv[1]) if len(argv) > 1 else 3600))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
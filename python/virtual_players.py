@@ -0,0 +1,607 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+صاروخ مصر - اللاعبون الوهميون في خادم البوكر
+========================================
+هذا الملف يضيف لاعبين وهميين إلى طاولات البوكر في خادم التحديثات الفورية.
+
+- يجلس اللاعب الوهمي ويغادر ويتخذ إجراءاته عبر نفس دوال الطاولة التي يستخدمها
+  اتصال WebSocket للاعب الحقيقي (seat_player / unseat_player / apply_player_action)
+- القرارات (تقدير قوة اليد بمحاكاة مونت كارلو) تُحسب في ProcessPoolExecutor حتى
+  لا تعطل حلقة الأحداث، وتُجمع القرارات المتزامنة في دفعات لتقليل كلفة الإرسال بين العمليات
+- لكل قرار مهلة قصوى: المحاكاة تتوقف عند المهلة، وإن تأخرت العملية يُستخدم قرار احتياطي
+"""
+
+import os
+import time
+import uuid
+import random
+import asyncio
+import logging
+import multiprocessing
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Set, Tuple
+
+from python.lobby_index import DEFAULT_MAX_PLAYERS
+
+logger = logging.getLogger("virtual_players")
+
+# أسماء اللاعبين الوهميين (نفس أسماء server/virtual-players.ts)
+BOT_NAMES = [
+    "أبو فهد",
+    "الصقر",
+    "فارس القمر",
+    "عاشق المغامرة",
+    "رحالة",
+    "أمير الليل",
+    "القناص",
+    "شاهين",
+    "النمر الأسود",
+    "محارب الصحراء",
+    "سهم الفجر",
+    "عاشق الحظ",
+    "أبو العز",
+    "فتى الجبل",
+    "أبو الخير",
+]
+
+AVATARS = [
+    "/assets/avatars/avatar1.png",
+    "/assets/avatars/avatar2.png",
+    "/assets/avatars/avatar3.png",
+    "/assets/avatars/avatar4.png",
+    "/assets/avatars/avatar5.png",
+]
+
+# إعدادات كل مستوى (نفس مستويات AILevel في server/ai-player.ts):
+# عدد جولات المحاكاة، مقدار العشوائية في تقدير القوة، ونطاق تحمل المخاطرة
+LEVELS: Dict[str, Dict[str, Any]] = {
+    "beginner": {"iterations": 100, "noise": 0.35, "risk": (0.2, 0.6)},
+    "intermediate": {"iterations": 300, "noise": 0.2, "risk": (0.3, 0.6)},
+    "expert": {"iterations": 800, "noise": 0.1, "risk": (0.4, 0.7)},
+    "pro": {"iterations": 1500, "noise": 0.05, "risk": (0.5, 0.8)},
+}
+
+RANKS = {"2": 2, "3": 3, "4": 4, "5": 5, "6": 6, "7": 7, "8": 8, "9": 9,
+         "10": 10, "T": 10, "J": 11, "Q": 12, "K": 13, "A": 14}
+SUITS = ("s", "h", "d", "c")
+FULL_DECK = [(rank, suit) for rank in range(2, 15) for suit in SUITS]
+
+# أقصى عدد خصوم في المحاكاة (ما بعده لا يغير التقدير كثيراً ويضاعف الكلفة)
+MAX_SIMULATED_OPPONENTS = 5
+
+Card = Tuple[int, str]
+
+
+def parse_card(card: Any) -> Optional[Card]:
+    """تحويل البطاقة إلى (القيمة، اللون) من "As" أو "10d" أو {"value": "A", "suit": "spades"}"""
+    if isinstance(card, dict):
+        value, suit = str(card.get("value", "")), str(card.get("suit", ""))
+    else:
+        text = str(card)
+        value, suit = text[:-1], text[-1:]
+    rank = RANKS.get(value.upper())
+    if rank is None or not suit:
+        return None
+    return rank, suit[0].lower()
+
+
+def parse_cards(cards: Optional[Sequence[Any]]) -> List[Card]:
+    parsed = (parse_card(card) for card in cards or [])
+    return [card for card in parsed if card is not None]
+
+
+def _straight_high(unique_ranks: List[int]) -> int:
+    """أعلى بطاقة في أفضل ستريت (0 إذا لم يوجد)، والقيم مرتبة تنازلياً دون تكرار"""
+    if 14 in unique_ranks:
+        unique_ranks = unique_ranks + [1]
+    run = 1
+    for i in range(1, len(unique_ranks)):
+        if unique_ranks[i] == unique_ranks[i - 1] - 1:
+            run += 1
+            if run >= 5:
+                return unique_ranks[i] + 4
+        else:
+            run = 1
+    return 0
+
+
+def hand_rank(cards: Sequence[Card]) -> Tuple[int, ...]:
+    """ترتيب أفضل يد من 5 إلى 7 بطاقات (كلما كبرت القيمة كانت اليد أقوى)"""
+    ranks = sorted((rank for rank, _ in cards), reverse=True)
+    counts = Counter(ranks)
+    suit_counts = Counter(suit for _, suit in cards)
+
+    flush_suit = next((suit for suit, count in suit_counts.items() if count >= 5), None)
+    flush_ranks: List[int] = []
+    if flush_suit:
+        flush_ranks = sorted((rank for rank, suit in cards if suit == flush_suit), reverse=True)
+        straight_flush = _straight_high(sorted(set(flush_ranks), reverse=True))
+        if straight_flush:
+            return (8, straight_flush)
+
+    quads = [rank for rank, count in counts.items() if count == 4]
+    if quads:
+        return (7, quads[0], max(rank for rank in ranks if rank != quads[0]))
+
+    trips = sorted((rank for rank, count in counts.items() if count == 3), reverse=True)
+    pairs = sorted((rank for rank, count in counts.items() if count == 2), reverse=True)
+    if trips and (len(trips) > 1 or pairs):
+        return (6, trips[0], max(trips[1:] + pairs))
+
+    if flush_suit:
+        return (5,) + tuple(flush_ranks[:5])
+
+    straight = _straight_high(sorted(counts, reverse=True))
+    if straight:
+        return (4, straight)
+
+    if trips:
+        return (3, trips[0]) + tuple(rank for rank in ranks if rank != trips[0])[:2]
+
+    if len(pairs) >= 2:
+        high, low = pairs[:2]
+        return (2, high, low, max(rank for rank in ranks if rank not in (high, low)))
+
+    if pairs:
+        return (1, pairs[0]) + tuple(rank for rank in ranks if rank != pairs[0])[:3]
+
+    return (0,) + tuple(ranks[:5])
+
+
+def estimate_equity(
+    hole_cards: List[Card],
+    board: List[Card],
+    opponents: int,
+    iterations: int,
+    deadline: Optional[float] = None,
+    rng: Optional[random.Random] = None,
+) -> Tuple[float, int]:
+    """تقدير نسبة الفوز بمحاكاة مونت كارلو حتى عدد الجولات أو المهلة (أيهما أسبق)"""
+    rng = rng or random.Random()
+    opponents = max(1, min(opponents, MAX_SIMULATED_OPPONENTS))
+    known = set(hole_cards) | set(board)
+    deck = [card for card in FULL_DECK if card not in known]
+    missing_board = 5 - len(board)
+    draw_count = missing_board + opponents * 2
+
+    score = 0.0
+    done = 0
+    while done < iterations:
+        # فحص المهلة كل 32 جولة فقط لتقليل كلفة قراءة الوقت
+        if deadline is not None and done % 32 == 0 and done and time.time() >= deadline:
+            break
+
+        drawn = rng.sample(deck, draw_count)
+        full_board = board + drawn[:missing_board]
+        mine = hand_rank(hole_cards + full_board)
+
+        best_other = max(
+            hand_rank(drawn[missing_board + i * 2: missing_board + i * 2 + 2] + full_board)
+            for i in range(opponents)
+        )
+        if mine > best_other:
+            score += 1.0
+        elif mine == best_other:
+            # تقسيم الوعاء بالتساوي (تقريب: نعتبر التعادل مع خصم واحد)
+            score += 0.5
+        done += 1
+
+    return (score / done if done else 0.0), done
+
+
+def fallback_decision(request: Dict[str, Any]) -> Dict[str, Any]:
+    """قرار فوري دون محاكاة عند تجاوز المهلة: تمرير إن أمكن وإلا انسحاب"""
+    to_call = request.get("to_call", 0)
+    return {
+        "bot_id": request["bot_id"],
+        "action": "check" if to_call <= 0 else "fold",
+        "amount": 0,
+        "equity": None,
+        "iterations": 0,
+        "fallback": True,
+    }
+
+
+def decide(request: Dict[str, Any]) -> Dict[str, Any]:
+    """اتخاذ قرار لاعب وهمي واحد (يعمل داخل عملية العمال)"""
+    level = LEVELS.get(request.get("level"), LEVELS["intermediate"])
+    rng = random.Random(request.get("seed"))
+
+    hole_cards = parse_cards(request.get("hole_cards"))
+    board = parse_cards(request.get("board"))
+    if len(hole_cards) != 2:
+        return fallback_decision(request)
+
+    equity, iterations = estimate_equity(
+        hole_cards, board, request.get("opponents", 1), level["iterations"],
+        deadline=request.get("deadline"), rng=rng,
+    )
+    if iterations == 0:
+        return fallback_decision(request)
+
+    pot = max(int(request.get("pot", 0)), 0)
+    to_call = max(int(request.get("to_call", 0)), 0)
+    chips = max(int(request.get("chips", 0)), 0)
+    min_raise = max(int(request.get("min_raise", 0)), 1)
+
+    # تقدير القوة مع عشوائية حسب المستوى، ثم مقارنتها بنصيب اللاعب العادل من الوعاء
+    noisy_equity = min(max(equity + rng.uniform(-level["noise"], level["noise"]), 0.0), 1.0)
+    fair_share = 1.0 / (min(request.get("opponents", 1), MAX_SIMULATED_OPPONENTS) + 1)
+    relative_strength = noisy_equity / fair_share
+    risk = rng.uniform(*level["risk"])
+    pot_odds = to_call / (pot + to_call) if to_call else 0.0
+
+    action, amount = ("check", 0) if to_call == 0 else ("call", min(to_call, chips))
+
+    if to_call and noisy_equity < pot_odds and relative_strength < 1.0 + risk:
+        action, amount = "fold", 0
+    elif relative_strength >= 2.0 - risk and chips > to_call:
+        ratio = 0.5 + risk * rng.uniform(0.5, 1.5)
+        raise_amount = max(int(pot * ratio), to_call + min_raise)
+        # تقريب المبلغ لأقرب 10 كما يفعل اللاعب الحقيقي
+        raise_amount = max(raise_amount - raise_amount % 10, to_call + min_raise)
+        if raise_amount >= chips:
+            action, amount = "all_in", chips
+        else:
+            action, amount = "raise", raise_amount
+    elif to_call >= chips:
+        action, amount = "all_in", chips
+
+    return {
+        "bot_id": request["bot_id"],
+        "action": action,
+        "amount": amount,
+        "equity": round(equity, 4),
+        "iterations": iterations,
+        "fallback": False,
+    }
+
+
+def decide_batch(requests: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """اتخاذ دفعة قرارات في عملية واحدة (نقطة الدخول في ProcessPoolExecutor)"""
+    results = []
+    for request in requests:
+        try:
+            results.append(decide(request))
+        except Exception:
+            results.append(fallback_decision(request))
+    return results
+
+
+def _warm_up() -> int:
+    """استدعاء فارغ لتشغيل عمليات العمال مسبقاً"""
+    return os.getpid()
+
+
+class _Bot:
+    """لاعب وهمي جالس على طاولة"""
+
+    __slots__ = ("bot_id", "table_id", "level", "info")
+
+    def __init__(self, bot_id: str, table_id: Any, level: str, info: Dict[str, Any]):
+        self.bot_id = bot_id
+        self.table_id = table_id
+        self.level = level
+        self.info = info
+
+
+class VirtualPlayerManager:
+    """إدارة اللاعبين الوهميين وتجميع قراراتهم في دفعات لعمليات العمال"""
+
+    def __init__(
+        self,
+        workers: int = 2,
+        batch_window: float = 0.01,
+        max_batch: int = 64,
+        decision_timeout: float = 0.25,
+        think_min: float = 0.6,
+        think_max: float = 2.0,
+        max_bots: int = 2000,
+    ):
+        self.workers = max(1, workers)
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self.decision_timeout = decision_timeout
+        self.think_min = think_min
+        self.think_max = max(think_min, think_max)
+        self.max_bots = max_bots
+
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._queue: List[Tuple[Dict[str, Any], asyncio.Future]] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._bots: Dict[str, _Bot] = {}
+        self._turns: Dict[Any, asyncio.Task] = {}
+        # جولة المراهنة الحالية في كل طاولة
+        # {table_id: ((رقم اليد، المرحلة)، المبلغ المطلوب للمجاراة، من تصرف منذ آخر رفع)}
+        self._bets: Dict[Any, Tuple[Tuple[int, Any], int, Set[Any]]] = {}
+
+        # دوال الطاولة المشتركة (تُربط من realtime_server)
+        self._seat: Optional[Callable[..., Awaitable[Any]]] = None
+        self._unseat: Optional[Callable[..., Awaitable[Any]]] = None
+        self._act: Optional[Callable[..., Awaitable[Any]]] = None
+        self._tables: Dict[Any, Dict[str, Any]] = {}
+        self._connections: Dict[Any, List[Any]] = {}
+
+        self.decisions = 0
+        self.batches = 0
+        self.timeouts = 0
+        self._latency_total = 0.0
+
+    @classmethod
+    def from_env(cls) -> "VirtualPlayerManager":
+        """إنشاء مدير اللاعبين الوهميين من متغيرات البيئة"""
+        return cls(
+            workers=int(os.environ.get("VIRTUAL_PLAYER_WORKERS", 2)),
+            batch_window=int(os.environ.get("VIRTUAL_PLAYER_BATCH_MS", 10)) / 1000,
+            max_batch=int(os.environ.get("VIRTUAL_PLAYER_MAX_BATCH", 64)),
+            decision_timeout=int(os.environ.get("VIRTUAL_PLAYER_DECISION_MS", 250)) / 1000,
+            think_min=int(os.environ.get("VIRTUAL_PLAYER_THINK_MIN_MS", 600)) / 1000,
+            think_max=int(os.environ.get("VIRTUAL_PLAYER_THINK_MAX_MS", 2000)) / 1000,
+            max_bots=int(os.environ.get("VIRTUAL_PLAYER_MAX_BOTS", 2000)),
+        )
+
+    def bind_table_api(
+        self,
+        seat: Callable[..., Awaitable[Any]],
+        unseat: Callable[..., Awaitable[Any]],
+        act: Callable[..., Awaitable[Any]],
+        tables: Dict[Any, Dict[str, Any]],
+        connections: Dict[Any, List[Any]],
+    ):
+        """ربط دوال الطاولة المشتركة مع اتصالات WebSocket"""
+        self._seat = seat
+        self._unseat = unseat
+        self._act = act
+        self._tables = tables
+        self._connections = connections
+
+    def start(self):
+        """إنشاء عمليات العمال (تبدأ فعلياً عند أول قرار)"""
+        if self._pool is None:
+            # spawn بدلاً من fork لأن العملية الرئيسية تستخدم خيوطاً (asyncio.to_thread)
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+            )
+
+    async def close(self):
+        """إيقاف الأدوار وانتظار خروج عمليات العمال (دون انتظار القرارات التي لم تبدأ)"""
+        for task in self._turns.values():
+            task.cancel()
+        self._turns.clear()
+        pool, self._pool = self._pool, None
+        if pool is not None:
+            await asyncio.to_thread(pool.shutdown, wait=True, cancel_futures=True)
+
+    def adopt(self, tables: Dict[Any, Dict[str, Any]]):
+        """إعادة تسجيل اللاعبين الوهميين الموجودين في طاولات مستعادة من لقطة"""
+        for table_id, table in tables.items():
+            for player_id, info in table.get("players", {}).items():
+                if info.get("isBot") and player_id not in self._bots:
+                    self._bots[player_id] = _Bot(player_id, table_id, info.get("level", "intermediate"), info)
+
+    def forget(self, table_id: Any):
+        """إزالة لاعبي طاولة نُقلت لعملية أخرى دون إقامتهم منها"""
+        task = self._turns.pop(table_id, None)
+        if task:
+            task.cancel()
+        for bot_id in self.bots_at(table_id):
+            del self._bots[bot_id]
+        self._bets.pop(table_id, None)
+
+    def bots_at(self, table_id: Any) -> List[str]:
+        return [bot.bot_id for bot in self._bots.values() if bot.table_id == table_id]
+
+    def is_bot(self, player_id: Any) -> bool:
+        return player_id in self._bots
+
+    async def add_bots(self, table_id: Any, count: int = 1, level: str = "intermediate",
+                       chips: int = 5000) -> List[str]:
+        """إجلاس لاعبين وهميين على طاولة عبر دالة الجلوس المشتركة (بحد أقصى المقاعد الفارغة)"""
+        if level not in LEVELS:
+            raise ValueError(f"مستوى غير معروف: {level}")
+        if count < 1:
+            raise ValueError("عدد اللاعبين الوهميين غير صالح")
+
+        table = self._tables.get(table_id, {})
+        max_players = table.get("game_state", {}).get("max_players", DEFAULT_MAX_PLAYERS)
+        open_seats = max_players - len(table.get("players", {}))
+        if open_seats <= 0:
+            raise ValueError("لا توجد مقاعد فارغة في الطاولة")
+        count = min(count, open_seats)
+        if len(self._bots) + count > self.max_bots:
+            raise ValueError(f"تم بلوغ الحد الأقصى للاعبين الوهميين ({self.max_bots})")
+
+        added = []
+        for _ in range(count):
+            bot_id = f"bot-{uuid.uuid4().hex[:12]}"
+            info = {
+                "playerId": bot_id,
+                "username": random.choice(BOT_NAMES),
+                "avatar": random.choice(AVATARS),
+                "chips": chips,
+                "isBot": True,
+                "level": level,
+            }
+            self._bots[bot_id] = _Bot(bot_id, table_id, level, info)
+            await self._seat(table_id, bot_id, info)
+            added.append(bot_id)
+
+        logger.info(f"تم إجلاس {len(added)} لاعب وهمي في طاولة البوكر {table_id}")
+        self._schedule_next(table_id, None)
+        return added
+
+    async def remove_bots(self, table_id: Any) -> int:
+        """إقامة جميع اللاعبين الوهميين من طاولة"""
+        task = self._turns.pop(table_id, None)
+        if task:
+            task.cancel()
+        removed = 0
+        for bot_id in self.bots_at(table_id):
+            del self._bots[bot_id]
+            await self._unseat(table_id, bot_id)
+            removed += 1
+        self._bets.pop(table_id, None)
+        return removed
+
+    def on_action(self, table_id: Any, player_id: Any, action: Optional[str] = None, amount: int = 0):
+        """تسجيل إجراء في الطاولة وجدولة دور اللاعب الوهمي التالي إن وجد"""
+        table = self._tables.get(table_id)
+        if table is None:
+            return
+        game_state = table.get("game_state", {})
+        round_key = (game_state.get("hand_number", 0), game_state.get("phase"))
+        current = self._bets.get(table_id)
+        if current is None or current[0] != round_key:
+            current = (round_key, 0, set())
+        _, to_call, acted = current
+
+        if action in ("bet", "raise", "all_in") and int(amount or 0) > to_call:
+            to_call = int(amount)
+            acted = set()
+        if player_id is not None:
+            acted.add(player_id)
+        # اكتملت جولة المراهنة عندما يتصرف كل الجالسين منذ آخر رفع، فتبدأ الجولة التالية من الصفر
+        if acted and acted >= set(table.get("players", {})):
+            to_call, acted = 0, set()
+        self._bets[table_id] = (round_key, to_call, acted)
+        self._schedule_next(table_id, player_id)
+
+    def _schedule_next(self, table_id: Any, after_player: Any):
+        """جدولة دور اللاعب التالي إذا كان لاعباً وهمياً"""
+        table = self._tables.get(table_id)
+        # لا داعي للعب في طاولة لا يتابعها أي اتصال
+        if table is None or not self._connections.get(table_id):
+            return
+
+        next_player = table.get("game_state", {}).get("current_player")
+        if next_player is None or next_player == after_player:
+            seats = list(table.get("players", {}))
+            if not seats:
+                return
+            if after_player in seats:
+                next_player = seats[(seats.index(after_player) + 1) % len(seats)]
+            else:
+                next_player = seats[0]
+
+        if next_player not in self._bots:
+            return
+        existing = self._turns.get(table_id)
+        if existing and not existing.done():
+            existing.cancel()
+        self._turns[table_id] = asyncio.create_task(self._take_turn(table_id, next_player))
+
+    @staticmethod
+    def _hole_cards(bot: _Bot, table: Dict[str, Any]) -> List[Any]:
+        """بطاقات اللاعب الوهمي الموزعة له في الجزء الخاص من مقعده
+
+        قبل توزيع أول يد تكون القائمة فارغة فيُستخدم القرار الاحتياطي (تمرير أو انسحاب).
+        """
+        return table.get("private", {}).get(bot.bot_id, {}).get("hole_cards", [])
+
+    async def _take_turn(self, table_id: Any, bot_id: str):
+        """انتظار زمن التفكير ثم اتخاذ القرار وتنفيذه عبر دالة الإجراء المشتركة"""
+        try:
+            await asyncio.sleep(random.uniform(self.think_min, self.think_max))
+            bot = self._bots.get(bot_id)
+            table = self._tables.get(table_id)
+            if bot is None or table is None or bot_id not in table.get("players", {}):
+                return
+
+            game_state = table.get("game_state", {})
+            current = self._bets.get(table_id)
+            to_call = current[1] if current else 0
+            request = {
+                "bot_id": bot_id,
+                "level": bot.level,
+                "hole_cards": self._hole_cards(bot, table),
+                "board": game_state.get("community_cards", []),
+                "opponents": max(len(table.get("players", {})) - 1, 1),
+                "pot": game_state.get("pot", 0),
+                "to_call": to_call,
+                "min_raise": game_state.get("min_bet", 20),
+                "chips": bot.info.get("chips", 0),
+                "seed": random.getrandbits(32),
+            }
+            decision = await self.decide(request)
+
+            if bot_id in self._bots and bot_id in table.get("players", {}):
+                await self._act(table_id, bot_id, decision["action"], decision["amount"])
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            logger.error(f"خطأ في دور اللاعب الوهمي {bot_id}: {str(e)}")
+        finally:
+            if self._turns.get(table_id) is asyncio.current_task():
+                del self._turns[table_id]
+
+    async def decide(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        """إضافة طلب قرار إلى الدفعة القادمة وانتظار نتيجته"""
+        if self._pool is None or self._wakeup is None:
+            return fallback_decision(request)
+        request["deadline"] = time.time() + self.decision_timeout
+        future = asyncio.get_running_loop().create_future()
+        self._queue.append((request, future))
+        self._wakeup.set()
+        return await future
+
+    async def _dispatch(self, batch: List[Tuple[Dict[str, Any], asyncio.Future]]):
+        """إرسال دفعة واحدة لعملية عمال مع مهلة، والرجوع للقرار الاحتياطي عند التأخر"""
+        requests = [request for request, _ in batch]
+        started = time.perf_counter()
+        # مهلة الانتظار: أبعد مهلة في الدفعة مع هامش صغير لنقل النتائج بين العمليات
+        timeout = max(request["deadline"] for request in requests) - time.time() + 0.05
+        try:
+            results = await asyncio.wait_for(
+                asyncio.get_running_loop().run_in_executor(self._pool, decide_batch, requests),
+                timeout=max(timeout, 0.01),
+            )
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            logger.warning(f"تجاوزت دفعة من {len(requests)} قرار المهلة، استخدام القرارات الاحتياطية")
+            results = [fallback_decision(request) for request in requests]
+        except Exception as e:
+            logger.error(f"خطأ في عمليات قرارات اللاعبين الوهميين: {str(e)}")
+            results = [fallback_decision(request) for request in requests]
+
+        self.batches += 1
+        self.decisions += len(results)
+        self._latency_total += time.perf_counter() - started
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+    async def run(self):
+        """حلقة تجميع طلبات القرارات في دفعات وتوزيعها على عمليات العمال"""
+        self.start()
+        self._wakeup = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        # تشغيل عمليات العمال مسبقاً حتى لا يتأخر أول قرار
+        for _ in range(self.workers):
+            loop.run_in_executor(self._pool, _warm_up)
+
+        while True:
+            await self._wakeup.wait()
+            await asyncio.sleep(self.batch_window)
+            self._wakeup.clear()
+
+            pending, self._queue = self._queue, []
+            # توزيع الطلبات بالتساوي على العمال، بحد أقصى max_batch لكل دفعة
+            chunk_size = min(self.max_batch, max(1, -(-len(pending) // self.workers)))
+            for i in range(0, len(pending), chunk_size):
+                asyncio.create_task(self._dispatch(pending[i:i + chunk_size]))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "bots": len(self._bots),
+            "tables": len({bot.table_id for bot in self._bots.values()}),
+            "workers": self.workers,
+            "pending": len(self._queue),
+            "decisions": self.decisions,
+            "batches": self.batches,
+            "timeouts": self.timeouts,
+            "avg_batch_size": round(self.decisions / self.batches, 2) if self.batches else 0,
+            "avg_batch_latency_ms": round(self._latency_total / self.batches * 1000, 2) if self.batches else 0,
+        }